@@ -1,18 +1,22 @@
 import os
 import base64
-import sqlite3
-from dotenv import load_dotenv
 import streamlit as st
-from datetime import datetime
-import matplotlib.pyplot as plt
+from datetime import datetime, timedelta
 from streamlit import components
-from supabase import create_client, Client
-
-# Load environment variables and initialize Supabase client
-load_dotenv('.env')  # load local .env
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase_client: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+from media_server import MediaServer
+from renditions import LOW, RenditionCache, transcoding_available
+from results_chart import tally_digest, render_pie_chart
+from duration_index import DurationIndex
+from library_index import LibraryIndex
+from loudness import LoudnessIndex
+from lyrics import LyricsService
+from search_index import SearchIndex, fetch_in_pages
+from db_pool import ConnectionPool
+from query_cache import QueryCache
+from startup import load_environment, ensure_directories, create_supabase_client
+
+# Load environment variables once per process; the Supabase client is created on first use
+load_environment('.env')  # load local .env
 
 # Set page configuration
 st.set_page_config(
@@ -26,9 +30,27 @@ st.set_page_config(
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MP3_DIR = os.path.join(BASE_DIR, "mp3_files")
 PICTURES_DIR = os.path.join(BASE_DIR, "pictures")
-os.makedirs(MP3_DIR, exist_ok=True)
-os.makedirs(PICTURES_DIR, exist_ok=True)
-os.makedirs(os.path.join(PICTURES_DIR, "sheet_music"), exist_ok=True)
+ensure_directories(MP3_DIR, PICTURES_DIR, os.path.join(PICTURES_DIR, "sheet_music"))
+
+# Local media server that streams mp3_files/ to the browser
+MEDIA_SERVER_HOST = os.environ.get('MEDIA_SERVER_HOST', '0.0.0.0')
+MEDIA_SERVER_PORT = int(os.environ.get('MEDIA_SERVER_PORT', 8502))
+MEDIA_SERVER_URL = os.environ.get('MEDIA_SERVER_URL')  # Public (ideally https) URL when behind a proxy
+TRANSCODE_WORKERS = int(os.environ.get('TRANSCODE_WORKERS', 2))  # ffmpeg processes for low-bandwidth renditions
+
+# Probed track durations, cached on disk by path and mtime
+CACHE_DIR = os.path.join(BASE_DIR, "cache")
+DURATION_INDEX_PATH = os.path.join(CACHE_DIR, "duration_index.json")
+LIBRARY_INDEX_PATH = os.path.join(CACHE_DIR, "library_index.json")
+LOUDNESS_INDEX_PATH = os.path.join(CACHE_DIR, "loudness_index.json")
+PEAKS_DIR = os.path.join(CACHE_DIR, "peaks")
+RENDITIONS_DIR = os.path.join(CACHE_DIR, "renditions")
+SEARCH_INDEX_PATH = os.path.join(CACHE_DIR, "search_index.db")
+DEFAULT_SONG_DURATION = 180  # Fallback when a file's duration cannot be probed
+
+# Per-process cache for Supabase reads; writes invalidate the affected song
+QUERY_CACHE_TTL = int(os.environ.get('QUERY_CACHE_TTL', 60))  # Seconds
+QUERY_CACHE_SIZE = 256
 
 # Define available instruments
 AVAILABLE_INSTRUMENTS = [
@@ -40,39 +62,107 @@ AVAILABLE_INSTRUMENTS = [
     "Saxophone"
 ]
 
+@st.cache_resource
+def get_supabase_client():
+    """Create the Supabase client on first use and share it across sessions."""
+    return create_supabase_client('.env')
+
 # --- Label Management Helper Functions ---
+@st.cache_resource
+def get_query_cache():
+    """Create the read-through cache for Supabase queries once per process."""
+    return QueryCache(max_entries=QUERY_CACHE_SIZE, ttl=QUERY_CACHE_TTL)
+
+def invalidate_song_cache(table, song_name):
+    """Forget cached reads of a table for a song after writing to it."""
+    get_query_cache().invalidate(table, song_name)
+    if table == 'labels':
+        # Cached notes embed their label names
+        get_query_cache().invalidate('notes', song_name)
+    get_search_index().expire('label' if table == 'labels' else 'note')
+
 def get_labels_for_song_instrument(song_name, instrument):
     """Return a list of (label, creator_username) for a given song/instrument."""
-    res = supabase_client.table('labels')\
-        .select('name, owner_id')\
-        .eq('song_title', song_name)\
-        .eq('instrument', instrument)\
-        .execute()
-    return [(r['name'], r['owner_id']) for r in res.data] if res.data else []
+    def load():
+        res = get_supabase_client().table('labels')\
+            .select('name, owner_id')\
+            .eq('song_title', song_name)\
+            .eq('instrument', instrument)\
+            .execute()
+        return [(r['name'], r['owner_id']) for r in res.data] if res.data else []
+    return get_query_cache().get_or_load(('labels', song_name, 'by_instrument', instrument), load)
+
+def get_song_labels(song_name):
+    """Return a list of (label, creator_username) for every label of a song."""
+    def load():
+        res = get_supabase_client().table('labels')\
+            .select('name, owner_id')\
+            .eq('song_title', song_name)\
+            .execute()
+        return [(r['name'], r['owner_id']) for r in res.data] if res.data else []
+    return get_query_cache().get_or_load(('labels', song_name, 'all'), load)
+
+def get_label_file_path(song_name, label):
+    """Return the sheet music file path stored for a song's label, or None."""
+    def load():
+        res = get_supabase_client().table('labels')\
+            .select('file_path')\
+            .eq('song_title', song_name)\
+            .eq('name', label)\
+            .execute()
+        return res.data[0]['file_path'] if res.data else None
+    return get_query_cache().get_or_load(('labels', song_name, 'file_path', label), load)
 
 def add_label(song_name, instrument, label, creator_username):
     """Add a new label for a song/instrument."""
-    supabase_client.table('labels')\
+    get_supabase_client().table('labels')\
         .insert({'song_title': song_name, 'instrument': instrument, 'name': label, 'owner_id': creator_username})\
         .execute()
+    invalidate_song_cache('labels', song_name)
 
 def delete_label(song_name, instrument, label):
     """Delete a label for a song/instrument."""
-    supabase_client.table('labels')\
+    get_supabase_client().table('labels')\
         .delete()\
         .eq('song_title', song_name)\
         .eq('instrument', instrument)\
         .eq('name', label)\
         .execute()
+    invalidate_song_cache('labels', song_name)
+
+def get_song_notes(song_name):
+    """Return a song's notes as (owner_id, label_id, content, created_at) plus a {label_id: name} map.
+
+    Label names are embedded through the label_id foreign key, so this is a
+    single round trip.
+    """
+    def load():
+        res = get_supabase_client().table('notes')\
+            .select('owner_id, label_id, content, created_at, label:label_id(name)')\
+            .eq('song_title', song_name)\
+            .execute()
+        notes = [(r['owner_id'], r['label_id'], r['content'], r['created_at']) for r in res.data]
+        label_names = {r['label_id']: r['label']['name'] for r in res.data if r['label_id'] and r.get('label')}
+        return notes, label_names
+    return get_query_cache().get_or_load(('notes', song_name, 'all'), load)
 
 def get_label_notes(song_name, instrument, label):
     """Return all notes for a song/instrument/label as a list of (username, notes, last_updated)."""
-    res = supabase_client.table('notes')\
-        .select('owner_id, content, created_at')\
-        .eq('song_title', song_name)\
-        .eq('label', label)\
+    def load():
+        res = get_supabase_client().table('notes')\
+            .select('owner_id, content, created_at')\
+            .eq('song_title', song_name)\
+            .eq('label', label)\
+            .execute()
+        return [(r['owner_id'], r['content'], r['created_at']) for r in res.data] if res.data else []
+    return get_query_cache().get_or_load(('notes', song_name, 'by_label', label), load)
+
+def add_note(song_name, label_id, content, owner_id):
+    """Save a new note for a song."""
+    get_supabase_client().table('notes')\
+        .insert({'song_title': song_name, 'label_id': label_id, 'content': content, 'owner_id': owner_id})\
         .execute()
-    return [(r['owner_id'], r['content'], r['created_at']) for r in res.data] if res.data else []
+    invalidate_song_cache('notes', song_name)
 
 # Initialize session state
 defaults = {
@@ -80,10 +170,12 @@ defaults = {
     'history': [],
     'current_song': None,
     'current_lyrics': None,
+    'current_media_file': None,  # Path of the playing MP3, used to look up its synchronized lyrics
     'play_time': None,
     'song_notes': {},
     'audio_playing': False,
-    'audio_data': None,
+    'audio_url': None,  # Streaming URL of the current song on the media server
+    'audio_waveform': None,  # Scrubber HTML drawn from the current song's precomputed peaks
     'current_playback_time': 0,
     'autoplay': False,
     'replay': False,
@@ -95,7 +187,7 @@ defaults = {
     'last_check_time': datetime.now(),  # For the 20-second timer loop
     'check_interval': 10,  # Check interval in seconds (reduced for more responsive autoplay)
     'song_start_timestamp': None,  # Full timestamp when song started
-    'estimated_song_duration': 180,  # Default estimated song duration in seconds (3 minutes)
+    'estimated_song_duration': DEFAULT_SONG_DURATION,  # Duration of the current song in seconds
     'force_next_song': False,  # Flag to force playing the next song
     'logged_in': False,  # User login status
     'username': None,  # Current logged in username
@@ -107,43 +199,192 @@ for key, value in defaults.items():
     if key not in st.session_state:
         st.session_state[key] = value
 
-def encode_audio_to_base64(file_path):
-    """Encode audio to base64."""
-    with open(file_path, "rb") as audio_file:
-        return base64.b64encode(audio_file.read()).decode('utf-8')
+@st.cache_resource
+def get_rendition_cache():
+    """Create the transcoded-variant cache once per process; None without pydub and ffmpeg."""
+    if TRANSCODE_WORKERS <= 0 or not transcoding_available():
+        return None
+    return RenditionCache(RENDITIONS_DIR, workers=TRANSCODE_WORKERS)
+
+@st.cache_resource
+def get_media_server():
+    """Start the local media server once per process and share it across sessions."""
+    return MediaServer(
+        MP3_DIR,
+        host=MEDIA_SERVER_HOST,
+        port=MEDIA_SERVER_PORT,
+        public_url=MEDIA_SERVER_URL,
+        renditions=get_rendition_cache()
+    ).start()
+
+def get_request_origin():
+    """Return (host, is_https) of the browser's request for this page, as far as Streamlit exposes it."""
+    headers = getattr(getattr(st, "context", None), "headers", None) or {}
+    host = headers.get("X-Forwarded-Host") or headers.get("Host")
+    is_https = headers.get("X-Forwarded-Proto", "").split(",")[0].strip().lower() == "https"
+    return host, is_https
+
+def get_audio_url(file_path):
+    """Return the URL the browser should play the given MP3 file from.
+
+    Normally a media server URL on the host the viewer used to reach the app,
+    asking for the low-bitrate rendition when data saver is on.
+    An https page cannot load audio from the plain-http media server, so
+    without a MEDIA_SERVER_URL it falls back to embedding the file.
+    """
+    host, is_https = get_request_origin()
+    if is_https and not MEDIA_SERVER_URL:
+        with open(file_path, "rb") as audio_file:
+            return "data:audio/mpeg;base64," + base64.b64encode(audio_file.read()).decode('utf-8')
+    rendition = LOW if st.session_state.get('data_saver') else None
+    return get_media_server().url_for(os.path.relpath(file_path, MP3_DIR), rendition=rendition, request_host=host)
+
+@st.cache_resource
+def get_duration_index():
+    """Load the duration index once per process, probing any new or changed MP3s."""
+    index = DurationIndex(DURATION_INDEX_PATH)
+    index.refresh(MP3_DIR)
+    return index
+
+def get_song_duration(file_path):
+    """Return the real duration of an MP3 file in seconds."""
+    return get_duration_index().get_duration(file_path) or DEFAULT_SONG_DURATION
+
+@st.cache_resource
+def get_loudness_index():
+    """Load the per-track loudness gains once per process."""
+    return LoudnessIndex(LOUDNESS_INDEX_PATH)
+
+@st.cache_resource
+def get_peaks_store():
+    """Open the waveform peaks cache once per process; None when numpy is not installed."""
+    try:
+        from waveform_peaks import PeaksStore
+    except ImportError:
+        return None
+    return PeaksStore(PEAKS_DIR)
+
+def get_waveform_html(file_path):
+    """Return the waveform scrubber for a song, or an empty string until its peaks are built."""
+    store = get_peaks_store()
+    peaks = store.get(file_path) if store else None
+    if peaks is None or not peaks.duration:
+        return ""
+    from waveform_peaks import scrubber_html
+    return scrubber_html(peaks)
+
+@st.cache_resource
+def get_library_index():
+    """Build the song catalog once per process; later reruns only re-stat MP3_DIR."""
+    return LibraryIndex(
+        MP3_DIR, LIBRARY_INDEX_PATH, include_subfolders=False,
+        duration_index=get_duration_index(), loudness_index=get_loudness_index()
+    )
 
 def play_audio(file_path, song_name):
     """Play an audio file. Ensures play button is always responsive."""
     # Always reset audio state for new playback
     st.session_state.audio_playing = False
     st.session_state.current_song = None
-    st.session_state.audio_data = None
+    st.session_state.audio_url = None
     # DO NOT reset or modify st.session_state.queue here!
     # Now set new state
-    st.session_state.audio_data = encode_audio_to_base64(file_path)
+    st.session_state.audio_url = get_audio_url(file_path)
+    st.session_state.audio_volume = get_loudness_index().volume_scale(file_path)  # Level tracks to the same loudness
+    st.session_state.audio_waveform = get_waveform_html(file_path)
     st.session_state.audio_playing = True
     st.session_state.current_song = song_name
     st.session_state.play_time = datetime.now().strftime("%H:%M:%S")
     st.session_state.song_start_timestamp = datetime.now()  # Store full timestamp
     st.session_state.current_playback_time = 0
+    st.session_state.estimated_song_duration = get_song_duration(file_path)
     st.session_state.current_lyrics = load_lyrics(file_path)
+    st.session_state.current_media_file = file_path
     st.session_state.song_ended = False  # Reset song ended flag when starting a new song
     st.session_state.force_next_song = False  # Reset force next flag when starting a new song
     # Debug information for song playback
     print(f"Started playing: {song_name} at {st.session_state.play_time}")
-    print(f"Estimated duration: {st.session_state.estimated_song_duration} seconds")
+    print(f"Duration: {st.session_state.estimated_song_duration} seconds")
     if song_name not in st.session_state.history:
         st.session_state.history.append(song_name)
         st.session_state.history = st.session_state.history[-10:]
 
+@st.cache_resource(max_entries=1, show_spinner=False)
+def start_loudness_measurement(media_files):
+    """Queue loudness measurement once per process and library state, not on every rerun."""
+    get_loudness_index().measure_in_background(
+        media_files, on_done=lambda count: get_library_index().apply_gains()
+    )
+    return True
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def start_peaks_generation(media_files):
+    """Queue waveform peaks generation once per process and library state, not on every rerun."""
+    if get_peaks_store():
+        get_peaks_store().generate_in_background(media_files)
+    return True
+
 def load_content():
     """Load songs from directories."""
-    return sorted(f for f in os.listdir(MP3_DIR) if f.endswith('.mp3'))
+    songs = get_library_index().refresh()
+    media_files = tuple(song["media_file"] for song in songs)
+    # Measure new tracks in the background; they play unlevelled until then
+    start_loudness_measurement(media_files)
+    # Waveform peaks are built the same way; songs without them show no scrubber
+    start_peaks_generation(media_files)
+    return [os.path.basename(song["media_file"]) for song in songs]
+
+@st.cache_resource
+def get_search_index():
+    """Create the local full-text search index once per process."""
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    return SearchIndex(ConnectionPool(SEARCH_INDEX_PATH))
+
+def fetch_supabase_rows(table, columns):
+    """Fetch every row of a Supabase table, a page at a time past the API's row cap."""
+    return fetch_in_pages(
+        lambda first, last: get_supabase_client().table(table).select(columns).order('id').range(first, last).execute().data
+    )
+
+def load_label_documents():
+    """Fetch every label from Supabase as (id, song, text) search documents."""
+    return [(r['id'], r['song_title'], r['name']) for r in fetch_supabase_rows('labels', 'id, song_title, name')]
+
+def load_note_documents():
+    """Fetch every note from Supabase as (id, song, text) search documents."""
+    return [(r['id'], r['song_title'], r['content']) for r in fetch_supabase_rows('notes', 'id, song_title, content')]
+
+def search_library(query):
+    """Rank songs whose title, lyrics, labels or notes match the query."""
+    index = get_search_index()
+    index.sync_songs((os.path.basename(song["media_file"]), song["text_file"]) for song in get_library_index().refresh())
+    # Labels and notes live in Supabase; mirror them at most once per refresh interval
+    index.sync_documents('label', load_label_documents)
+    index.sync_documents('note', load_note_documents)
+    return index.search(query)
+
+@st.cache_resource
+def get_lyrics_service():
+    """Share one lyrics cache across sessions; files are only re-read when they change."""
+    return LyricsService()
 
 def load_lyrics(file_path):
-    """Load lyrics from a corresponding text file."""
-    text_file_path = os.path.splitext(file_path)[0] + '.txt'
-    return open(text_file_path).read() if os.path.exists(text_file_path) else "No lyrics available."
+    """Load lyrics from the song's .lrc or .txt file (timestamps are stripped)."""
+    lyrics = get_lyrics_service().for_media(file_path)
+    return lyrics.text if lyrics else "No lyrics available."
+
+def current_lyrics_markdown():
+    """Return the playing song's lyrics with the line at the estimated position in bold (LRC files only)."""
+    media_file = st.session_state.current_media_file
+    lyrics = get_lyrics_service().for_media(media_file) if media_file else None
+    if lyrics is None or not lyrics.synced or not st.session_state.song_start_timestamp:
+        return st.session_state.current_lyrics
+    elapsed = (datetime.now() - st.session_state.song_start_timestamp).total_seconds()
+    current = lyrics.line_at(elapsed)
+    return "  \n".join(
+        f"**{line}**" if index == current and line else line
+        for index, line in enumerate(lyrics.lines)
+    )
 
 def add_to_queue(song_name):
     """Add a song to the queue dynamically without full page refresh, preserving order and uniqueness."""
@@ -210,11 +451,10 @@ def display_mp3_player():
         if st.session_state.audio_playing and st.session_state.current_song and st.session_state.song_start_timestamp:
             song_play_duration = (current_time - st.session_state.song_start_timestamp).total_seconds()
             print(f"Interval check: Song {st.session_state.current_song} has been playing for {song_play_duration:.1f} seconds")
-            
-            # If song has been playing for a while, consider forcing next song
-            if song_play_duration >= st.session_state.estimated_song_duration - 10:  # 10 seconds before estimated end
-                st.session_state.force_next_song = True
-                print("Forcing next song flag set to True")
+
+            # The duration is exact, so only advance once the song has really finished
+            if song_play_duration >= st.session_state.estimated_song_duration:
+                st.session_state.song_ended = True
     
     # If song ended or force_next_song flag is set, handle next steps
     if st.session_state.song_ended or st.session_state.force_next_song:
@@ -250,6 +490,9 @@ def display_mp3_player():
 
     with st.sidebar:
         st.title("Gospel JukeBox ")
+        if get_rendition_cache() is not None:
+            st.checkbox("Data saver", key='data_saver',
+                        help="Stream lower-bitrate audio, starting with the next song.")
 
         # Display Currently Playing Song
         if st.session_state.audio_playing and st.session_state.current_song:
@@ -264,15 +507,19 @@ def display_mp3_player():
                     if st.button("Hide Lyrics" if show_lyrics else "Show Lyrics", key="show_lyrics_btn"):
                         st.session_state['show_lyrics_in_sidebar'] = not show_lyrics
 
-            # Use HTML5 audio element with autoplay, controls, and ended event listener
+            # Use HTML5 audio element with autoplay, controls, and ended event listener.
+            # The source is streamed from the media server so the browser can seek with Range requests.
+            # It may answer with a lower-bitrate rendition for slow clients, so the source has no fixed type.
             audio_html = """
-            <audio id="audio-player" autoplay controls>
-                <source src="data:audio/mpeg;base64,{0}" type="audio/mpeg">
+            <audio id="audio-player" autoplay controls preload="auto">
+                <source src="{0}">
                 Your browser does not support the audio element.
             </audio>
+            {2}
             <script>
                 // Ensure autoplay works
                 const audioPlayer = document.getElementById('audio-player');
+                audioPlayer.volume = {1};  // Loudness normalization gain
                 audioPlayer.play();
                 
                 // Add ended event listener to detect when song actually ends
@@ -288,13 +535,17 @@ def display_mp3_player():
                     window.parent.postMessage({{type: 'streamlit:forceRerun'}}, '*');
                 }});
             </script>
-            """.format(st.session_state.audio_data)
-            st.components.v1.html(audio_html, height=80)
+            """.format(
+                st.session_state.audio_url,
+                st.session_state.get('audio_volume', 1.0),
+                st.session_state.get('audio_waveform') or ""
+            )
+            st.components.v1.html(audio_html, height=140 if st.session_state.get('audio_waveform') else 80)
 
             # Display lyrics in sidebar if requested
             if st.session_state.get('show_lyrics_in_sidebar') and st.session_state.get('current_lyrics'):
                 st.markdown(f"**Lyrics for {st.session_state.current_song.replace('.mp3','')}**")
-                st.markdown(st.session_state.current_lyrics)
+                st.markdown(current_lyrics_markdown())
 
 
         # Navigation Buttons
@@ -505,36 +756,16 @@ def display_music_library():
     mp3_files = load_content()
 
     # Add search functionality
-    search_query = st.text_input("Search songs by title, sheet music label, or note label", "")
+    search_query = st.text_input("Search songs by title, lyrics, sheet music label, or note label", "")
     
     # Filter songs based on search query
     if search_query:
-        # First search by song title
-        filtered_songs = [song for song in mp3_files if search_query.lower() in song.lower()]
-        
-        # Always search by label in the database, regardless of whether we found matches by title
-        res = supabase_client.table('labels')\
-            .select('song_title')\
-            .ilike('name', f'%{search_query}%')\
-            .execute()
-        label_matches = [r['song_title'] for r in res.data if r['song_title'] in mp3_files]
-        
-        # Also search by note label_id (join with labels table)
-        label_id_res = supabase_client.table('labels')\
-            .select('id, song_title')\
-            .ilike('name', f'%{search_query}%')\
-            .execute()
-        matching_label_ids = [r['id'] for r in label_id_res.data]
-        note_matches = []
-        if matching_label_ids:
-            note_res = supabase_client.table('notes')\
-                .select('song_title, label_id')\
-                .in_('label_id', matching_label_ids)\
-                .execute()
-            note_matches = [r['song_title'] for r in note_res.data if r['song_title'] in mp3_files]
-        
-        # Combine results from both searches and remove duplicates
-        filtered_songs = list(set(filtered_songs + label_matches + note_matches))
+        # One ranked full-text query over titles, lyrics, labels and notes
+        available_songs = set(mp3_files)
+        results = [(song, kinds) for song, kinds in search_library(search_query) if song in available_songs]
+        filtered_songs = [song for song, _ in results]
+        label_matches = [song for song, kinds in results if 'label' in kinds]
+        note_matches = [song for song, kinds in results if 'note' in kinds]
         
         # Display which songs were found by label if any were found this way
         if label_matches and not any(search_query.lower() in song.lower() for song in label_matches):
@@ -546,7 +777,7 @@ def display_music_library():
         filtered_songs = mp3_files
     
     if not filtered_songs and search_query:
-        st.warning(f"No songs found matching '{search_query}' in titles or labels")
+        st.warning(f"No songs found matching '{search_query}' in titles, lyrics, labels or notes")
         # Keep filtered_songs empty to show the warning, but still allow selection from all songs
         filtered_songs = mp3_files  # Show all songs if no matches
     
@@ -696,21 +927,9 @@ def display_music_library():
                 is_admin = st.session_state.get('is_admin', False)
 
                 # --- Display All Existing Notes --- 
-                res = supabase_client.table('notes')\
-                    .select('owner_id, label_id, content, created_at')\
-                    .eq('song_title', current_song_name)\
-                    .execute()
-                all_notes = [(r['owner_id'], r['label_id'], r['content'], r['created_at']) for r in res.data]
-                
-                # Fetch label names for all label_ids present in notes
+                # Notes and their label names arrive in one embedded select
+                all_notes, label_id_to_name = get_song_notes(current_song_name)
                 label_ids_in_notes = sorted({lbl for _, lbl, _, _ in all_notes if lbl})
-                label_id_to_name = {}
-                if label_ids_in_notes:
-                    label_res = supabase_client.table('labels')\
-                        .select('id, name')\
-                        .in_('id', label_ids_in_notes)\
-                        .execute()
-                    label_id_to_name = {r['id']: r['name'] for r in label_res.data}
                 unique_labels = [label_id_to_name.get(lid, str(lid)) for lid in label_ids_in_notes]
                 # Map label_id to label name for display
                 def label_display(lid):
@@ -759,9 +978,7 @@ def display_music_library():
                             st.warning("Both Label and Content are required to save a new note.")
                         else:
                             filtered_notes = all_notes
-                            supabase_client.table('notes')\
-                                .insert({'song_title': current_song_name, 'label_id': selected_label_id, 'content': new_note_content, 'owner_id': current_username})\
-                                .execute()
+                            add_note(current_song_name, selected_label_id, new_note_content, current_username)
                             st.success(f"New note saved!")
                             try:
                                 st.rerun() # Refresh to show the new note in the dropdown
@@ -781,10 +998,7 @@ def display_music_library():
                             # Make sure unique_labels is defined in this code path
                             if 'unique_labels' not in locals():
                                 # Fetch labels if not already done
-                                res = supabase_client.table('labels')\
-                                    .select('name')\
-                                    .eq('song_title', current_song_name)\
-                                    .execute()
+                                unique_labels = [name for name, _ in get_song_labels(current_song_name)]
                             # Prevent duplicate label for this song/instrument
                             if new_label.strip() in unique_labels:
                                 st.warning(f"Label '{new_label.strip()}' already exists for this song.")
@@ -792,20 +1006,22 @@ def display_music_library():
                                 # Get current username for creator attribution
                                 creator = st.session_state.get('username', '')
                                 
-                                supabase_client.table('labels')\
+                                get_supabase_client().table('labels')\
                                     .insert({'song_title': current_song_name, 'name': new_label.strip(), 'owner_id': creator})\
                                     .execute()
+                                invalidate_song_cache('labels', current_song_name)
                                 st.success(f"Sheet music type '{new_label.strip()}' added!")
                         else:
                             st.warning("Please enter a label name.")
                 
                 # Remove selected sheet music - moved outside the Add Type button logic
                 if 'selected_label' in locals() and st.button(f"🗑️ Remove '{selected_label}' Sheet Music", key="remove_sheet_music_btn"):
-                    supabase_client.table('labels')\
+                    get_supabase_client().table('labels')\
                         .delete()\
                         .eq('song_title', current_song_name)\
                         .eq('name', selected_label)\
                         .execute()
+                    invalidate_song_cache('labels', current_song_name)
                     st.success(f"Sheet music '{selected_label}' removed!")
                     # Try to rerun, otherwise notify and ask user to refresh manually
                     try:
@@ -839,9 +1055,10 @@ def display_music_library():
                                     # Get current username for creator attribution
                                     creator = st.session_state.get('username', '')
                                     
-                                    supabase_client.table('labels')\
+                                    get_supabase_client().table('labels')\
                                         .insert({'song_title': current_song_name, 'name': label_input.strip(), 'owner_id': creator})\
                                         .execute()
+                                    invalidate_song_cache('labels', current_song_name)
                                     st.success("Sheet music uploaded and saved!")
                                     # Try to rerun, otherwise notify and ask user to refresh manually
                                     try:
@@ -866,11 +1083,7 @@ def display_music_library():
                 )
             with col2:
                 # Fetch sheet music entries with creator information
-                res = supabase_client.table('labels')\
-                    .select('name, owner_id')\
-                    .eq('song_title', st.session_state.current_song)\
-                    .execute()
-                sheet_music_entries = [(r['name'], r['owner_id']) for r in res.data]
+                sheet_music_entries = get_song_labels(st.session_state.current_song)
                 
                 # Initialize unique_labels and label_to_creator
                 unique_labels = []
@@ -909,12 +1122,7 @@ def display_music_library():
             
             # Display sheet music if available
             if selected_label:
-                res = supabase_client.table('labels')\
-                    .select('file_path')\
-                    .eq('song_title', st.session_state.current_song)\
-                    .eq('name', selected_label)\
-                    .execute()
-                file_path = res.data[0]['file_path'] if res.data else None
+                file_path = get_label_file_path(st.session_state.current_song, selected_label)
                 
                 if file_path and os.path.exists(file_path):
                     st.image(file_path, caption=f"{st.session_state.selected_instrument} - {selected_label}", use_column_width=True)
@@ -938,9 +1146,10 @@ def display_music_library():
                             # Get current username for creator attribution
                             creator = st.session_state.get('username', '')
                             
-                            supabase_client.table('labels')\
+                            get_supabase_client().table('labels')\
                                 .insert({'song_title': st.session_state.current_song, 'name': new_label.strip(), 'owner_id': creator})\
                                 .execute()
+                            invalidate_song_cache('labels', st.session_state.current_song)
                             st.success(f"Sheet music type '{new_label.strip()}' added!")
                             # Try to rerun, otherwise notify and ask user to refresh manually
                             try:
@@ -952,11 +1161,12 @@ def display_music_library():
                 
                 # Remove selected sheet music - moved outside the Add Type button logic
                 if 'selected_label' in locals() and st.button(f"🗑️ Remove '{selected_label}' Sheet Music", key="remove_sheet_music_btn"):
-                    supabase_client.table('labels')\
+                    get_supabase_client().table('labels')\
                         .delete()\
                         .eq('song_title', st.session_state.current_song)\
                         .eq('name', selected_label)\
                         .execute()
+                    invalidate_song_cache('labels', st.session_state.current_song)
                     st.success(f"Sheet music '{selected_label}' removed!")
                     # Try to rerun, otherwise notify and ask user to refresh manually
                     try:
@@ -999,9 +1209,10 @@ def display_music_library():
                                     # Get current username for creator attribution
                                     creator = st.session_state.get('username', '')
                                     
-                                    supabase_client.table('labels')\
+                                    get_supabase_client().table('labels')\
                                         .insert({'song_title': current_song_name, 'name': label_input.strip(), 'owner_id': creator})\
                                         .execute()
+                                    invalidate_song_cache('labels', current_song_name)
                                     st.success("Sheet music uploaded and saved!")
                                     # Try to rerun, otherwise notify and ask user to refresh manually
                                     try:
@@ -1032,7 +1243,7 @@ def display_voting_page():
         vote_amount = st.slider("Rate this song (1-100 pennies):", min_value=1, max_value=100)
         if st.button("Submit Vote"):
             # Store the vote in the database
-            supabase_client.table('votes')\
+            get_supabase_client().table('votes')\
                 .insert({'song_title': song_to_vote, 'vote': vote_amount})\
                 .execute()
 
@@ -1042,25 +1253,40 @@ def display_voting_page():
 
             st.success(f"Thank you for your vote! Please confirm your payment of {vote_amount} cents via Cash App.")
 
+@st.cache_data(max_entries=16, show_spinner=False)
+def get_results_chart(tally_hash, _results):
+    """Render the results pie chart once per tally version (keyed by tally_hash)."""
+    return render_pie_chart(_results)
+
 def display_results_page():
     """Display the voting results as a pie chart."""
     st.header("Vote Results")
 
-    # Fetch votes from the database
-    res = supabase_client.table('votes')\
-        .select('song_title, vote')\
+    # Read the trigger-maintained per-song totals (one row per song, however many votes)
+    res = get_supabase_client().table('vote_totals')\
+        .select('song_title, total')\
+        .gt('total', 0)\
+        .order('total', desc=True)\
         .execute()
-    results = [(r['song_title'], r['vote']) for r in res.data]
+    results = [(r['song_title'], r['total']) for r in res.data]
     
     if results:
-        song_names = [row[0] for row in results]
-        votes = [row[1] for row in results]
-
-        # Create a pie chart
-        plt.figure(figsize=(10, 6))
-        plt.pie(votes, labels=song_names, autopct='%1.1f%%', startangle=140)
-        plt.title("Song Voting Results")
-        st.pyplot(plt)
+        # The chart is only re-rendered when the tally changes
+        st.image(get_results_chart(tally_digest(results), results), use_column_width=True)
+
+        # Daily rollup for the last 30 days
+        since = (datetime.utcnow() - timedelta(days=30)).date().isoformat()
+        daily_res = get_supabase_client().table('vote_daily_totals')\
+            .select('day, total')\
+            .gte('day', since)\
+            .order('day')\
+            .execute()
+        daily_totals = {}
+        for r in daily_res.data:
+            daily_totals[r['day']] = daily_totals.get(r['day'], 0) + r['total']
+        if daily_totals:
+            st.subheader("Votes per Day (last 30 days)")
+            st.bar_chart({"Day": list(daily_totals), "Votes": list(daily_totals.values())}, x="Day", y="Votes")
     else:
         st.write("No votes have been cast yet.")
 
@@ -1098,7 +1324,7 @@ def login_page():
         if st.button("Login"):
             if username and password:
                 # Fetch user info from DB
-                res = supabase_client.table('users')\
+                res = get_supabase_client().table('users')\
                     .select('username, password_hash, role')\
                     .eq('username', username)\
                     .execute()
@@ -1126,7 +1352,7 @@ def login_page():
             st.query_params.update({'page': 'main'})
 
     # Only show registration if there are NO users in the database
-    all_users = supabase_client.table('users').select('id').execute()
+    all_users = get_supabase_client().table('users').select('id').execute()
     if not all_users.data:
         with col2:
             st.markdown("### Admin Registration (First User)")
@@ -1140,7 +1366,7 @@ def login_page():
                     st.warning("Passwords do not match.")
                 else:
                     password_hash = bcrypt.hashpw(new_password.encode(), bcrypt.gensalt()).decode()
-                    supabase_client.table('users').insert({
+                    get_supabase_client().table('users').insert({
                         'username': new_username,
                         'password_hash': password_hash,
                         'role': 'admin'
@@ -1202,7 +1428,7 @@ def main():
             new_label = st.sidebar.text_input('User Label (optional)', key='admin_add_label_input_sidebar')
             if st.sidebar.button('Create User', key='admin_create_user_btn_sidebar'):
                 if new_user and new_pass:
-                    supabase_client.table('users')\
+                    get_supabase_client().table('users')\
                         .insert({'username': new_user, 'password': new_pass, 'is_admin': False})\
                         .execute()
                     st.sidebar.success('User created!')
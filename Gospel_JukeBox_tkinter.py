@@ -2,15 +2,28 @@ import os
 import pygame
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import threading
-import time
 import json
-import random
 from PIL import Image, ImageTk
 import requests
 from io import BytesIO
 import re
+from duration_index import DurationIndex
+from song_library import SongLibrary, diff_sorted
+from player_state import PlayerStateStore
+from loudness import LoudnessIndex
 
+# Progress bar refresh interval while a song is playing (nothing runs while paused or stopped)
+PROGRESS_INTERVAL_MS = 250
+# Delay before a dragged progress bar position is applied
+SEEK_DEBOUNCE_MS = 150
+# Delay after the last keystroke before the library search runs
+SEARCH_DEBOUNCE_MS = 200
+# SQLite file holding the play history, queue and settings
+STATE_DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "player_state.db")
+# Settings file written by earlier versions; read once if the database has none
+LEGACY_SETTINGS_PATH = "settings.json"
+# Posted by pygame when the music stops
+END_EVENT = pygame.USEREVENT + 1
 
 # =====================================Headless===========================
 
@@ -40,14 +53,28 @@ class MusicPlayer:
         # Variables
         self.current_song = ""
         self.paused = False
-        self.songs_list = []
-        self.current_song_index = 0
-        self.queue = []
-        self.history = []
+        self.library = SongLibrary()
+        self.visible_ids = []  # Library ids in songs_listbox row order
+        self.search_job = None
+        self.current_song_index = 0  # Library id of the current song
+        # Bounded history and queue deques, restored from and saved to SQLite in the background
+        self.state_store = PlayerStateStore(STATE_DB_PATH)
+        self.queue = self.state_store.queue
+        self.history = self.state_store.history
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
         self.repeat_mode = "no_repeat"  # Options: no_repeat, repeat_one, repeat_all
         self.shuffle_mode = False
         self.volume = 0.5
-        pygame.mixer.music.set_volume(self.volume)
+        self.track_gain = 1.0  # Loudness normalization multiplier of the current track
+        self.loudness_index = LoudnessIndex()
+        self.apply_volume()
+        self.end_events = self.init_end_event()
+        self.duration_index = DurationIndex(os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache", "duration_index.json"))
+        self.song_length = 0  # Seconds, probed from the MP3 headers
+        self.position_offset = 0.0  # Seconds skipped by the last seek (get_pos restarts at each play)
+        self.progress_job = None
+        self.seek_job = None
+        self.updating_progress = False
 
         
         
@@ -143,11 +170,6 @@ class MusicPlayer:
         # Initialize the library view
         self.show_library()
         
-        # Start the progress update thread
-        self.update_thread = threading.Thread(target=self.update_progress)
-        self.update_thread.daemon = True
-        self.update_thread.start()
-        
         # Load songs from the default directory
         self.load_default_songs()
         
@@ -161,13 +183,18 @@ class MusicPlayer:
             self.load_songs_from_directory(default_dir)
     
     def load_songs_from_directory(self, directory):
-        self.songs_list = []
-        for filename in os.listdir(directory):
-            if filename.endswith(".mp3"):
-                filepath = os.path.join(directory, filename)
-                song_name = os.path.splitext(filename)[0]
-                self.songs_list.append({"name": song_name, "path": filepath})
-        
+        songs = []
+        with os.scandir(directory) as entries:
+            for entry in entries:
+                if entry.name.endswith(".mp3") and entry.is_file():
+                    songs.append({"name": os.path.splitext(entry.name)[0], "path": entry.path})
+        self.library.reset(songs)
+        self.loudness_index.measure_in_background(song["path"] for song in songs)
+        
+        # Ids change with a new catalog, so the listbox is rebuilt once
+        self.visible_ids = []
+        if hasattr(self, 'songs_listbox') and self.songs_listbox.winfo_exists():
+            self.songs_listbox.delete(0, tk.END)
         self.update_library_view()
     
     def show_library(self):
@@ -201,7 +228,7 @@ class MusicPlayer:
         search_label.pack(side=tk.LEFT, padx=5)
         
         self.search_var = tk.StringVar()
-        self.search_var.trace("w", lambda name, index, mode, sv=self.search_var: self.search_songs(sv))
+        self.search_var.trace("w", lambda name, index, mode, sv=self.search_var: self.schedule_search(sv))
         search_entry = tk.Entry(search_frame, textvariable=self.search_var, width=30)
         search_entry.pack(side=tk.LEFT, padx=5)
         
@@ -230,16 +257,30 @@ class MusicPlayer:
         
         self.songs_listbox.bind("<Button-3>", self.show_song_menu)
         
-        # Update the library view
+        # Fill the new listbox
+        self.visible_ids = []
         self.update_library_view()
         
         self.current_view = "library"
     
     def update_library_view(self):
-        if hasattr(self, 'songs_listbox'):
-            self.songs_listbox.delete(0, tk.END)
-            for song in self.songs_list:
-                self.songs_listbox.insert(tk.END, song["name"])
+        # Show the songs matching the current search, touching only rows that change
+        if hasattr(self, 'songs_listbox') and self.songs_listbox.winfo_exists():
+            term = self.search_var.get() if hasattr(self, 'search_var') else ""
+            self.apply_library_delta(self.library.search(term))
+    
+    def apply_library_delta(self, ids):
+        removed, inserted = diff_sorted(self.visible_ids, ids)
+        for row in removed:
+            self.songs_listbox.delete(row)
+        for row, run in inserted:
+            # One Tk call per contiguous run of new rows
+            self.songs_listbox.insert(row, *(self.library.get(song_id)["name"] for song_id in run))
+        self.visible_ids = ids
+    
+    def selected_song_id(self):
+        # Library id of the selected listbox row (raises IndexError when nothing is selected)
+        return self.visible_ids[self.songs_listbox.curselection()[0]]
     
     def show_song_menu(self, event):
         try:
@@ -255,41 +296,45 @@ class MusicPlayer:
         files = filedialog.askopenfilenames(filetypes=[("MP3 Files", "*.mp3")])
         for file in files:
             song_name = os.path.splitext(os.path.basename(file))[0]
-            self.songs_list.append({"name": song_name, "path": file})
+            self.library.add({"name": song_name, "path": file})
+        self.loudness_index.measure_in_background(files)
         
         self.update_library_view()
     
+    def schedule_search(self, search_var):
+        # Wait for typing to pause before searching
+        if self.search_job is not None:
+            self.root.after_cancel(self.search_job)
+        self.search_job = self.root.after(SEARCH_DEBOUNCE_MS, self.search_songs, search_var)
+    
     def search_songs(self, search_var):
-        search_term = search_var.get().lower()
-        self.songs_listbox.delete(0, tk.END)
-        
-        for song in self.songs_list:
-            if search_term in song["name"].lower():
-                self.songs_listbox.insert(tk.END, song["name"])
+        self.search_job = None
+        if hasattr(self, 'songs_listbox') and self.songs_listbox.winfo_exists():
+            self.apply_library_delta(self.library.search(search_var.get()))
     
     def play_selected_song(self, event=None):
         try:
-            index = self.songs_listbox.curselection()[0]
-            song = self.songs_list[index]
+            song = self.library.get(self.selected_song_id())
             self.play_song(song)
         except IndexError:
             pass
     
     def add_to_queue(self):
         try:
-            index = self.songs_listbox.curselection()[0]
-            song = self.songs_list[index]
+            song = self.library.get(self.selected_song_id())
             self.queue.append(song)
+            self.state_store.queue_changed()
             messagebox.showinfo("Queue", f"Added '{song['name']}' to the queue")
         except IndexError:
             pass
     
     def remove_from_library(self):
         try:
-            index = self.songs_listbox.curselection()[0]
-            song = self.songs_list[index]
-            self.songs_list.pop(index)
-            self.update_library_view()
+            row = self.songs_listbox.curselection()[0]
+            song = self.library.remove(self.visible_ids[row])
+            # Only the removed row leaves the listbox
+            self.songs_listbox.delete(row)
+            del self.visible_ids[row]
             messagebox.showinfo("Library", f"Removed '{song['name']}' from the library")
         except IndexError:
             pass
@@ -364,7 +409,9 @@ class MusicPlayer:
     def play_from_queue(self, event=None):
         try:
             index = self.queue_listbox.curselection()[0]
-            song = self.queue.pop(index)
+            song = self.queue[index]
+            del self.queue[index]
+            self.state_store.queue_changed()
             self.play_song(song)
             self.update_queue_view()
         except IndexError:
@@ -373,14 +420,18 @@ class MusicPlayer:
     def remove_from_queue(self):
         try:
             index = self.queue_listbox.curselection()[0]
-            song = self.queue.pop(index)
-            self.update_queue_view()
+            song = self.queue[index]
+            del self.queue[index]
+            self.state_store.queue_changed()
+            # Only the removed row leaves the listbox
+            self.queue_listbox.delete(index)
             messagebox.showinfo("Queue", f"Removed '{song['name']}' from the queue")
         except IndexError:
             pass
     
     def clear_queue(self):
-        self.queue = []
+        self.queue.clear()
+        self.state_store.queue_changed()
         self.update_queue_view()
         messagebox.showinfo("Queue", "Queue cleared")
     
@@ -454,8 +505,8 @@ class MusicPlayer:
     def play_from_history(self, event=None):
         try:
             index = self.history_listbox.curselection()[0]
-            # Get song from reversed history (most recent first)
-            song = list(reversed(self.history))[index]
+            # Listbox rows are most recent first
+            song = self.history[-1 - index]
             self.play_song(song)
         except IndexError:
             pass
@@ -463,15 +514,16 @@ class MusicPlayer:
     def add_from_history_to_queue(self):
         try:
             index = self.history_listbox.curselection()[0]
-            # Get song from reversed history (most recent first)
-            song = list(reversed(self.history))[index]
+            # Listbox rows are most recent first
+            song = self.history[-1 - index]
             self.queue.append(song)
+            self.state_store.queue_changed()
             messagebox.showinfo("Queue", f"Added '{song['name']}' to the queue")
         except IndexError:
             pass
     
     def clear_history(self):
-        self.history = []
+        self.state_store.clear_history()
         self.update_history_view()
         messagebox.showinfo("History", "History cleared")
     
@@ -563,41 +615,44 @@ class MusicPlayer:
             "shuffle_mode": self.shuffle_mode
         }
         
-        try:
-            with open("settings.json", "w") as f:
-                json.dump(settings, f)
-            messagebox.showinfo("Settings", "Settings saved successfully")
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to save settings: {str(e)}")
+        # Written by the state store's background thread
+        self.state_store.save_settings(settings)
+        messagebox.showinfo("Settings", "Settings saved successfully")
     
     def load_settings(self):
-        try:
-            with open("settings.json", "r") as f:
-                settings = json.load(f)
-                
-                # Apply settings
-                self.theme_var.set(settings.get("theme", "light"))
-                self.dir_var.set(settings.get("default_dir", ""))
-                self.volume = settings.get("volume", 0.5)
-                self.repeat_mode = settings.get("repeat_mode", "no_repeat")
-                self.shuffle_mode = settings.get("shuffle_mode", False)
-                
-                # Apply theme
-                self.apply_theme()
-                
-                # Apply volume
-                pygame.mixer.music.set_volume(self.volume)
-                self.volume_scale.set(self.volume)
-                
-                # Load songs from default directory
-                default_dir = settings.get("default_dir", "")
-                if default_dir and os.path.exists(default_dir):
-                    self.load_songs_from_directory(default_dir)
-        except FileNotFoundError:
-            # No settings file found, use defaults
-            pass
-        except Exception as e:
-            messagebox.showerror("Error", f"Failed to load settings: {str(e)}")
+        settings = self.state_store.settings
+        if not settings and os.path.exists(LEGACY_SETTINGS_PATH):
+            # Carry settings.json over into the state database once
+            try:
+                with open(LEGACY_SETTINGS_PATH, "r") as f:
+                    settings = json.load(f)
+                self.state_store.save_settings(settings)
+            except Exception as e:
+                messagebox.showerror("Error", f"Failed to load settings: {str(e)}")
+                return
+        if not settings:
+            # No saved settings, use defaults
+            return
+        
+        # Apply settings
+        self.volume = settings.get("volume", 0.5)
+        self.repeat_mode = settings.get("repeat_mode", "no_repeat")
+        self.shuffle_mode = settings.get("shuffle_mode", False)
+        if hasattr(self, 'theme_var'):
+            self.theme_var.set(settings.get("theme", "light"))
+            self.dir_var.set(settings.get("default_dir", ""))
+            
+            # Apply theme
+            self.apply_theme()
+        
+        # Apply volume
+        self.apply_volume()
+        self.volume_scale.set(self.volume)
+        
+        # Load songs from default directory
+        default_dir = settings.get("default_dir", "")
+        if default_dir and os.path.exists(default_dir):
+            self.load_songs_from_directory(default_dir)
     
     def load_settings_to_view(self):
         if hasattr(self, 'dir_var'):
@@ -606,22 +661,37 @@ class MusicPlayer:
     def play_song(self, song):
         try:
             pygame.mixer.music.load(song["path"])
+            if self.end_events:
+                # Drop the end event posted for the track that load() just stopped
+                pygame.event.clear(END_EVENT)
+            # Tracks not measured yet play at the plain volume
+            self.track_gain = self.loudness_index.volume_scale(song["path"])
+            self.apply_volume()
             pygame.mixer.music.play()
+            self.position_offset = 0.0
+            self.song_length = self.duration_index.get_duration(song["path"]) or 0
+            try:
+                self.duration_index.save()
+            except OSError as e:
+                print(f"Could not save duration index: {e}")
+            self.progress_bar.config(to=max(self.song_length, 1))
+            self.song_length_label.config(text=self.format_time(self.song_length))
+            self.set_progress(0)
+            self.schedule_progress()
             self.current_song = song["name"]
             self.current_song_label.config(text=song["name"])
             self.play_pause_btn.config(text="⏸")
             self.paused = False
             
-            # Add to history
-            self.history.append(song)
+            # Add to history (the oldest play drops off once the cap is reached)
+            self.state_store.record_play(song)
             if self.current_view == "history":
                 self.update_history_view()
             
             # Update current song index
-            for i, s in enumerate(self.songs_list):
-                if s["path"] == song["path"]:
-                    self.current_song_index = i
-                    break
+            song_id = self.library.index_of(song["path"])
+            if song_id is not None:
+                self.current_song_index = song_id
         except Exception as e:
             messagebox.showerror("Error", f"Failed to play song: {str(e)}")
     
@@ -631,37 +701,40 @@ class MusicPlayer:
                 pygame.mixer.music.unpause()
                 self.play_pause_btn.config(text="⏸")
                 self.paused = False
+                self.schedule_progress()
             else:
                 pygame.mixer.music.pause()
                 self.play_pause_btn.config(text="▶")
                 self.paused = True
-        elif self.songs_list:
-            self.play_song(self.songs_list[0])
+                self.cancel_progress()
+        elif len(self.library):
+            self.play_song(self.library.first())
     
     def play_next(self):
         if self.shuffle_mode:
-            if self.songs_list:
-                next_index = random.randint(0, len(self.songs_list) - 1)
-                self.play_song(self.songs_list[next_index])
+            if len(self.library):
+                self.play_song(self.library.get(self.library.random_id()))
         elif self.queue:
             # Play next song from queue
-            next_song = self.queue.pop(0)
+            next_song = self.queue.popleft()
+            self.state_store.queue_changed()
             self.play_song(next_song)
             if self.current_view == "queue":
                 self.update_queue_view()
         elif self.repeat_mode == "repeat_one" and self.current_song:
             # Replay current song
-            current_song = self.songs_list[self.current_song_index]
-            self.play_song(current_song)
-        elif self.songs_list:
+            current_song = self.library.get(self.current_song_index)
+            if current_song:
+                self.play_song(current_song)
+        elif len(self.library):
             # Play next song in playlist
-            next_index = (self.current_song_index + 1) % len(self.songs_list)
-            self.play_song(self.songs_list[next_index])
+            next_index = self.library.step(self.current_song_index, 1)
+            self.play_song(self.library.get(next_index))
     
     def play_prev(self):
-        if self.songs_list:
-            prev_index = (self.current_song_index - 1) % len(self.songs_list)
-            self.play_song(self.songs_list[prev_index])
+        if len(self.library):
+            prev_index = self.library.step(self.current_song_index, -1)
+            self.play_song(self.library.get(prev_index))
     
     def toggle_repeat(self):
         if self.repeat_mode == "no_repeat":
@@ -681,32 +754,102 @@ class MusicPlayer:
         else:
             self.shuffle_btn.config(bg="#ecf0f1")
     
+    def apply_volume(self):
+        """Set the mixer to the user's volume scaled by the current track's loudness gain."""
+        pygame.mixer.music.set_volume(self.volume * self.track_gain)
+    
     def set_volume(self, val):
         self.volume = float(val)
-        pygame.mixer.music.set_volume(self.volume)
+        self.apply_volume()
     
     def volume_up(self):
         self.volume = min(1.0, self.volume + 0.1)
         self.volume_scale.set(self.volume)
-        pygame.mixer.music.set_volume(self.volume)
+        self.apply_volume()
     
     def volume_down(self):
         self.volume = max(0.0, self.volume - 0.1)
         self.volume_scale.set(self.volume)
-        pygame.mixer.music.set_volume(self.volume)
+        self.apply_volume()
+    
+    def on_close(self):
+        # Write any pending history, queue and settings before exiting
+        self.cancel_progress()
+        self.state_store.close()
+        self.root.destroy()
+    
+    def init_end_event(self):
+        # pygame's event queue needs the video subsystem, but no window is ever opened
+        try:
+            pygame.display.init()
+            pygame.mixer.music.set_endevent(END_EVENT)
+            return True
+        except pygame.error as e:
+            print(f"End-of-track events unavailable, falling back to get_busy(): {e}")
+            return False
+    
+    def format_time(self, seconds):
+        seconds = int(max(0, seconds))
+        return f"{seconds // 60}:{seconds % 60:02d}"
+    
+    def current_position(self):
+        # get_pos() counts milliseconds since the last play(), so add the seek offset
+        return self.position_offset + max(0, pygame.mixer.music.get_pos()) / 1000
+    
+    def schedule_progress(self):
+        # Run update_progress on the Tk thread while a song is playing
+        self.cancel_progress()
+        self.progress_job = self.root.after(PROGRESS_INTERVAL_MS, self.update_progress)
+    
+    def cancel_progress(self):
+        if self.progress_job is not None:
+            self.root.after_cancel(self.progress_job)
+            self.progress_job = None
+    
+    def set_progress(self, position):
+        # Move the progress bar without it being taken for a user seek
+        self.updating_progress = True
+        try:
+            self.progress_bar.set(position)
+        finally:
+            self.updating_progress = False
+        self.current_time_label.config(text=self.format_time(position))
     
     def seek(self, val):
-        pass  # Implement seeking functionality
+        if self.updating_progress or not self.current_song:
+            return
+        # Dragging fires many values; only the one the bar settles on is applied
+        self.current_time_label.config(text=self.format_time(float(val)))
+        if self.seek_job is not None:
+            self.root.after_cancel(self.seek_job)
+        self.seek_job = self.root.after(SEEK_DEBOUNCE_MS, self.apply_seek, float(val))
+    
+    def apply_seek(self, position):
+        self.seek_job = None
+        try:
+            pygame.mixer.music.play(start=position)
+            self.position_offset = position
+            if self.paused:
+                pygame.mixer.music.pause()
+        except pygame.error as e:
+            print(f"Seek failed: {e}")
     
     def update_progress(self):
-        while True:
-            if self.current_song and not self.paused and pygame.mixer.music.get_busy():
-                # Update progress bar
-                pass
-            elif self.current_song and not self.paused and not pygame.mixer.music.get_busy():
-                # Song ended, play next
-                self.play_next()
-            time.sleep(0.1)
+        # Runs on the Tk thread via after(), so Tk widgets can be touched directly
+        self.progress_job = None
+        if not self.current_song or self.paused:
+            return
+        if self.end_events:
+            stopped = bool(pygame.event.get(END_EVENT))
+        else:
+            stopped = True
+        # Halting or restarting the music (load, seek) also posts the end event
+        if stopped and not pygame.mixer.music.get_busy():
+            self.set_progress(self.song_length)
+            self.play_next()
+            return
+        self.set_progress(min(self.current_position(), self.song_length or float("inf")))
+        self.schedule_progress()
 
 # Main application
 if __name__ == "__main__":
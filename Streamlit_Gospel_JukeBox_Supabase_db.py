@@ -1,16 +1,14 @@
 import os
-from dotenv import load_dotenv
-from supabase import create_client, Client
 import streamlit as st
 from datetime import datetime
-import base64
 import webbrowser
+from library_index import LibraryIndex
+from startup import load_environment, ensure_directories, create_supabase_client
+from search_index import SearchIndex, fetch_in_pages
+from db_pool import ConnectionPool
 
-# Load environment variables and initialize Supabase client
-load_dotenv()
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_KEY = os.getenv("SUPABASE_KEY")
-supabase: Client = create_client(SUPABASE_URL, SUPABASE_KEY)
+# Load environment variables once per process; the Supabase client is created on first use
+load_environment()
 
 # Streamlit page config
 st.set_page_config(
@@ -24,8 +22,13 @@ st.set_page_config(
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MP3_DIR = os.getenv("MP3_DIR", os.path.join(BASE_DIR, "mp3_files"))
 PICTURES_DIR = os.getenv("PICTURES_DIR", os.path.join(BASE_DIR, "pictures"))
-os.makedirs(MP3_DIR, exist_ok=True)
-os.makedirs(os.path.join(PICTURES_DIR, "sheet_music"), exist_ok=True)
+ensure_directories(MP3_DIR, os.path.join(PICTURES_DIR, "sheet_music"))
+LIBRARY_INDEX_PATH = os.path.join(BASE_DIR, "cache", "library_index_supabase.json")
+SEARCH_INDEX_PATH = os.path.join(BASE_DIR, "cache", "search_index_supabase.db")
+
+@st.cache_resource
+def get_supabase():
+    return create_supabase_client()
 
 # --- Authentication ---
 def login_page():
@@ -33,7 +36,7 @@ def login_page():
     user = st.text_input("Username")
     pwd = st.text_input("Password", type="password")
     if st.button("Login"):
-        res = (supabase
+        res = (get_supabase()
                .table("users")
                .select("username, password_hash, role")
                .eq("username", user)
@@ -48,12 +51,42 @@ def login_page():
             st.error("Invalid credentials")
 
 # --- Content loader ---
+@st.cache_resource
+def get_library_index():
+    return LibraryIndex(MP3_DIR, LIBRARY_INDEX_PATH, include_subfolders=False)
+
 def load_content():
-    return sorted(f for f in os.listdir(MP3_DIR) if f.endswith('.mp3'))
+    return [os.path.basename(song["media_file"]) for song in get_library_index().refresh()]
+
+# --- Search ---
+@st.cache_resource
+def get_search_index():
+    os.makedirs(os.path.dirname(SEARCH_INDEX_PATH), exist_ok=True)
+    return SearchIndex(ConnectionPool(SEARCH_INDEX_PATH))
+
+def fetch_rows(table, columns):
+    # PostgREST caps each response, so page through the whole table
+    return fetch_in_pages(
+        lambda first, last: get_supabase().table(table).select(columns).order("id").range(first, last).execute().data
+    )
+
+def load_label_documents():
+    return [(r["id"], r["song_title"], r["name"]) for r in fetch_rows("labels", "id, song_title, name")]
+
+def load_note_documents():
+    return [(r["id"], r["song_title"], r["content"]) for r in fetch_rows("notes", "id, song_title, content")]
+
+def search_library(query):
+    index = get_search_index()
+    index.sync_songs((os.path.basename(s["media_file"]), s["text_file"]) for s in get_library_index().refresh())
+    # Labels and notes live in Supabase; mirror them at most once per refresh interval
+    index.sync_documents("label", load_label_documents)
+    index.sync_documents("note", load_note_documents)
+    return [song for song, _ in index.search(query)]
 
 # --- Supabase helpers ---
 def get_labels_for_song_instrument(song_title, instrument):
-    res = (supabase
+    res = (get_supabase()
            .table("labels")
            .select("name, owner_id")
            .eq("song_title", song_title)
@@ -62,92 +95,33 @@ def get_labels_for_song_instrument(song_title, instrument):
     return [(r["name"], r["owner_id"]) for r in res.data] if res.data else []
 
 
-def fetch_notes(song_title):
-    # Fetch notes with label_id, then join with labels to get label name
-    notes_res = (
-        supabase
-        .table("notes")
-        .select("owner_id, content, label_id")
-        .eq("song_title", song_title)
-        .order("owner_id", {"ascending": True})
-        .execute()
-    )
-    notes = notes_res.data if notes_res.data else []
-    if not notes:
-        return []
-    # Fetch all label ids for this song
-    label_ids = list({n["label_id"] for n in notes if n.get("label_id")})
-    if not label_ids:
-        for n in notes:
-            n["label"] = None
-        return notes
-    label_map = {}
-    if label_ids:
-        label_res = (
-            supabase
-            .table("labels")
-            .select("id, name")
-            .in_("id", label_ids)
-            .execute()
-        )
-        for l in (label_res.data or []):
-            label_map[l["id"]] = l["name"]
-    for n in notes:
-        n["label"] = label_map.get(n.get("label_id"), None)
-    return notes
-
-
 def add_note(song_title, owner_id, label, content):
-    # Look up label_id for the given label name and song_title
-    label_id = None
-    label_res = (
-        supabase
-        .table("labels")
-        .select("id")
-        .eq("song_title", song_title)
-        .eq("name", label)
-        .maybe_single()
-        .execute()
-    )
-    if label_res.data:
-        label_id = label_res.data["id"]
-    payload = {
-        "song_title": song_title,
-        "owner_id": owner_id,
-        "label_id": label_id,
-        "content": content,
-        "created_at": datetime.utcnow().isoformat()
+    # The add_song_note RPC resolves the label name to its id in the same round trip
+    get_supabase().rpc("add_song_note", {
+        "p_song_title": song_title,
+        "p_owner_id": owner_id,
+        "p_label": label,
+        "p_content": content
+    }).execute()
+    get_search_index().expire("note")
+
+
+def fetch_song_detail(song_title):
+    # Labels, notes (with label names) and sheet music for a song in one round trip
+    res = get_supabase().rpc("get_song_detail", {"p_song_title": song_title}).execute()
+    detail = res.data or {}
+    return {
+        "labels": detail.get("labels") or [],
+        "notes": detail.get("notes") or [],
+        "sheet_music": detail.get("sheet_music") or []
     }
-    supabase.table("notes").insert(payload).execute()
 
 # --- Sheet Music Helpers ---
-def fetch_sheet_music(song_title):
-    # Fetch all sheet music for a song, joining with labels
-    res = (
-        supabase
-        .table("sheet_music")
-        .select("id, file_path, label_id, upload_date, label:label_id(name)")
-        .eq("song_name", song_title)
-        .order("upload_date", {"ascending": False})
-        .execute()
-    )
-    return res.data if res.data else []
-
-def fetch_labels_for_song(song_title):
-    res = (
-        supabase
-        .table("labels")
-        .select("id, name")
-        .eq("song_title", song_title)
-        .execute()
-    )
-    return res.data if res.data else []
-
 def insert_sheet_music(song_title, label_id, file_obj, file_name, user_id):
     # Upload file to Supabase Storage (bucket: sheet_music_files)
     bucket = "sheet_music_files"
     storage_path = f"{song_title}/{label_id}/{file_name}"
-    supabase.storage.from_(bucket).upload(storage_path, file_obj, file_options={"content-type": "application/pdf"})
+    get_supabase().storage.from_(bucket).upload(storage_path, file_obj, file_options={"content-type": "application/pdf"})
     # Insert reference into sheet_music table
     payload = {
         "song_name": song_title,
@@ -156,7 +130,7 @@ def insert_sheet_music(song_title, label_id, file_obj, file_name, user_id):
         "owner_id": user_id,
         "upload_date": datetime.utcnow().isoformat()
     }
-    supabase.table("sheet_music").insert(payload).execute()
+    get_supabase().table("sheet_music").insert(payload).execute()
 
 # --- Main page: Music Library ---
 def display_music_library():
@@ -164,25 +138,10 @@ def display_music_library():
     mp3_files = load_content()
 
     # Search
-    search_query = st.text_input("Search songs by title, sheet music label, or note label")
+    search_query = st.text_input("Search songs by title, lyrics, sheet music label, or note label")
     if search_query:
-        by_title = [s for s in mp3_files if search_query.lower() in s.lower()]
-        lab = (supabase.table("labels").select("song_title")
-               .like("name", f"%{search_query}%").execute().data or [])
-        # Find label ids matching the search
-        matching_labels = (
-            supabase.table("labels").select("id, song_title")
-            .like("name", f"%{search_query}%").execute().data or []
-        )
-        matching_label_ids = [r["id"] for r in matching_labels]
-        note = (
-            supabase.table("notes").select("song_title, label_id")
-            .in_("label_id", matching_label_ids)
-            .execute().data or []
-        ) if matching_label_ids else []
-        label_matches = [r["song_title"] for r in lab]
-        note_matches = [r["song_title"] for r in note]
-        filtered_songs = list(set(by_title + label_matches + note_matches))
+        available = set(mp3_files)
+        filtered_songs = [s for s in search_library(search_query) if s in available]
     else:
         filtered_songs = mp3_files
 
@@ -195,8 +154,9 @@ def display_music_library():
     # --- Sheet Music Section ---
     st.markdown("---")
     st.markdown("### Sheet Music")
-    sheet_music_list = fetch_sheet_music(selected_song)
-    labels = fetch_labels_for_song(selected_song)
+    detail = fetch_song_detail(selected_song)
+    sheet_music_list = detail["sheet_music"]
+    labels = detail["labels"]
     label_map = {l['id']: l['name'] for l in labels}
     label_names = [l['name'] for l in labels]
     label_id_to_name = {l['id']: l['name'] for l in labels}
@@ -235,7 +195,7 @@ def display_music_library():
     # --- Notes Section ---
     st.markdown("---")
     st.markdown("### Notes")
-    notes = fetch_notes(selected_song)
+    notes = detail["notes"]
     if notes:
         unique_labels = sorted({n["label"] for n in notes if n.get("label")})
         mode = st.radio("Existing Notes View", ["All notes", "Labels only", "Filter by label"], index=0)
@@ -1,10 +1,19 @@
 import os
 import base64
-import sqlite3
 import streamlit as st
 from datetime import datetime
-import matplotlib.pyplot as plt
 from streamlit import components
+from db_pool import ConnectionPool
+from migrations import migrate
+from startup import ensure_directories, create_supabase_client
+from media_server import MediaServer
+from renditions import LOW, RenditionCache, transcoding_available
+from results_chart import tally_digest, render_pie_chart
+from duration_index import DurationIndex
+from library_index import LibraryIndex
+from loudness import LoudnessIndex
+from lyrics import LyricsService
+from search_index import SearchIndex
 
 # Set page configuration
 st.set_page_config(
@@ -18,78 +27,38 @@ st.set_page_config(
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MP3_DIR = os.path.join(BASE_DIR, "mp3_files")
 PICTURES_DIR = os.path.join(BASE_DIR, "pictures")
-os.makedirs(MP3_DIR, exist_ok=True)
-os.makedirs(PICTURES_DIR, exist_ok=True)
-os.makedirs(os.path.join(PICTURES_DIR, "sheet_music"), exist_ok=True)
-
-# Initialize SQLite database for votes, sheet music, and users
+ensure_directories(MP3_DIR, PICTURES_DIR, os.path.join(PICTURES_DIR, "sheet_music"))
+
+# Local media server that streams mp3_files/ to the browser
+MEDIA_SERVER_HOST = os.environ.get('MEDIA_SERVER_HOST', '0.0.0.0')
+MEDIA_SERVER_PORT = int(os.environ.get('MEDIA_SERVER_PORT', 8502))
+MEDIA_SERVER_URL = os.environ.get('MEDIA_SERVER_URL')  # Public (ideally https) URL when behind a proxy
+TRANSCODE_WORKERS = int(os.environ.get('TRANSCODE_WORKERS', 2))  # ffmpeg processes for low-bandwidth renditions
+
+# Probed track durations, cached on disk by path and mtime
+CACHE_DIR = os.path.join(BASE_DIR, "cache")
+DURATION_INDEX_PATH = os.path.join(CACHE_DIR, "duration_index.json")
+LIBRARY_INDEX_PATH = os.path.join(CACHE_DIR, "library_index.json")
+LOUDNESS_INDEX_PATH = os.path.join(CACHE_DIR, "loudness_index.json")
+PEAKS_DIR = os.path.join(CACHE_DIR, "peaks")
+RENDITIONS_DIR = os.path.join(CACHE_DIR, "renditions")
+DEFAULT_SONG_DURATION = 180  # Fallback when a file's duration cannot be probed
+
+# SQLite database shared by every session through one connection pool
+DB_PATH = 'Gospel_Jukebox.db'
+
+@st.cache_resource
+def get_db_pool():
+    """Create the process-wide SQLite connection pool once and share it across sessions."""
+    return ConnectionPool(DB_PATH)
+
+# Initialize SQLite database for votes, sheet music, and users.
+# Cached so even the user_version check runs once per process, not on every rerun.
+@st.cache_resource
 def init_db():
-    conn = sqlite3.connect('Gospel_Jukebox.db')
-    cursor = conn.cursor()
-    
-    # Create votes table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS votes (
-            song_name TEXT,
-            vote INTEGER
-        )
-    ''')
-    
-    # Create instrument sheet music table
-    cursor.execute('''
-        -- Updated schema: added 'label' column for multi-type sheet music support (2025-04-21)
-        -- Updated schema: added 'creator_username' column for permission management (2025-04-22)
-        CREATE TABLE IF NOT EXISTS instrument_sheet_music (
-            song_name TEXT,
-            instrument TEXT,
-            label TEXT,
-            file_path TEXT,
-            creator_username TEXT,
-            PRIMARY KEY (song_name, instrument, label)
-        )
-    ''')
-    
-    # Create users table for authentication
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            username TEXT PRIMARY KEY,
-            password TEXT,
-            is_admin INTEGER DEFAULT 0
-        )
-    ''')
-    
-    # --- MIGRATION: Add 'is_admin' column if missing for legacy DBs ---
-    cursor.execute("PRAGMA table_info(users)")
-    columns = [col[1] for col in cursor.fetchall()]
-    if 'is_admin' not in columns:
-        cursor.execute("ALTER TABLE users ADD COLUMN is_admin INTEGER DEFAULT 0")
-    
-    # Add default admin user if not exists
-    cursor.execute("SELECT * FROM users WHERE username = 'admin'")
-    if not cursor.fetchone():
-        # Simple password storage for demo purposes
-        # In production, use password hashing
-        cursor.execute("PRAGMA table_info(users)")
-        cols = [col[1] for col in cursor.fetchall()]
-        if 'role' in cols:
-            cursor.execute("INSERT INTO users (username, password, is_admin, role) VALUES (?, ?, ?, ?)", ('admin', 'admin123', 1, 'admin'))
-        else:
-            cursor.execute("INSERT INTO users (username, password, is_admin) VALUES (?, ?, ?)", ('admin', 'admin123', 1))
-    
-    # --- MIGRATION: Add 'label' and 'creator_username' columns if missing (for legacy DBs) ---
-    try:
-        cursor.execute("PRAGMA table_info(instrument_sheet_music)")
-        columns = [row[1] for row in cursor.fetchall()]
-        if 'label' not in columns:
-            cursor.execute("ALTER TABLE instrument_sheet_music ADD COLUMN label TEXT DEFAULT ''")
-            # Rebuild primary key if needed (requires manual intervention if not empty)
-            # For now, just add the column for compatibility.
-        if 'creator_username' not in columns:
-            cursor.execute("ALTER TABLE instrument_sheet_music ADD COLUMN creator_username TEXT DEFAULT ''")
-    except Exception as e:
-        print(f"Migration warning: {e}")
-    conn.commit()
-    conn.close()
+    """Apply any pending schema migrations (see migrations.py) once per process."""
+    with get_db_pool().connection() as conn:
+        migrate(conn)
 
 # Initialize the database
 init_db()
@@ -107,60 +76,34 @@ AVAILABLE_INSTRUMENTS = [
 # --- Label Management Helper Functions ---
 def get_labels_for_song_instrument(song_name, instrument):
     """Return a list of (label, creator_username) for a given song/instrument."""
-    conn = sqlite3.connect('Gospel_Jukebox.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT label, creator_username FROM instrument_sheet_music WHERE song_name = ? AND instrument = ?", (song_name, instrument))
-    labels = [(row[0], row[1] if row[1] else 'Unknown') for row in cursor.fetchall() if row[0]]
-    conn.close()
-    return labels
+    rows = get_db_pool().fetch_all("SELECT label, creator_username FROM instrument_sheet_music WHERE song_name = ? AND instrument = ?", (song_name, instrument))
+    return [(row[0], row[1] if row[1] else 'Unknown') for row in rows if row[0]]
 
 def add_label(song_name, instrument, label, creator_username):
     """Add a new label for a song/instrument."""
-    conn = sqlite3.connect('Gospel_Jukebox.db')
-    cursor = conn.cursor()
-    cursor.execute(
+    get_db_pool().execute(
         "INSERT OR IGNORE INTO instrument_sheet_music (song_name, instrument, label, file_path, creator_username) VALUES (?, ?, ?, ?, ?)",
         (song_name, instrument, label, '', creator_username)
     )
-    conn.commit()
-    conn.close()
 
 def delete_label(song_name, instrument, label):
     """Delete a label for a song/instrument."""
-    conn = sqlite3.connect('Gospel_Jukebox.db')
-    cursor = conn.cursor()
-    cursor.execute("DELETE FROM instrument_sheet_music WHERE song_name = ? AND instrument = ? AND label = ?", (song_name, instrument, label))
-    conn.commit()
-    conn.close()
+    get_db_pool().execute("DELETE FROM instrument_sheet_music WHERE song_name = ? AND instrument = ? AND label = ?", (song_name, instrument, label))
 
 def get_label_notes(song_name, instrument, label):
     """Return all notes for a song/instrument/label as a list of (username, notes, last_updated)."""
-    conn = sqlite3.connect('Gospel_Jukebox.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT username, notes, last_updated FROM song_notes WHERE song_name = ? AND label = ?", (song_name, label))
-    notes = cursor.fetchall()
-    conn.close()
-    return notes
+    return get_db_pool().fetch_all("SELECT username, notes, last_updated FROM song_notes WHERE song_name = ? AND label = ?", (song_name, label))
 # --- End Label Management Helpers ---
 
-# Initialize Supabase connection if environment variables are available
+# Use Supabase if environment variables are available; the client is created on first use
 SUPABASE_URL = os.environ.get('SUPABASE_URL')
 SUPABASE_KEY = os.environ.get('SUPABASE_KEY')
-USE_SUPABASE = SUPABASE_URL and SUPABASE_KEY
+USE_SUPABASE = bool(SUPABASE_URL and SUPABASE_KEY)
 
-# If using Supabase, import the library
-if USE_SUPABASE:
-    try:
-        import supabase
-        from supabase import create_client, Client
-        supabase_client = create_client(SUPABASE_URL, SUPABASE_KEY)
-        print("Supabase client initialized successfully")
-    except ImportError:
-        print("Supabase library not installed. Run: pip install supabase")
-        USE_SUPABASE = False
-    except Exception as e:
-        print(f"Error initializing Supabase client: {e}")
-        USE_SUPABASE = False
+@st.cache_resource
+def get_supabase_client():
+    """Create the Supabase client once per process (errors surface at the call site)."""
+    return create_supabase_client()
 
 # Initialize session state
 defaults = {
@@ -168,10 +111,12 @@ defaults = {
     'history': [],
     'current_song': None,
     'current_lyrics': None,
+    'current_media_file': None,  # Path of the playing MP3, used to look up its synchronized lyrics
     'play_time': None,
     'song_notes': {},
     'audio_playing': False,
-    'audio_data': None,
+    'audio_url': None,  # Streaming URL of the current song on the media server
+    'audio_waveform': None,  # Scrubber HTML drawn from the current song's precomputed peaks
     'current_playback_time': 0,
     'autoplay': False,
     'replay': False,
@@ -183,7 +128,7 @@ defaults = {
     'last_check_time': datetime.now(),  # For the 20-second timer loop
     'check_interval': 10,  # Check interval in seconds (reduced for more responsive autoplay)
     'song_start_timestamp': None,  # Full timestamp when song started
-    'estimated_song_duration': 180,  # Default estimated song duration in seconds (3 minutes)
+    'estimated_song_duration': DEFAULT_SONG_DURATION,  # Duration of the current song in seconds
     'force_next_song': False,  # Flag to force playing the next song
     'logged_in': False,  # User login status
     'username': None,  # Current logged in username
@@ -195,43 +140,174 @@ for key, value in defaults.items():
     if key not in st.session_state:
         st.session_state[key] = value
 
-def encode_audio_to_base64(file_path):
-    """Encode audio to base64."""
-    with open(file_path, "rb") as audio_file:
-        return base64.b64encode(audio_file.read()).decode('utf-8')
+@st.cache_resource
+def get_rendition_cache():
+    """Create the transcoded-variant cache once per process; None without pydub and ffmpeg."""
+    if TRANSCODE_WORKERS <= 0 or not transcoding_available():
+        return None
+    return RenditionCache(RENDITIONS_DIR, workers=TRANSCODE_WORKERS)
+
+@st.cache_resource
+def get_media_server():
+    """Start the local media server once per process and share it across sessions."""
+    return MediaServer(
+        MP3_DIR,
+        host=MEDIA_SERVER_HOST,
+        port=MEDIA_SERVER_PORT,
+        public_url=MEDIA_SERVER_URL,
+        renditions=get_rendition_cache()
+    ).start()
+
+def get_request_origin():
+    """Return (host, is_https) of the browser's request for this page, as far as Streamlit exposes it."""
+    headers = getattr(getattr(st, "context", None), "headers", None) or {}
+    host = headers.get("X-Forwarded-Host") or headers.get("Host")
+    is_https = headers.get("X-Forwarded-Proto", "").split(",")[0].strip().lower() == "https"
+    return host, is_https
+
+def get_audio_url(file_path):
+    """Return the URL the browser should play the given MP3 file from.
+
+    Normally a media server URL on the host the viewer used to reach the app,
+    asking for the low-bitrate rendition when data saver is on.
+    An https page cannot load audio from the plain-http media server, so
+    without a MEDIA_SERVER_URL it falls back to embedding the file.
+    """
+    host, is_https = get_request_origin()
+    if is_https and not MEDIA_SERVER_URL:
+        with open(file_path, "rb") as audio_file:
+            return "data:audio/mpeg;base64," + base64.b64encode(audio_file.read()).decode('utf-8')
+    rendition = LOW if st.session_state.get('data_saver') else None
+    return get_media_server().url_for(os.path.relpath(file_path, MP3_DIR), rendition=rendition, request_host=host)
+
+@st.cache_resource
+def get_duration_index():
+    """Load the duration index once per process, probing any new or changed MP3s."""
+    index = DurationIndex(DURATION_INDEX_PATH)
+    index.refresh(MP3_DIR)
+    return index
+
+def get_song_duration(file_path):
+    """Return the real duration of an MP3 file in seconds."""
+    return get_duration_index().get_duration(file_path) or DEFAULT_SONG_DURATION
+
+@st.cache_resource
+def get_loudness_index():
+    """Load the per-track loudness gains once per process."""
+    return LoudnessIndex(LOUDNESS_INDEX_PATH)
+
+@st.cache_resource
+def get_peaks_store():
+    """Open the waveform peaks cache once per process; None when numpy is not installed."""
+    try:
+        from waveform_peaks import PeaksStore
+    except ImportError:
+        return None
+    return PeaksStore(PEAKS_DIR)
+
+def get_waveform_html(file_path):
+    """Return the waveform scrubber for a song, or an empty string until its peaks are built."""
+    store = get_peaks_store()
+    peaks = store.get(file_path) if store else None
+    if peaks is None or not peaks.duration:
+        return ""
+    from waveform_peaks import scrubber_html
+    return scrubber_html(peaks)
+
+@st.cache_resource
+def get_library_index():
+    """Build the song catalog once per process; later reruns only re-stat MP3_DIR."""
+    return LibraryIndex(
+        MP3_DIR, LIBRARY_INDEX_PATH, include_subfolders=False,
+        duration_index=get_duration_index(), loudness_index=get_loudness_index()
+    )
 
 def play_audio(file_path, song_name):
     """Play an audio file. Ensures play button is always responsive."""
     # Always reset audio state for new playback
     st.session_state.audio_playing = False
     st.session_state.current_song = None
-    st.session_state.audio_data = None
+    st.session_state.audio_url = None
     # DO NOT reset or modify st.session_state.queue here!
     # Now set new state
-    st.session_state.audio_data = encode_audio_to_base64(file_path)
+    st.session_state.audio_url = get_audio_url(file_path)
+    st.session_state.audio_volume = get_loudness_index().volume_scale(file_path)  # Level tracks to the same loudness
+    st.session_state.audio_waveform = get_waveform_html(file_path)
     st.session_state.audio_playing = True
     st.session_state.current_song = song_name
     st.session_state.play_time = datetime.now().strftime("%H:%M:%S")
     st.session_state.song_start_timestamp = datetime.now()  # Store full timestamp
     st.session_state.current_playback_time = 0
+    st.session_state.estimated_song_duration = get_song_duration(file_path)
     st.session_state.current_lyrics = load_lyrics(file_path)
+    st.session_state.current_media_file = file_path
     st.session_state.song_ended = False  # Reset song ended flag when starting a new song
     st.session_state.force_next_song = False  # Reset force next flag when starting a new song
     # Debug information for song playback
     print(f"Started playing: {song_name} at {st.session_state.play_time}")
-    print(f"Estimated duration: {st.session_state.estimated_song_duration} seconds")
+    print(f"Duration: {st.session_state.estimated_song_duration} seconds")
     if song_name not in st.session_state.history:
         st.session_state.history.append(song_name)
         st.session_state.history = st.session_state.history[-10:]
 
+@st.cache_resource(max_entries=1, show_spinner=False)
+def start_loudness_measurement(media_files):
+    """Queue loudness measurement once per process and library state, not on every rerun."""
+    get_loudness_index().measure_in_background(
+        media_files, on_done=lambda count: get_library_index().apply_gains()
+    )
+    return True
+
+@st.cache_resource(max_entries=1, show_spinner=False)
+def start_peaks_generation(media_files):
+    """Queue waveform peaks generation once per process and library state, not on every rerun."""
+    if get_peaks_store():
+        get_peaks_store().generate_in_background(media_files)
+    return True
+
 def load_content():
     """Load songs from directories."""
-    return sorted(f for f in os.listdir(MP3_DIR) if f.endswith('.mp3'))
+    songs = get_library_index().refresh()
+    media_files = tuple(song["media_file"] for song in songs)
+    # Measure new tracks in the background; they play unlevelled until then
+    start_loudness_measurement(media_files)
+    # Waveform peaks are built the same way; songs without them show no scrubber
+    start_peaks_generation(media_files)
+    return [os.path.basename(song["media_file"]) for song in songs]
+
+@st.cache_resource
+def get_search_index():
+    """Create the full-text search index once; triggers keep labels and notes in sync."""
+    return SearchIndex(get_db_pool())
+
+def search_library(query):
+    """Rank songs whose title, lyrics, sheet music labels or notes match the query."""
+    index = get_search_index()
+    index.sync_songs((os.path.basename(song["media_file"]), song["text_file"]) for song in get_library_index().refresh())
+    return index.search(query)
+
+@st.cache_resource
+def get_lyrics_service():
+    """Share one lyrics cache across sessions; files are only re-read when they change."""
+    return LyricsService()
 
 def load_lyrics(file_path):
-    """Load lyrics from a corresponding text file."""
-    text_file_path = os.path.splitext(file_path)[0] + '.txt'
-    return open(text_file_path).read() if os.path.exists(text_file_path) else "No lyrics available."
+    """Load lyrics from the song's .lrc or .txt file (timestamps are stripped)."""
+    lyrics = get_lyrics_service().for_media(file_path)
+    return lyrics.text if lyrics else "No lyrics available."
+
+def current_lyrics_markdown():
+    """Return the playing song's lyrics with the line at the estimated position in bold (LRC files only)."""
+    media_file = st.session_state.current_media_file
+    lyrics = get_lyrics_service().for_media(media_file) if media_file else None
+    if lyrics is None or not lyrics.synced or not st.session_state.song_start_timestamp:
+        return st.session_state.current_lyrics
+    elapsed = (datetime.now() - st.session_state.song_start_timestamp).total_seconds()
+    current = lyrics.line_at(elapsed)
+    return "  \n".join(
+        f"**{line}**" if index == current and line else line
+        for index, line in enumerate(lyrics.lines)
+    )
 
 def add_to_queue(song_name):
     """Add a song to the queue dynamically without full page refresh, preserving order and uniqueness."""
@@ -298,11 +374,10 @@ def display_mp3_player():
         if st.session_state.audio_playing and st.session_state.current_song and st.session_state.song_start_timestamp:
             song_play_duration = (current_time - st.session_state.song_start_timestamp).total_seconds()
             print(f"Interval check: Song {st.session_state.current_song} has been playing for {song_play_duration:.1f} seconds")
-            
-            # If song has been playing for a while, consider forcing next song
-            if song_play_duration >= st.session_state.estimated_song_duration - 10:  # 10 seconds before estimated end
-                st.session_state.force_next_song = True
-                print("Forcing next song flag set to True")
+
+            # The duration is exact, so only advance once the song has really finished
+            if song_play_duration >= st.session_state.estimated_song_duration:
+                st.session_state.song_ended = True
     
     # If song ended or force_next_song flag is set, handle next steps
     if st.session_state.song_ended or st.session_state.force_next_song:
@@ -338,6 +413,9 @@ def display_mp3_player():
 
     with st.sidebar:
         st.title("Gospel JukeBox ")
+        if get_rendition_cache() is not None:
+            st.checkbox("Data saver", key='data_saver',
+                        help="Stream lower-bitrate audio, starting with the next song.")
 
         # Display Currently Playing Song
         if st.session_state.audio_playing and st.session_state.current_song:
@@ -352,15 +430,19 @@ def display_mp3_player():
                     if st.button("Hide Lyrics" if show_lyrics else "Show Lyrics", key="show_lyrics_btn"):
                         st.session_state['show_lyrics_in_sidebar'] = not show_lyrics
 
-            # Use HTML5 audio element with autoplay, controls, and ended event listener
+            # Use HTML5 audio element with autoplay, controls, and ended event listener.
+            # The source is streamed from the media server so the browser can seek with Range requests.
+            # It may answer with a lower-bitrate rendition for slow clients, so the source has no fixed type.
             audio_html = """
-            <audio id="audio-player" autoplay controls>
-                <source src="data:audio/mpeg;base64,{0}" type="audio/mpeg">
+            <audio id="audio-player" autoplay controls preload="auto">
+                <source src="{0}">
                 Your browser does not support the audio element.
             </audio>
+            {2}
             <script>
                 // Ensure autoplay works
                 const audioPlayer = document.getElementById('audio-player');
+                audioPlayer.volume = {1};  // Loudness normalization gain
                 audioPlayer.play();
                 
                 // Add ended event listener to detect when song actually ends
@@ -376,13 +458,17 @@ def display_mp3_player():
                     window.parent.postMessage({{type: 'streamlit:forceRerun'}}, '*');
                 }});
             </script>
-            """.format(st.session_state.audio_data)
-            st.components.v1.html(audio_html, height=80)
+            """.format(
+                st.session_state.audio_url,
+                st.session_state.get('audio_volume', 1.0),
+                st.session_state.get('audio_waveform') or ""
+            )
+            st.components.v1.html(audio_html, height=140 if st.session_state.get('audio_waveform') else 80)
 
             # Display lyrics in sidebar if requested
             if st.session_state.get('show_lyrics_in_sidebar') and st.session_state.get('current_lyrics'):
                 st.markdown(f"**Lyrics for {st.session_state.current_song.replace('.mp3','')}**")
-                st.markdown(st.session_state.current_lyrics)
+                st.markdown(current_lyrics_markdown())
 
 
         # Navigation Buttons
@@ -593,34 +679,16 @@ def display_music_library():
     mp3_files = load_content()
 
     # Add search functionality
-    search_query = st.text_input("Search songs by title, sheet music label, or note label", "")
+    search_query = st.text_input("Search songs by title, lyrics, sheet music label, or note label", "")
     
     # Filter songs based on search query
     if search_query:
-        # First search by song title
-        filtered_songs = [song for song in mp3_files if search_query.lower() in song.lower()]
-        
-        # Always search by label in the database, regardless of whether we found matches by title
-        conn = sqlite3.connect('Gospel_Jukebox.db')
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT DISTINCT song_name FROM instrument_sheet_music WHERE label LIKE ?", 
-            (f'%{search_query}%',)
-        )
-        label_matches = [f"{row[0]}" for row in cursor.fetchall() if f"{row[0]}" in mp3_files]
-        conn.close()
-        
-        # Also search by note labels in song_notes
-        conn = sqlite3.connect('Gospel_Jukebox.db')
-        cursor = conn.cursor()
-        cursor.execute(
-            "SELECT DISTINCT song_name FROM song_notes WHERE label LIKE ?", (f'%{search_query}%',)
-        )
-        note_matches = [row[0] for row in cursor.fetchall() if row[0] in mp3_files]
-        conn.close()
-        
-        # Combine results from both searches and remove duplicates
-        filtered_songs = list(set(filtered_songs + label_matches + note_matches))
+        # One ranked full-text query over titles, lyrics, labels and notes
+        available_songs = set(mp3_files)
+        results = [(song, kinds) for song, kinds in search_library(search_query) if song in available_songs]
+        filtered_songs = [song for song, _ in results]
+        label_matches = [song for song, kinds in results if 'label' in kinds]
+        note_matches = [song for song, kinds in results if 'note' in kinds]
         
         # Display which songs were found by label if any were found this way
         if label_matches and not any(search_query.lower() in song.lower() for song in label_matches):
@@ -632,7 +700,7 @@ def display_music_library():
         filtered_songs = mp3_files
     
     if not filtered_songs and search_query:
-        st.warning(f"No songs found matching '{search_query}' in titles or labels")
+        st.warning(f"No songs found matching '{search_query}' in titles, lyrics, labels or notes")
         # Keep filtered_songs empty to show the warning, but still allow selection from all songs
         filtered_songs = mp3_files  # Show all songs if no matches
     
@@ -782,12 +850,8 @@ def display_music_library():
                 is_admin = st.session_state.get('is_admin', False)
 
                 # --- Display All Existing Notes --- 
-                conn = sqlite3.connect('Gospel_Jukebox.db')
-                cursor = conn.cursor()
                 # Fetch username, label, and notes content
-                cursor.execute("SELECT username, label, notes FROM song_notes WHERE song_name = ? ORDER BY username, label", (current_song_name,))
-                all_notes = cursor.fetchall()
-                conn.close()
+                all_notes = get_db_pool().fetch_all("SELECT username, label, notes FROM song_notes WHERE song_name = ? ORDER BY username, label", (current_song_name,))
 
                 if all_notes:
                     # Prepare filtered notes by label
@@ -844,26 +908,22 @@ def display_music_library():
                             if not new_note_label.strip() or not new_note_content.strip():
                                 st.warning("Both Label and Content are required to save a new note.")
                             else:
-                                conn = sqlite3.connect('Gospel_Jukebox.db')
-                                cursor = conn.cursor()
-                                # Check if a note with the same user and label already exists for this song
-                                cursor.execute("SELECT 1 FROM song_notes WHERE song_name = ? AND username = ? AND label = ?", 
-                                               (current_song_name, current_username, new_note_label))
-                                exists = cursor.fetchone()
-                                if exists:
+                                # One statement checks and inserts, so concurrent saves can't race:
+                                # a note with the same song, user and label (the primary key) is left alone
+                                inserted = get_db_pool().execute(
+                                    "INSERT INTO song_notes (song_name, username, label, notes, last_updated) VALUES (?, ?, ?, ?, ?) "
+                                    "ON CONFLICT(song_name, username, label) DO NOTHING",
+                                    (current_song_name, current_username, new_note_label, new_note_content, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+                                )
+                                if not inserted:
                                     st.error(f"You already have a note with the label '{new_note_label}' for this song. Please choose a different label or edit the existing one.")
                                 else:
-                                    cursor.execute("INSERT INTO song_notes (song_name, username, label, notes, last_updated) VALUES (?, ?, ?, ?, ?)",
-                                        (current_song_name, current_username, new_note_label, new_note_content, datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
-                                    )
-                                    conn.commit()
                                     st.success(f"New note with label '{new_note_label}' saved!")
                                     # Clear form fields after successful submission is tricky with st.form, 
                                     # usually requires rerun or session state management.
                                     # For simplicity, we just show success and let rerun handle refresh.
                                     try: st.rerun() # Refresh to show the new note in the dropdown
                                     except: pass 
-                                conn.close()
                 elif not all_notes: # Only show if not logged in AND no notes exist
                      st.info("Log in to add notes for this song.")
 
@@ -871,11 +931,7 @@ def display_music_library():
                 if is_admin:
                     st.markdown("---")
                     st.markdown("#### All Notes for this Song (Admin Management)")
-                    conn = sqlite3.connect('Gospel_Jukebox.db')
-                    cursor = conn.cursor()
-                    cursor.execute("SELECT username, label, notes, last_updated FROM song_notes WHERE song_name = ?", (current_song_name,))
-                    note_entries = cursor.fetchall()
-                    conn.close()
+                    note_entries = get_db_pool().fetch_all("SELECT username, label, notes, last_updated FROM song_notes WHERE song_name = ?", (current_song_name,))
                     if note_entries:
                         for note_user, note_label, note_text, note_time in note_entries:
                             # Use unique keys for delete buttons within the loop
@@ -889,11 +945,7 @@ def display_music_library():
                                 st.write(f"{note_text}")
                             with col_n4:
                                 if st.button(f"Delete", key=delete_key):
-                                    conn = sqlite3.connect('Gospel_Jukebox.db')
-                                    cursor = conn.cursor()
-                                    cursor.execute("DELETE FROM song_notes WHERE song_name = ? AND username = ? AND label = ?", (current_song_name, note_user, note_label))
-                                    conn.commit()
-                                    conn.close()
+                                    get_db_pool().execute("DELETE FROM song_notes WHERE song_name = ? AND username = ? AND label = ?", (current_song_name, note_user, note_label))
                                     st.success(f"Note for user '{note_user}', label '{note_label}' deleted!")
                                     try: 
                                         st.rerun() # Refresh the page to reflect deletion
@@ -917,14 +969,10 @@ def display_music_library():
                     )
                 with col2:
                     # Fetch sheet music entries with creator information
-                    conn = sqlite3.connect('Gospel_Jukebox.db')
-                    cursor = conn.cursor()
-                    cursor.execute(
+                    sheet_music_entries = get_db_pool().fetch_all(
                         "SELECT label, creator_username FROM instrument_sheet_music WHERE song_name = ? AND instrument = ?",
                         (st.session_state.current_song, st.session_state.selected_instrument)
                     )
-                    sheet_music_entries = cursor.fetchall()
-                    conn.close()
                     
                     # Initialize unique_labels and label_to_creator
                     unique_labels = []
@@ -963,14 +1011,11 @@ def display_music_library():
                 
                 # Display sheet music if available
                 if selected_label:
-                    conn = sqlite3.connect('Gospel_Jukebox.db')
-                    cursor = conn.cursor()
-                    cursor.execute(
+                    row = get_db_pool().fetch_one(
                         "SELECT file_path FROM instrument_sheet_music WHERE song_name = ? AND instrument = ? AND label = ?",
                         (st.session_state.current_song, st.session_state.selected_instrument, selected_label)
                     )
-                    file_path = cursor.fetchone()[0] if cursor.fetchone() else None
-                    conn.close()
+                    file_path = row[0] if row else None
                     
                     if file_path and os.path.exists(file_path):
                         st.image(file_path, caption=f"{st.session_state.selected_instrument} - {selected_label}", use_column_width=True)
@@ -1003,14 +1048,11 @@ def display_music_library():
                         # Make sure unique_labels is defined in this code path
                         if 'unique_labels' not in locals():
                             # Fetch labels if not already done
-                            conn = sqlite3.connect('Gospel_Jukebox.db')
-                            cursor = conn.cursor()
-                            cursor.execute(
+                            label_rows = get_db_pool().fetch_all(
                                 "SELECT label FROM instrument_sheet_music WHERE song_name = ? AND instrument = ?",
                                 (st.session_state.current_song, st.session_state.selected_instrument)
                             )
-                            unique_labels = [row[0] for row in cursor.fetchall() if row[0]]
-                            conn.close()
+                            unique_labels = [row[0] for row in label_rows if row[0]]
                         
                         # Prevent duplicate label for this song/instrument
                         if new_label.strip() in unique_labels:
@@ -1029,30 +1071,22 @@ def display_music_library():
                                         'file_path': "",
                                         'creator_username': creator
                                     }
-                                    supabase_client.table('instrument_sheet_music').insert(data).execute()
+                                    get_supabase_client().table('instrument_sheet_music').insert(data).execute()
                                     st.success(f"Sheet music type '{new_label.strip()}' added to Supabase!")
                                 except Exception as e:
                                     st.error(f"Supabase error: {e}")
                                     # Fall back to SQLite if Supabase fails
                                     st.warning("Falling back to local database...")
-                                    conn = sqlite3.connect('Gospel_Jukebox.db')
-                                    cursor = conn.cursor()
-                                    cursor.execute(
+                                    get_db_pool().execute(
                                         "INSERT OR IGNORE INTO instrument_sheet_music (song_name, instrument, label, file_path, creator_username) VALUES (?, ?, ?, ?, ?)",
                                         (st.session_state.current_song, st.session_state.selected_instrument, new_label.strip(), "", creator)
                                     )
-                                    conn.commit()
-                                    conn.close()
                             else:
                                 # Use SQLite
-                                conn = sqlite3.connect('Gospel_Jukebox.db')
-                                cursor = conn.cursor()
-                                cursor.execute(
+                                get_db_pool().execute(
                                     "INSERT OR IGNORE INTO instrument_sheet_music (song_name, instrument, label, file_path, creator_username) VALUES (?, ?, ?, ?, ?)",
                                     (st.session_state.current_song, st.session_state.selected_instrument, new_label.strip(), "", creator)
                                 )
-                                conn.commit()
-                                conn.close()
                                 st.success(f"Sheet music type '{new_label.strip()}' added!")
                             
                             # Try to rerun, otherwise notify and ask user to refresh manually
@@ -1065,14 +1099,10 @@ def display_music_library():
                 
                 # Remove selected sheet music - moved outside the Add Type button logic
                 if 'selected_label' in locals() and st.button(f"🗑️ Remove '{selected_label}' Sheet Music", key="remove_sheet_music_btn"):
-                    conn = sqlite3.connect('Gospel_Jukebox.db')
-                    cursor = conn.cursor()
-                    cursor.execute(
+                    get_db_pool().execute(
                         "DELETE FROM instrument_sheet_music WHERE song_name = ? AND instrument = ? AND label = ?",
                         (st.session_state.current_song, st.session_state.selected_instrument, selected_label)
                     )
-                    conn.commit()
-                    conn.close()
                     # Delete file from disk
                     if 'label_to_path' in locals() and selected_label in label_to_path:
                         try:
@@ -1139,30 +1169,22 @@ def display_music_library():
                                                 'file_path': save_path,
                                                 'creator_username': creator
                                             }
-                                            supabase_client.table('instrument_sheet_music').upsert(data).execute()
+                                            get_supabase_client().table('instrument_sheet_music').upsert(data).execute()
                                             st.success("Sheet music uploaded and saved to Supabase!")
                                         except Exception as e:
                                             st.error(f"Supabase error: {e}")
                                             # Fall back to SQLite
-                                            conn = sqlite3.connect('Gospel_Jukebox.db')
-                                            cursor = conn.cursor()
-                                            cursor.execute(
+                                            get_db_pool().execute(
                                                 "INSERT OR REPLACE INTO instrument_sheet_music (song_name, instrument, label, file_path, creator_username) VALUES (?, ?, ?, ?, ?)",
                                                 (st.session_state.current_song, st.session_state.selected_instrument, label_input.strip(), save_path, creator)
                                             )
-                                            conn.commit()
-                                            conn.close()
                                             st.success("Sheet music uploaded and saved to local database!")
                                     else:
                                         # Use SQLite
-                                        conn = sqlite3.connect('Gospel_Jukebox.db')
-                                        cursor = conn.cursor()
-                                        cursor.execute(
+                                        get_db_pool().execute(
                                             "INSERT OR REPLACE INTO instrument_sheet_music (song_name, instrument, label, file_path, creator_username) VALUES (?, ?, ?, ?, ?)",
                                             (st.session_state.current_song, st.session_state.selected_instrument, label_input.strip(), save_path, creator)
                                         )
-                                        conn.commit()
-                                        conn.close()
                                         st.success("Sheet music uploaded and saved to database!")
                                     
                                     # Try to rerun, otherwise notify and ask user to refresh manually
@@ -1194,11 +1216,7 @@ def display_voting_page():
         vote_amount = st.slider("Rate this song (1-100 pennies):", min_value=1, max_value=100)
         if st.button("Submit Vote"):
             # Store the vote in the database
-            conn = sqlite3.connect('Gospel_Jukebox.db')
-            cursor = conn.cursor()
-            cursor.execute("INSERT INTO votes (song_name, vote) VALUES (?, ?)", (song_to_vote, vote_amount))
-            conn.commit()
-            conn.close()
+            get_db_pool().execute("INSERT INTO votes (song_name, vote) VALUES (?, ?)", (song_to_vote, vote_amount))
 
             # Open Cash App link in a new tab
             cash_app_link = f"https://cash.app/$SolidBuildersInc?amount={vote_amount}"
@@ -1206,26 +1224,29 @@ def display_voting_page():
 
             st.success(f"Thank you for your vote! Please confirm your payment of {vote_amount} cents via Cash App.")
 
+@st.cache_data(max_entries=16, show_spinner=False)
+def get_results_chart(tally_hash, _results):
+    """Render the results pie chart once per tally version (keyed by tally_hash)."""
+    return render_pie_chart(_results)
+
 def display_results_page():
     """Display the voting results as a pie chart."""
     st.header("Vote Results")
 
-    # Fetch votes from the database
-    conn = sqlite3.connect('Gospel_Jukebox.db')
-    cursor = conn.cursor()
-    cursor.execute("SELECT song_name, SUM(vote) FROM votes GROUP BY song_name")
-    results = cursor.fetchall()
-    conn.close()
+    # Read the precomputed per-song totals (one row per song, however many votes)
+    results = get_db_pool().fetch_all("SELECT song_name, total FROM vote_totals WHERE total > 0 ORDER BY total DESC")
 
     if results:
-        song_names = [row[0] for row in results]
-        votes = [row[1] for row in results]
-
-        # Create a pie chart
-        plt.figure(figsize=(10, 6))
-        plt.pie(votes, labels=song_names, autopct='%1.1f%%', startangle=140)
-        plt.title("Song Voting Results")
-        st.pyplot(plt)
+        # The chart is only re-rendered when the tally changes
+        st.image(get_results_chart(tally_digest(results), results), use_column_width=True)
+
+        # Daily rollup for the last 30 days
+        daily = get_db_pool().fetch_all(
+            "SELECT day, SUM(total) FROM vote_daily_totals WHERE day >= date('now', '-30 days') GROUP BY day ORDER BY day"
+        )
+        if daily:
+            st.subheader("Votes per Day (last 30 days)")
+            st.bar_chart({"Day": [row[0] for row in daily], "Votes": [row[1] for row in daily]}, x="Day", y="Votes")
     else:
         st.write("No votes have been cast yet.")
 
@@ -1262,12 +1283,8 @@ def login_page():
         if st.button("Login"):
             if username and password:
                 # Check credentials against database
-                conn = sqlite3.connect('Gospel_Jukebox.db')
-                cursor = conn.cursor()
-                cursor.execute("SELECT username, is_admin FROM users WHERE username = ? AND password = ?", 
-                              (username, password))
-                user = cursor.fetchone()
-                conn.close()
+                user = get_db_pool().fetch_one("SELECT username, is_admin FROM users WHERE username = ? AND password = ?", 
+                                               (username, password))
                 
                 if user:
                     st.session_state.logged_in = True
@@ -1344,16 +1361,12 @@ def main():
             new_label = st.sidebar.text_input('User Label (optional)', key='admin_add_label_input_sidebar')
             if st.sidebar.button('Create User', key='admin_create_user_btn_sidebar'):
                 if new_user and new_pass:
-                    conn = sqlite3.connect('Gospel_Jukebox.db')
-                    cursor = conn.cursor()
-                    cursor.execute("SELECT username FROM users WHERE username = ?", (new_user,))
-                    if cursor.fetchone():
+                    # INSERT OR IGNORE makes the existence check and insert a single statement
+                    created = get_db_pool().execute("INSERT OR IGNORE INTO users (username, password, is_admin) VALUES (?, ?, 0)", (new_user, new_pass))
+                    if not created:
                         st.sidebar.error('Username already exists.')
                     else:
-                        cursor.execute("INSERT INTO users (username, password, is_admin) VALUES (?, ?, 0)", (new_user, new_pass))
-                        conn.commit()
                         st.sidebar.success('User created!')
-                    conn.close()
                 else:
                     st.sidebar.warning('Please enter both username and password.')
         # Reset login checkbox when navigating to other pages
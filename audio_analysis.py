@@ -0,0 +1,355 @@
+"""Offline audio analysis for the song library.
+
+Decodes every track under mp3_files/ and data/songs/*/ once, in a process
+pool, and stores tempo, a key estimate, loudness (integrated LUFS, RMS and
+peak in dBFS) and a downsampled waveform envelope in a columnar cache keyed
+by file hash. The players only ever read that cache; nothing on a request
+path decodes audio.
+
+Usage: python audio_analysis.py [root ...] [--workers N] [--force]
+"""
+import os
+import sys
+import glob
+import hashlib
+import logging
+import argparse
+import threading
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_ROOTS = [os.path.join(BASE_DIR, "mp3_files"), os.path.join(BASE_DIR, "data", "songs")]
+FEATURES_PATH = os.path.join(BASE_DIR, "cache", "analysis", "features.npz")
+
+AUDIO_EXTENSIONS = (".mp3", ".wav", ".ogg", ".flac", ".m4a")
+
+# Points in the stored waveform envelope (max |sample| per bucket)
+ENVELOPE_POINTS = 1000
+
+# Bump when a feature's definition changes so cached rows are recomputed
+ANALYSIS_VERSION = 1
+
+# Krumhansl-Kessler key profiles, starting at C
+MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+PITCH_CLASSES = ["C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B"]
+
+# Columns of the feature cache; envelope is a (rows, ENVELOPE_POINTS) matrix
+SCALAR_COLUMNS = {
+    "path": "U",
+    "digest": "U40",
+    "mtime_ns": np.int64,
+    "size": np.int64,
+    "version": np.int16,
+    "duration": np.float32,
+    "sample_rate": np.int32,
+    "tempo": np.float32,
+    "key": "U8",
+    "lufs": np.float32,
+    "rms_db": np.float32,
+    "peak_db": np.float32,
+}
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """Return the SHA-1 of a file's contents."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def find_audio_files(roots):
+    """List the audio files directly in each root and in its immediate song folders."""
+    paths = set()
+    for root in roots:
+        for pattern in ("*", os.path.join("*", "*")):
+            for path in glob.glob(os.path.join(root, pattern)):
+                if path.lower().endswith(AUDIO_EXTENSIONS) and os.path.isfile(path):
+                    paths.add(os.path.abspath(path))
+    return sorted(paths)
+
+
+def load_audio(path):
+    """Decode a file at its native rate; returns (samples of shape (channels, n), sample_rate)."""
+    import librosa
+
+    samples, sample_rate = librosa.load(path, sr=None, mono=False)
+    return np.atleast_2d(samples).astype(np.float32, copy=False), sample_rate
+
+
+def _biquad(b, a):
+    return np.array(b) / a[0], np.array(a) / a[0]
+
+
+def k_weighting(sample_rate):
+    """Return the two BS.1770 K-weighting biquads (shelf, high-pass) for a sample rate."""
+    # Stage 1: +4 dB high shelf around 1.5 kHz (head diffraction)
+    gain_db, q, fc = 4.0, 1 / np.sqrt(2), 1500.0
+    big_a = 10 ** (gain_db / 40)
+    w0 = 2 * np.pi * fc / sample_rate
+    alpha = np.sin(w0) / (2 * q)
+    cos_w0 = np.cos(w0)
+    shelf = _biquad(
+        [
+            big_a * ((big_a + 1) + (big_a - 1) * cos_w0 + 2 * np.sqrt(big_a) * alpha),
+            -2 * big_a * ((big_a - 1) + (big_a + 1) * cos_w0),
+            big_a * ((big_a + 1) + (big_a - 1) * cos_w0 - 2 * np.sqrt(big_a) * alpha),
+        ],
+        [
+            (big_a + 1) - (big_a - 1) * cos_w0 + 2 * np.sqrt(big_a) * alpha,
+            2 * ((big_a - 1) - (big_a + 1) * cos_w0),
+            (big_a + 1) - (big_a - 1) * cos_w0 - 2 * np.sqrt(big_a) * alpha,
+        ],
+    )
+    # Stage 2: RLB high-pass around 38 Hz
+    q, fc = 0.5, 38.0
+    w0 = 2 * np.pi * fc / sample_rate
+    alpha = np.sin(w0) / (2 * q)
+    high_pass = _biquad([1.0, -2.0, 1.0], [1 + alpha, -2 * np.cos(w0), 1 - alpha])
+    return shelf, high_pass
+
+
+def integrated_loudness(samples, sample_rate, block_seconds=0.4, overlap=0.75):
+    """Return the gated integrated loudness (LUFS) of (channels, n) samples per ITU-R BS.1770.
+
+    Every gating block's mean square comes from one cumulative sum, so the
+    whole measurement is a handful of vectorized passes over the samples.
+    Returns -inf for silence or audio shorter than one block.
+    """
+    from scipy.signal import lfilter
+
+    samples = np.atleast_2d(samples)
+    (b1, a1), (b2, a2) = k_weighting(sample_rate)
+    weighted = lfilter(b2, a2, lfilter(b1, a1, samples, axis=-1), axis=-1)
+
+    block = int(round(block_seconds * sample_rate))
+    step = max(1, int(round(block * (1 - overlap))))
+    if weighted.shape[-1] < block:
+        return float("-inf")
+    energy = np.concatenate(
+        [np.zeros((weighted.shape[0], 1)), np.cumsum(weighted.astype(np.float64) ** 2, axis=-1)], axis=-1
+    )
+    starts = np.arange(0, weighted.shape[-1] - block + 1, step)
+    # Channel weights are 1.0 for the front channels the library contains
+    block_power = ((energy[:, starts + block] - energy[:, starts]) / block).sum(axis=0)
+
+    with np.errstate(divide="ignore"):
+        block_loudness = -0.691 + 10 * np.log10(block_power)
+    gated = block_power[block_loudness > -70.0]
+    if gated.size == 0:
+        return float("-inf")
+    relative_gate = -0.691 + 10 * np.log10(gated.mean()) - 10.0
+    gated = block_power[(block_loudness > -70.0) & (block_loudness > relative_gate)]
+    if gated.size == 0:
+        return float("-inf")
+    return float(-0.691 + 10 * np.log10(gated.mean()))
+
+
+def waveform_envelope(mono, points=ENVELOPE_POINTS):
+    """Return max |sample| over points equal buckets, as float16 in [0, 1]."""
+    if mono.size == 0:
+        return np.zeros(points, dtype=np.float16)
+    bucket = -(-mono.size // points)
+    padded = np.zeros(bucket * points, dtype=np.float32)
+    padded[:mono.size] = np.abs(mono)
+    return np.clip(padded.reshape(points, bucket).max(axis=1), 0.0, 1.0).astype(np.float16)
+
+
+def estimate_key(mono, sample_rate):
+    """Return the best-matching key name ("G major", "E minor") from the mean chroma."""
+    import librosa
+
+    chroma = librosa.feature.chroma_cqt(y=mono, sr=sample_rate).mean(axis=1)
+    profiles = np.stack(
+        [np.roll(MAJOR_PROFILE, tonic) for tonic in range(12)] + [np.roll(MINOR_PROFILE, tonic) for tonic in range(12)]
+    )
+    # Pearson correlation of the chroma against all 24 rotated profiles at once
+    profiles = profiles - profiles.mean(axis=1, keepdims=True)
+    centered = chroma - chroma.mean()
+    scores = profiles @ centered / (np.linalg.norm(profiles, axis=1) * (np.linalg.norm(centered) or 1.0))
+    best = int(np.argmax(scores))
+    return f"{PITCH_CLASSES[best % 12]} {'major' if best < 12 else 'minor'}"
+
+
+def estimate_tempo(mono, sample_rate):
+    """Return the global tempo in BPM."""
+    import librosa
+
+    tempo, _ = librosa.beat.beat_track(y=mono, sr=sample_rate)
+    return float(np.atleast_1d(tempo)[0])
+
+
+def analyze_file(path):
+    """Decode one file and compute every feature; runs in a worker process."""
+    stat_result = os.stat(path)
+    samples, sample_rate = load_audio(path)
+    mono = samples.mean(axis=0)
+    peak = float(np.abs(samples).max()) if samples.size else 0.0
+    rms = float(np.sqrt(np.mean(mono.astype(np.float64) ** 2))) if mono.size else 0.0
+    with np.errstate(divide="ignore"):
+        return {
+            "path": path,
+            "digest": file_digest(path),
+            "mtime_ns": stat_result.st_mtime_ns,
+            "size": stat_result.st_size,
+            "version": ANALYSIS_VERSION,
+            "duration": mono.size / sample_rate,
+            "sample_rate": sample_rate,
+            "tempo": estimate_tempo(mono, sample_rate),
+            "key": estimate_key(mono, sample_rate),
+            "lufs": integrated_loudness(samples, sample_rate),
+            "rms_db": float(20 * np.log10(rms)),
+            "peak_db": float(20 * np.log10(peak)),
+            "envelope": waveform_envelope(mono),
+        }
+
+
+class FeatureStore:
+    """Columnar cache of per-track features stored as one .npz of parallel arrays.
+
+    Rows are looked up by path and trusted while the file's mtime and size
+    match; a file whose contents hash to an already analyzed digest (a copy
+    or a rename) reuses that row's features instead of being decoded again.
+    """
+
+    def __init__(self, path=FEATURES_PATH):
+        """Load the cache file if it exists."""
+        self.path = path
+        self.lock = threading.Lock()
+        self.rows = {}  # path -> record
+        self.load()
+
+    def load(self):
+        """Read every column and index the rows by path."""
+        try:
+            with np.load(self.path, allow_pickle=False) as data:
+                columns = {name: data[name] for name in data.files}
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable feature cache {self.path}: {e}")
+            return
+        names = list(SCALAR_COLUMNS) + ["envelope"]
+        if any(name not in columns for name in names):
+            logger.info(f"Feature cache {self.path} has an older layout; it will be rebuilt")
+            return
+        rows = {}
+        for i, path in enumerate(columns["path"]):
+            record = {name: columns[name][i].item() for name in SCALAR_COLUMNS}
+            record["envelope"] = columns["envelope"][i]
+            rows[str(path)] = record
+        with self.lock:
+            self.rows = rows
+
+    def save(self):
+        """Write all rows as columns, atomically."""
+        with self.lock:
+            records = list(self.rows.values())
+        columns = {
+            name: np.array([record[name] for record in records], dtype=dtype if dtype != "U" else str)
+            for name, dtype in SCALAR_COLUMNS.items()
+        }
+        columns["envelope"] = (
+            np.stack([record["envelope"] for record in records]).astype(np.float16)
+            if records else np.zeros((0, ENVELOPE_POINTS), dtype=np.float16)
+        )
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.tmp.npz"
+        np.savez(tmp_path, **columns)
+        os.replace(tmp_path, self.path)
+
+    def get(self, path):
+        """Return the features of a file, or None when it was not analyzed or has changed since."""
+        key = os.path.abspath(path)
+        with self.lock:
+            record = self.rows.get(key)
+        if record is None:
+            return None
+        try:
+            stat_result = os.stat(key)
+        except OSError:
+            return None
+        if record["mtime_ns"] != stat_result.st_mtime_ns or record["size"] != stat_result.st_size:
+            return None
+        return record
+
+    def is_current(self, path):
+        """True when path has an up-to-date row, reusing one with the same digest if possible."""
+        record = self.get(path)
+        if record is not None and record["version"] == ANALYSIS_VERSION:
+            return True
+        key = os.path.abspath(path)
+        digest = file_digest(key)
+        with self.lock:
+            twin = next(
+                (row for row in self.rows.values() if row["digest"] == digest and row["version"] == ANALYSIS_VERSION),
+                None
+            )
+        if twin is None:
+            return False
+        stat_result = os.stat(key)
+        self.put(dict(twin, path=key, mtime_ns=stat_result.st_mtime_ns, size=stat_result.st_size))
+        return True
+
+    def put(self, record):
+        """Add or replace the row of record["path"]."""
+        with self.lock:
+            self.rows[record["path"]] = record
+
+    def prune(self, live_paths):
+        """Drop rows for files that are no longer in the library."""
+        live = set(live_paths)
+        with self.lock:
+            stale = [path for path in self.rows if path not in live]
+            for path in stale:
+                del self.rows[path]
+        return len(stale)
+
+
+def analyze_library(roots=None, workers=None, force=False, store=None):
+    """Analyze every new or changed track below roots; returns (analyzed, failed) counts."""
+    store = store or FeatureStore()
+    paths = find_audio_files(roots or DEFAULT_ROOTS)
+    todo = [path for path in paths if force or not store.is_current(path)]
+    removed = store.prune(paths)
+    logger.info(f"{len(paths)} tracks, {len(todo)} to analyze, {removed} stale rows dropped")
+
+    analyzed = failed = 0
+    if todo:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = {pool.submit(analyze_file, path): path for path in todo}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    store.put(future.result())
+                    analyzed += 1
+                    logger.info(f"Analyzed {os.path.relpath(path, BASE_DIR)}")
+                except Exception as e:
+                    failed += 1
+                    logger.warning(f"Could not analyze {path}: {e}")
+    if todo or removed:
+        store.save()
+    return analyzed, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("roots", nargs="*", default=DEFAULT_ROOTS, help="directories holding tracks or song folders")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--force", action="store_true", help="re-analyze tracks that are already cached")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    analyzed, failed = analyze_library(args.roots, args.workers, args.force)
+    print(f"Analyzed {analyzed} tracks, {failed} failed; cache at {FEATURES_PATH}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
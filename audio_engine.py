@@ -0,0 +1,251 @@
+import time
+import logging
+import threading
+
+import flet as ft
+
+logger = logging.getLogger(__name__)
+
+# Audio state_changed values mapped to the engine's lifecycle states
+EVENT_STATES = {
+    "play": "playing",
+    "playing": "playing",
+    "pause": "paused",
+    "paused": "paused",
+    "ended": "ended",
+    "completed": "ended",
+}
+
+# Volume steps per second while crossfading
+FADE_STEPS_PER_SECOND = 20
+
+
+class AudioEngine:
+    """Double-buffered player built on two reusable ft.Audio slots.
+
+    Both controls live in page.overlay, so replacing the visible content never
+    orphans a playing element and nothing has to walk the control tree to
+    find audio. One slot is active; the other can be handed the next track
+    with preload() so it is already buffered when load() asks for it, at
+    which point the slots swap and playback starts without fetching anything.
+    With crossfade set the outgoing slot fades out while the new one fades
+    in. Only the active slot's events reach on_state_changed, and a session
+    never holds more than two controls. Each slot carries its track's
+    loudness gain (a 0.0 - 1.0 multiplier kept in the control's data) which
+    scales the engine volume.
+    """
+
+    def __init__(self, page, on_state_changed=None, volume=1.0, crossfade=0.0):
+        """on_state_changed(e) receives the active control's events after the engine has seen them."""
+        self.page = page
+        self.on_state_changed = on_state_changed
+        self.volume = volume
+        self.crossfade = crossfade
+        self.audio = None
+        self.src = None
+        self.state = "idle"  # idle, loaded, playing, paused, ended, released
+        self.standby = None
+        self.standby_src = None
+        self.fade_from = None
+        self.fade_timer = None
+        self.lock = threading.Lock()
+
+    def _level(self, audio):
+        """Return a slot's playback volume: the engine volume scaled by its track gain."""
+        return self.volume * (audio.data if audio.data is not None else 1.0)
+
+    def _create(self, src, gain):
+        """Add a new audio slot to the page overlay."""
+        audio = ft.Audio(src=src, autoplay=False, volume=self.volume * gain, data=gain)
+        audio.on_state_changed = lambda e, audio=audio: self._state_changed(audio, e)
+        self.page.overlay.append(audio)
+        self.page.update()
+        return audio
+
+    def _point(self, audio, src, gain):
+        """Give an existing slot a new source, paused at the start."""
+        audio.src = src
+        audio.autoplay = False
+        audio.data = gain
+        audio.volume = self._level(audio)
+        audio.update()
+
+    def preload(self, src, gain=1.0):
+        """Buffer src in the standby slot so a later load(src) starts instantly."""
+        if src == self.standby_src or (self.audio is not None and src == self.src):
+            return
+        self._finish_fade()
+        if self.standby is None:
+            self.standby = self._create(src, gain)
+        else:
+            self._call(self.standby, "pause")
+            self._point(self.standby, src, gain)
+        self.standby_src = src
+
+    def load(self, src, gain=1.0):
+        """Make src the active track (paused at the start) and return its audio control.
+
+        A preloaded src swaps the slots instead of loading anything. When
+        crossfade is set and the outgoing track is playing, it keeps playing
+        until play() fades it out; otherwise it is paused here.
+        """
+        self._finish_fade()
+        outgoing = self.audio
+        if outgoing is not None and src == self.standby_src:
+            self.audio, self.standby = self.standby, outgoing
+            self.standby_src = self.src
+            if self.audio.data != gain:
+                self.audio.data = gain
+                self.audio.volume = self._level(self.audio)
+                self.audio.update()
+        elif self.audio is None:
+            self.audio = self._create(src, gain)
+            outgoing = None
+        else:
+            self._call(self.audio, "pause")
+            self._point(self.audio, src, gain)
+            if src == self.standby_src:
+                self.standby_src = None
+            outgoing = None
+
+        if outgoing is not None:
+            if self.crossfade > 0 and self.state == "playing":
+                self.fade_from = outgoing
+            else:
+                self._call(outgoing, "pause")
+                self._call(outgoing, "seek", 0)
+        self.src = src
+        self.state = "loaded"
+        return self.audio
+
+    def play(self):
+        """Start (or restart) the active track, fading from the previous one if one is pending."""
+        if self.audio is None:
+            return
+        if self.fade_from is not None:
+            self.audio.volume = 0.0
+            self.audio.update()
+        if self._call(self.audio, "play"):
+            self.state = "playing"
+        if self.fade_from is not None:
+            self._start_fade()
+
+    def resume(self):
+        """Continue a paused track."""
+        if self.audio is not None and self._call(self.audio, "resume"):
+            self.state = "playing"
+
+    def pause(self):
+        """Pause playback, keeping the position."""
+        self._finish_fade()
+        if self.audio is not None and self.state == "playing" and self._call(self.audio, "pause"):
+            self.state = "paused"
+
+    def stop(self):
+        """Pause and rewind; the controls and their buffered sources are kept for reuse."""
+        self._finish_fade()
+        if self.audio is None or self.state in ("idle", "released"):
+            return
+        self._call(self.audio, "pause")
+        self._call(self.audio, "seek", 0)
+        self.state = "loaded"
+
+    def release(self):
+        """Stop and free the buffered sources; the next load() fetches them again."""
+        self._finish_fade()
+        for audio in (self.audio, self.standby):
+            if audio is not None:
+                self._call(audio, "pause")
+                self._call(audio, "release")
+        self.standby_src = None
+        if self.audio is not None:
+            self.state = "released"
+
+    def seek(self, position_ms):
+        """Jump to a position in the current track."""
+        if self.audio is not None:
+            self._call(self.audio, "seek", int(position_ms))
+
+    def set_volume(self, volume):
+        """Change the playback volume (0.0 - 1.0)."""
+        self._finish_fade()
+        self.volume = volume
+        if self.audio is not None:
+            self.audio.volume = self._level(self.audio)
+            self.audio.update()
+
+    def get_current_position(self):
+        """Return the playback position in milliseconds (0 when nothing is loaded)."""
+        if self.audio is None:
+            return 0
+        return self.audio.get_current_position() or 0
+
+    def get_duration(self):
+        """Return the track duration in milliseconds (0 when unknown)."""
+        if self.audio is None:
+            return 0
+        return self.audio.get_duration() or 0
+
+    @property
+    def is_playing(self):
+        return self.state == "playing"
+
+    def _start_fade(self):
+        """Ramp the active slot up and the outgoing slot down over crossfade seconds."""
+        steps = max(1, int(self.crossfade * FADE_STEPS_PER_SECOND))
+        incoming, outgoing = self.audio, self.fade_from
+        incoming_level, outgoing_level = self._level(incoming), self._level(outgoing)
+
+        def run():
+            for step in range(1, steps + 1):
+                if self.fade_from is not outgoing:
+                    return  # Cancelled by _finish_fade
+                level = step / steps
+                incoming.volume = incoming_level * level
+                outgoing.volume = outgoing_level * (1.0 - level)
+                try:
+                    incoming.update()
+                    outgoing.update()
+                except Exception as e:
+                    logger.warning(f"Crossfade step failed: {e}")
+                    break
+                time.sleep(1.0 / FADE_STEPS_PER_SECOND)
+            self._finish_fade()
+
+        self.fade_timer = threading.Thread(target=run, name="crossfade", daemon=True)
+        self.fade_timer.start()
+
+    def _finish_fade(self):
+        """Settle any crossfade: the outgoing slot is paused and the active one at its full level."""
+        with self.lock:
+            outgoing, self.fade_from = self.fade_from, None
+            self.fade_timer = None
+        if outgoing is None:
+            return
+        self._call(outgoing, "pause")
+        self._call(outgoing, "seek", 0)
+        if self.audio is not None and self.audio.volume != self._level(self.audio):
+            self.audio.volume = self._level(self.audio)
+            try:
+                self.audio.update()
+            except Exception as e:
+                logger.warning(f"Could not restore volume: {e}")
+
+    def _call(self, audio, method, *args):
+        """Invoke a control method, logging instead of raising; returns True on success."""
+        try:
+            getattr(audio, method)(*args)
+            return True
+        except Exception as e:
+            logger.warning(f"Audio {method} failed: {e}")
+            return False
+
+    def _state_changed(self, audio, e):
+        # Events from the standby or a fading-out slot say nothing about the current track
+        if audio is not self.audio:
+            return
+        state = EVENT_STATES.get(str(e.data).lower())
+        if state is not None:
+            self.state = state
+        if self.on_state_changed is not None:
+            self.on_state_changed(e)
@@ -0,0 +1,105 @@
+"""Import-time profile of the app scripts, checked against a budget.
+
+Extracts each script's module-level import statements (without running any
+page code), executes them in a fresh interpreter under `python -X importtime`
+and reports the slowest top-level imports. Exits with status 1 when a
+script's total import time exceeds its budget.
+
+Usage: python benchmarks/import_profile.py [script.py ...] [--budget-ms 1500] [--top 10] [--runs 3]
+"""
+import os
+import re
+import ast
+import sys
+import argparse
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_SCRIPTS = [
+    "Gospel_JukeBox.py",
+    "Streamlit_Gospel_JukeBox_db.py",
+    "Streamlit_Gospel_JukeBox_Supabase_db.py",
+    "main.py",
+]
+
+# Cold-start budgets in milliseconds for all of a script's module-level imports
+DEFAULT_BUDGETS_MS = {
+    "Gospel_JukeBox.py": 1500,
+    "Streamlit_Gospel_JukeBox_db.py": 1500,
+    "Streamlit_Gospel_JukeBox_Supabase_db.py": 1500,
+    "main.py": 1000,
+}
+
+IMPORTTIME_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+
+
+def module_level_imports(script_path):
+    """Return the source of a script's top-level import statements."""
+    with open(script_path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), filename=script_path)
+    imports = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom))]
+    return "\n".join(ast.unparse(node) for node in imports)
+
+
+def profile_imports(source):
+    """Run import statements under -X importtime; return [(module, self_us, cumulative_us, depth)]."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", source],
+        cwd=REPO_ROOT, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        last_line = completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else "unknown error"
+        raise RuntimeError(last_line)
+    entries = []
+    for line in completed.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            entries.append((module, int(self_us), int(cumulative_us), len(indent) // 2))
+    return entries
+
+
+def report(script, budget_ms, top, runs, startup_modules):
+    """Print the profile for one script and return True when it is within budget."""
+    source = module_level_imports(os.path.join(REPO_ROOT, script))
+    try:
+        profiles = [profile_imports(source) for _ in range(runs)]
+    except RuntimeError as e:
+        print(f"{script}: imports failed ({e})\n")
+        return False
+    # Ignore what the interpreter imports before running any code, and keep the
+    # fastest run to damp disk-cache and scheduler noise
+    profiles = [
+        [entry for entry in entries if entry[3] == 0 and entry[0] not in startup_modules]
+        for entries in profiles
+    ]
+    top_level = min(profiles, key=lambda entries: sum(cumulative for _, _, cumulative, _ in entries))
+    total_ms = sum(cumulative for _, _, cumulative, _ in top_level) / 1000
+
+    status = "OK" if total_ms <= budget_ms else "OVER BUDGET"
+    print(f"{script}: {total_ms:.1f} ms of imports (budget {budget_ms} ms) {status}")
+    for module, _, cumulative, _ in sorted(top_level, key=lambda e: e[2], reverse=True)[:top]:
+        print(f"  {cumulative / 1000:8.1f} ms  {module}")
+    print()
+    return total_ms <= budget_ms
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("scripts", nargs="*", default=DEFAULT_SCRIPTS, help="app scripts relative to the repo root")
+    parser.add_argument("--budget-ms", type=float, help="override every script's budget")
+    parser.add_argument("--top", type=int, default=10, help="slowest top-level imports to list")
+    parser.add_argument("--runs", type=int, default=3, help="profile runs per script (fastest is reported)")
+    args = parser.parse_args()
+
+    startup_modules = {module for module, _, _, _ in profile_imports("pass")}
+    within_budget = True
+    for script in args.scripts:
+        budget_ms = args.budget_ms if args.budget_ms is not None else DEFAULT_BUDGETS_MS.get(script, 1500)
+        within_budget = report(script, budget_ms, args.top, args.runs, startup_modules) and within_budget
+    sys.exit(0 if within_budget else 1)
+
+
+if __name__ == "__main__":
+    main()
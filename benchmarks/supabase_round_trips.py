@@ -0,0 +1,318 @@
+"""Round-trip benchmark for the song page's Supabase data paths.
+
+Runs a small PostgREST-compatible stand-in (HTTP + SQLite) that counts
+requests and can add per-request latency, then loads song pages and adds
+notes with three strategies:
+
+  legacy    notes + labels.in_(ids) + labels + sheet_music, label lookup before insert
+  embedded  foreign-key embedded selects (notes -> labels, sheet_music -> labels)
+  rpc       get_song_detail / add_song_note functions (one request each)
+
+Usage: python benchmarks/supabase_round_trips.py [--songs 50] [--notes 20] [--latency-ms 20]
+"""
+import re
+import json
+import time
+import uuid
+import sqlite3
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit, urlencode
+from urllib.request import Request, urlopen
+
+SCHEMA_SQL = '''
+    CREATE TABLE labels (id TEXT PRIMARY KEY, song_title TEXT, instrument TEXT, name TEXT, owner_id TEXT);
+    CREATE TABLE notes (id TEXT PRIMARY KEY, song_title TEXT, content TEXT, label_id TEXT, owner_id TEXT, created_at TEXT);
+    CREATE TABLE sheet_music (id TEXT PRIMARY KEY, song_name TEXT, label_id TEXT, file_path TEXT, owner_id TEXT, upload_date TEXT);
+    CREATE INDEX idx_labels_song_title ON labels(song_title);
+    CREATE INDEX idx_notes_song_title ON notes(song_title);
+    CREATE INDEX idx_sheet_music_song_name ON sheet_music(song_name);
+'''
+
+# (table, foreign key column) -> referenced table, as PostgREST discovers from the schema
+FOREIGN_KEYS = {
+    ("notes", "label_id"): "labels",
+    ("sheet_music", "label_id"): "labels",
+}
+
+
+def split_select(select):
+    """Split a PostgREST select list on top-level commas."""
+    items, depth, current = [], 0, ""
+    for char in select:
+        if char == "," and depth == 0:
+            items.append(current.strip())
+            current = ""
+            continue
+        depth += char == "("
+        depth -= char == ")"
+        current += char
+    if current.strip():
+        items.append(current.strip())
+    return items
+
+
+class PostgrestStandIn:
+    """Minimal PostgREST look-alike: filtered/embedded selects, inserts and two RPCs."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.db = sqlite3.connect(":memory:", check_same_thread=False)
+        self.db.row_factory = sqlite3.Row
+        self.db.executescript(SCHEMA_SQL)
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.httpd = None
+
+    # --- query evaluation ---
+    def select(self, table, select, filters, order=None):
+        columns, embeds = [], []
+        for item in split_select(select):
+            match = re.fullmatch(r"(?:(\w+):)?(\w+)\((.*)\)", item)
+            if match:
+                alias, target, inner = match.groups()
+                fk_column = target if (table, target) in FOREIGN_KEYS else next(
+                    col for (tbl, col), ref in FOREIGN_KEYS.items() if tbl == table and ref == target)
+                embeds.append((alias or target, fk_column, FOREIGN_KEYS[(table, fk_column)], inner))
+                columns.append(fk_column)
+            else:
+                columns.append(item)
+
+        where, params = [], []
+        for column, expression in filters:
+            operator, _, value = expression.partition(".")
+            if operator == "eq":
+                where.append(f"{column} = ?")
+                params.append(value)
+            elif operator == "in":
+                values = [v for v in value.strip("()").split(",") if v]
+                where.append(f"{column} IN ({', '.join('?' for _ in values) or 'NULL'})")
+                params.extend(values)
+        sql = f"SELECT {', '.join(dict.fromkeys(columns))} FROM {table}"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        if order:
+            column, _, direction = order.partition(".")
+            sql += f" ORDER BY {column} {'DESC' if direction == 'desc' else 'ASC'}"
+        with self.lock:
+            rows = [dict(row) for row in self.db.execute(sql, params)]
+            for alias, fk_column, ref_table, inner in embeds:
+                for row in rows:
+                    ref = self.db.execute(
+                        f"SELECT {inner} FROM {ref_table} WHERE id = ?", (row[fk_column],)
+                    ).fetchone()
+                    row[alias] = dict(ref) if ref else None
+        return rows
+
+    def insert(self, table, row):
+        row = dict(row, id=row.get("id") or str(uuid.uuid4()))
+        with self.lock:
+            self.db.execute(
+                f"INSERT INTO {table} ({', '.join(row)}) VALUES ({', '.join('?' for _ in row)})",
+                list(row.values())
+            )
+        return row
+
+    def rpc(self, name, params):
+        if name == "get_song_detail":
+            song = params["p_song_title"]
+            with self.lock:
+                labels = [dict(r) for r in self.db.execute(
+                    "SELECT id, name, instrument, owner_id FROM labels WHERE song_title = ? ORDER BY name", (song,))]
+                notes = [dict(r) for r in self.db.execute(
+                    "SELECT n.owner_id, n.content, n.label_id, l.name AS label, n.created_at "
+                    "FROM notes n LEFT JOIN labels l ON l.id = n.label_id WHERE n.song_title = ? ORDER BY n.owner_id",
+                    (song,))]
+                sheet_music = [dict(r) for r in self.db.execute(
+                    "SELECT s.id, s.file_path, s.label_id, s.upload_date, l.name AS label_name "
+                    "FROM sheet_music s LEFT JOIN labels l ON l.id = s.label_id "
+                    "WHERE s.song_name = ? ORDER BY s.upload_date DESC", (song,))]
+            for sm in sheet_music:
+                sm["label"] = {"name": sm.pop("label_name")}
+            return {"labels": labels, "notes": notes, "sheet_music": sheet_music}
+        if name == "add_song_note":
+            with self.lock:
+                label = self.db.execute(
+                    "SELECT id FROM labels WHERE song_title = ? AND name = ? LIMIT 1",
+                    (params["p_song_title"], params["p_label"])
+                ).fetchone()
+            return self.insert("notes", {
+                "song_title": params["p_song_title"], "owner_id": params["p_owner_id"],
+                "label_id": label["id"] if label else None, "content": params["p_content"]
+            })
+        raise KeyError(name)
+
+    # --- HTTP plumbing ---
+    def start(self):
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _respond(self, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _count(self):
+                with stand_in.lock:
+                    stand_in.request_count += 1
+                if stand_in.latency:
+                    time.sleep(stand_in.latency)
+
+            def do_GET(self):
+                self._count()
+                url = urlsplit(self.path)
+                table = url.path.rsplit("/", 1)[-1]
+                query = parse_qsl(url.query)
+                select = next((v for k, v in query if k == "select"), "*")
+                order = next((v for k, v in query if k == "order"), None)
+                filters = [(k, v) for k, v in query if k not in ("select", "order")]
+                self._respond(stand_in.select(table, select, filters, order))
+
+            def do_POST(self):
+                self._count()
+                path = urlsplit(self.path).path
+                payload = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if "/rpc/" in path:
+                    self._respond(stand_in.rpc(path.rsplit("/", 1)[-1], payload))
+                else:
+                    self._respond([stand_in.insert(path.rsplit("/", 1)[-1], payload)])
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+        return f"http://127.0.0.1:{self.httpd.server_address[1]}/rest/v1"
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class RestClient:
+    """Just enough of the PostgREST wire protocol for the benchmark."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+
+    def _call(self, method, path, params=None, body=None):
+        url = f"{self.base_url}/{path}"
+        if params:
+            url += "?" + urlencode(params)
+        data = json.dumps(body).encode() if body is not None else None
+        request = Request(url, data=data, method=method, headers={"Content-Type": "application/json"})
+        with urlopen(request) as response:
+            return json.loads(response.read())
+
+    def select(self, table, select, filters=(), order=None):
+        params = [("select", select)] + list(filters)
+        if order:
+            params.append(("order", order))
+        return self._call("GET", table, params)
+
+    def insert(self, table, row):
+        return self._call("POST", table, body=row)
+
+    def rpc(self, name, params):
+        return self._call("POST", f"rpc/{name}", body=params)
+
+
+# --- The three strategies ---
+def load_page_legacy(client, song):
+    sheet_music = client.select("sheet_music", "id, file_path, label_id, upload_date", [("song_name", f"eq.{song}")])
+    labels = client.select("labels", "id, name", [("song_title", f"eq.{song}")])
+    notes = client.select("notes", "owner_id, content, label_id", [("song_title", f"eq.{song}")], "owner_id.asc")
+    label_ids = sorted({n["label_id"] for n in notes if n["label_id"]})
+    if label_ids:
+        client.select("labels", "id, name", [("id", f"in.({','.join(label_ids)})")])
+    return sheet_music, labels, notes
+
+
+def load_page_embedded(client, song):
+    sheet_music = client.select("sheet_music", "id, file_path, label_id, upload_date, label:label_id(name)",
+                                [("song_name", f"eq.{song}")])
+    labels = client.select("labels", "id, name", [("song_title", f"eq.{song}")])
+    notes = client.select("notes", "owner_id, content, label_id, label:label_id(name)",
+                          [("song_title", f"eq.{song}")], "owner_id.asc")
+    return sheet_music, labels, notes
+
+
+def load_page_rpc(client, song):
+    detail = client.rpc("get_song_detail", {"p_song_title": song})
+    return detail["sheet_music"], detail["labels"], detail["notes"]
+
+
+def add_note_legacy(client, song, label):
+    found = client.select("labels", "id", [("song_title", f"eq.{song}"), ("name", f"eq.{label}")])
+    client.insert("notes", {"song_title": song, "owner_id": "bench", "content": "x",
+                            "label_id": found[0]["id"] if found else None})
+
+
+def add_note_rpc(client, song, label):
+    client.rpc("add_song_note", {"p_song_title": song, "p_owner_id": "bench", "p_label": label, "p_content": "x"})
+
+
+STRATEGIES = {
+    "legacy": (load_page_legacy, add_note_legacy),
+    "embedded": (load_page_embedded, add_note_legacy),
+    "rpc": (load_page_rpc, add_note_rpc),
+}
+
+
+def seed(stand_in, songs, notes_per_song, labels_per_song=4):
+    for s in range(songs):
+        song = f"Song {s}.mp3"
+        label_ids = []
+        for l in range(labels_per_song):
+            label_ids.append(stand_in.insert("labels", {"song_title": song, "instrument": "Piano",
+                                                        "name": f"Label {l}", "owner_id": "seed"})["id"])
+            stand_in.insert("sheet_music", {"song_name": song, "label_id": label_ids[-1],
+                                            "file_path": f"{song}/{l}.pdf", "owner_id": "seed",
+                                            "upload_date": f"2025-01-{l + 1:02d}"})
+        for n in range(notes_per_song):
+            stand_in.insert("notes", {"song_title": song, "content": f"note {n}", "owner_id": f"user{n % 5}",
+                                      "label_id": label_ids[n % labels_per_song], "created_at": "2025-01-01"})
+
+
+def run(songs, notes_per_song, latency):
+    results = []
+    for name, (load_page, add_note) in STRATEGIES.items():
+        stand_in = PostgrestStandIn(latency=latency)
+        seed(stand_in, songs, notes_per_song)
+        client = RestClient(stand_in.start())
+        stand_in.request_count = 0
+        started = time.perf_counter()
+        for s in range(songs):
+            load_page(client, f"Song {s}.mp3")
+        page_requests = stand_in.request_count
+        page_time = time.perf_counter() - started
+
+        stand_in.request_count = 0
+        for s in range(songs):
+            add_note(client, f"Song {s}.mp3", "Label 1")
+        note_requests = stand_in.request_count
+        stand_in.stop()
+        results.append((name, page_requests, page_requests / songs, page_time * 1000 / songs, note_requests / songs))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--songs", type=int, default=50, help="song pages to load")
+    parser.add_argument("--notes", type=int, nargs="+", default=[1, 10, 100], help="notes per song (one run each)")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="simulated network latency per request")
+    args = parser.parse_args()
+
+    print(f"{args.songs} song pages, {args.latency_ms:.0f} ms simulated latency per request\n")
+    print(f"{'notes/song':>10}  {'strategy':<9} {'requests':>9} {'req/page':>9} {'ms/page':>9} {'req/add_note':>13}")
+    for notes_per_song in args.notes:
+        for name, total, per_page, ms_per_page, per_note in run(args.songs, notes_per_song, args.latency_ms / 1000):
+            print(f"{notes_per_song:>10}  {name:<9} {total:>9} {per_page:>9.1f} {ms_per_page:>9.1f} {per_note:>13.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,24 +1,64 @@
 import sqlite3
 import os
 import logging
+from contextlib import contextmanager
 from datetime import datetime
+from migrations import migrate
 
 # Set up logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 logger = logging.getLogger(__name__)
 
+# Insert-or-update statements; they rely on the keys created by the schema
+# migrations (see migrations.py) as their conflict targets. Per-song notes are
+# the song_notes row with an empty username and label.
+UPSERT_SONG_NOTES_SQL = """
+    INSERT INTO song_notes (song_name, username, label, notes, last_updated) VALUES (?, '', '', ?, ?)
+    ON CONFLICT (song_name, username, label) DO UPDATE SET
+        notes = excluded.notes,
+        last_updated = excluded.last_updated
+"""
+
+UPSERT_SHEET_MUSIC_SQL = """
+    INSERT INTO sheet_music (song_name, label_id, file_path, upload_date)
+    VALUES (?, (SELECT id FROM labels WHERE song_title = ? AND name = ?), ?, ?)
+    ON CONFLICT (song_name, label_id) DO UPDATE SET
+        file_path = excluded.file_path,
+        upload_date = excluded.upload_date
+"""
+
 class DatabaseManager:
     """Manages SQLite database operations for the Gospel JukeBox application."""
     
-    def __init__(self, db_path):
-        """Initialize the database manager with the database file path."""
+    def __init__(self, db_path, persistent=False):
+        """Initialize the database manager with the database file path.
+        
+        With persistent=True the connection stays open between calls until
+        close() is called; otherwise each call opens and closes its own.
+        """
         self.db_path = db_path
+        self.persistent = persistent
         self.conn = None
         self.cursor = None
+        self.batch_depth = 0
         self.initialize_database()
     
+    def __enter__(self):
+        """Use the manager as a context manager holding one long-lived connection."""
+        self.persistent = True
+        if not self.connect():
+            raise sqlite3.OperationalError(f"Could not open database: {self.db_path}")
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Close the long-lived connection when leaving the with-block."""
+        self.close()
+        return False
+    
     def connect(self):
-        """Establish a connection to the SQLite database."""
+        """Establish a connection to the SQLite database, reusing an open one."""
+        if self.conn:
+            return True
         try:
             self.conn = sqlite3.connect(self.db_path)
             self.cursor = self.conn.cursor()
@@ -28,52 +68,57 @@ class DatabaseManager:
             return False
     
     def disconnect(self):
-        """Close the database connection."""
+        """Close the connection unless it is being kept open (persistent mode or a batch)."""
+        if self.persistent or self.batch_depth:
+            return
+        self.close()
+    
+    def close(self):
+        """Close the database connection unconditionally."""
         if self.conn:
             self.conn.close()
             self.conn = None
             self.cursor = None
+        self.persistent = False
+    
+    def commit(self):
+        """Commit now, or defer to the end of the enclosing batch()."""
+        if not self.batch_depth:
+            self.conn.commit()
+    
+    @contextmanager
+    def batch(self):
+        """Group many writes into a single transaction (one fsync instead of one per row).
+        
+        Writes made inside the block are committed together on exit and rolled
+        back together if an exception escapes. Inside a batch the save methods
+        re-raise database errors instead of returning False, so one failed row
+        rolls back the whole batch rather than committing the others.
+        """
+        if not self.connect():
+            raise sqlite3.OperationalError(f"Could not open database: {self.db_path}")
+        self.batch_depth += 1
+        try:
+            yield self
+        except Exception:
+            self.batch_depth -= 1
+            if not self.batch_depth:
+                self.conn.rollback()
+                self.disconnect()
+            raise
+        else:
+            self.batch_depth -= 1
+            if not self.batch_depth:
+                self.conn.commit()
+                self.disconnect()
     
     def initialize_database(self):
-        """Create database tables if they don't exist."""
+        """Bring the schema up to date; a current database costs one PRAGMA read."""
         if not self.connect():
             return False
         
         try:
-            # Create song_notes table
-            self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS song_notes (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                song_name TEXT NOT NULL UNIQUE,
-                notes TEXT,
-                last_updated TIMESTAMP
-            )
-            ''')
-            
-            # Create labels table
-            self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS labels (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                song_title TEXT NOT NULL,
-                name TEXT NOT NULL,
-                UNIQUE (song_title, name)
-            )
-            ''')
-            
-            # Create sheet_music table (now with label_id foreign key)
-            self.cursor.execute('''
-            CREATE TABLE IF NOT EXISTS sheet_music (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                song_name TEXT NOT NULL,
-                label_id TEXT,
-                file_path TEXT NOT NULL,
-                upload_date TIMESTAMP,
-                FOREIGN KEY(label_id) REFERENCES labels(id)
-            )
-            ''')
-            
-            self.conn.commit()
-            logger.info("Database initialized successfully")
+            migrate(self.conn)
             return True
         except sqlite3.Error as e:
             logger.error(f"Database initialization error: {e}")
@@ -89,28 +134,16 @@ class DatabaseManager:
         try:
             timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
             
-            # Check if song exists in the database
-            self.cursor.execute("SELECT id FROM song_notes WHERE song_name = ?", (song_name,))
-            result = self.cursor.fetchone()
-            
-            if result:
-                # Update existing notes
-                self.cursor.execute(
-                    "UPDATE song_notes SET notes = ?, last_updated = ? WHERE song_name = ?",
-                    (notes, timestamp, song_name)
-                )
-            else:
-                # Insert new notes
-                self.cursor.execute(
-                    "INSERT INTO song_notes (song_name, notes, last_updated) VALUES (?, ?, ?)",
-                    (song_name, notes, timestamp)
-                )
+            # Insert or update in a single statement
+            self.cursor.execute(UPSERT_SONG_NOTES_SQL, (song_name, notes, timestamp))
             
-            self.conn.commit()
+            self.commit()
             logger.info(f"Notes saved for song: {song_name}")
             return True
         except sqlite3.Error as e:
             logger.error(f"Error saving song notes: {e}")
+            if self.batch_depth:
+                raise
             return False
         finally:
             self.disconnect()
@@ -121,7 +154,7 @@ class DatabaseManager:
             return ""
         
         try:
-            self.cursor.execute("SELECT notes FROM song_notes WHERE song_name = ?", (song_name,))
+            self.cursor.execute("SELECT notes FROM song_notes WHERE song_name = ? AND username = '' AND label = ''", (song_name,))
             result = self.cursor.fetchone()
             
             if result:
@@ -140,30 +173,65 @@ class DatabaseManager:
             return False
         try:
             timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            # Lookup label_id for this song and label
-            self.cursor.execute("SELECT id FROM labels WHERE song_title = ? AND name = ?", (song_name, label_name))
-            label_row = self.cursor.fetchone()
-            label_id = label_row[0] if label_row else None
-            # Check if sheet music exists for this song and label
-            self.cursor.execute("SELECT id FROM sheet_music WHERE song_name = ? AND label_id = ?", (song_name, label_id))
-            result = self.cursor.fetchone()
-            if result:
-                # Update existing reference
-                self.cursor.execute(
-                    "UPDATE sheet_music SET file_path = ?, upload_date = ? WHERE song_name = ? AND label_id = ?",
-                    (file_path, timestamp, song_name, label_id)
-                )
-            else:
-                # Insert new reference
-                self.cursor.execute(
-                    "INSERT INTO sheet_music (song_name, label_id, file_path, upload_date) VALUES (?, ?, ?, ?)",
-                    (song_name, label_id, file_path, timestamp)
-                )
-            self.conn.commit()
+            # Label lookup and insert-or-update happen in one statement
+            self.cursor.execute(
+                UPSERT_SHEET_MUSIC_SQL,
+                (song_name, song_name, label_name, file_path, timestamp)
+            )
+            self.commit()
             logger.info(f"Sheet music reference saved for song: {song_name}, label: {label_name}")
             return True
         except sqlite3.Error as e:
             logger.error(f"Error saving sheet music reference: {e}")
+            if self.batch_depth:
+                raise
+            return False
+        finally:
+            self.disconnect()
+    
+    def save_song_notes_many(self, notes_by_song):
+        """Save or update notes for many songs in one transaction.
+        
+        Accepts a dict of {song_name: notes} or an iterable of (song_name, notes) pairs.
+        """
+        if not self.connect():
+            return False
+        try:
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            items = notes_by_song.items() if isinstance(notes_by_song, dict) else notes_by_song
+            rows = [(song_name, notes, timestamp) for song_name, notes in items]
+            self.cursor.executemany(UPSERT_SONG_NOTES_SQL, rows)
+            self.commit()
+            logger.info(f"Notes saved for {len(rows)} songs")
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Error saving song notes in bulk: {e}")
+            if self.batch_depth:
+                raise
+            self.conn.rollback()
+            return False
+        finally:
+            self.disconnect()
+    
+    def save_sheet_music_references_many(self, references):
+        """Save or update many (song_name, label_name, file_path) references in one transaction."""
+        if not self.connect():
+            return False
+        try:
+            timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            rows = [
+                (song_name, song_name, label_name, file_path, timestamp)
+                for song_name, label_name, file_path in references
+            ]
+            self.cursor.executemany(UPSERT_SHEET_MUSIC_SQL, rows)
+            self.commit()
+            logger.info(f"Sheet music references saved: {len(rows)}")
+            return True
+        except sqlite3.Error as e:
+            logger.error(f"Error saving sheet music references in bulk: {e}")
+            if self.batch_depth:
+                raise
+            self.conn.rollback()
             return False
         finally:
             self.disconnect()
@@ -194,7 +262,7 @@ class DatabaseManager:
             return {}
         
         try:
-            self.cursor.execute("SELECT song_name, notes FROM song_notes")
+            self.cursor.execute("SELECT song_name, notes FROM song_notes WHERE username = '' AND label = ''")
             results = self.cursor.fetchall()
             
             notes_dict = {song_name: notes for song_name, notes in results}
@@ -0,0 +1,150 @@
+import queue
+import sqlite3
+import logging
+import threading
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# PRAGMAs applied to every pooled connection. WAL lets readers proceed while a
+# writer commits, and NORMAL synchronous is safe under WAL while avoiding an
+# fsync per transaction.
+DEFAULT_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "temp_store": "MEMORY",
+    "cache_size": -8000,        # ~8 MB page cache per connection
+    "mmap_size": 64 * 1024 * 1024,
+}
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of long-lived SQLite connections."""
+
+    def __init__(self, db_path, max_connections=5, timeout=30.0, cached_statements=256, pragmas=None):
+        """Create a pool; connections are opened lazily up to max_connections."""
+        self.db_path = db_path
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+        self._idle = queue.LifoQueue(maxsize=max_connections)
+        self._lock = threading.Lock()
+        self._created = 0
+        self._closed = False
+
+    def _create_connection(self):
+        """Open a new connection and apply the tuned PRAGMAs."""
+        # check_same_thread=False is safe because a connection is only ever
+        # used by the thread that checked it out of the pool.
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.timeout,
+            check_same_thread=False,
+            cached_statements=self.cached_statements
+        )
+        for name, value in self.pragmas.items():
+            conn.execute(f"PRAGMA {name} = {value}")
+        return conn
+
+    def _acquire(self):
+        """Take an idle connection, opening a new one while under the limit."""
+        if self._closed:
+            raise sqlite3.ProgrammingError("Connection pool is closed")
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.max_connections:
+                self._created += 1
+                try:
+                    return self._create_connection()
+                except sqlite3.Error:
+                    self._created -= 1
+                    raise
+        # Pool exhausted: wait for another session to hand one back
+        try:
+            return self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise sqlite3.OperationalError(f"Timed out waiting for a connection to {self.db_path}")
+
+    def _release(self, conn):
+        """Return a connection to the pool, discarding it if it is unusable."""
+        try:
+            # Never hand the next caller a half-finished transaction
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error as e:
+            logger.warning(f"Discarding unusable pooled connection: {e}")
+            self._discard(conn)
+            return
+        if self._closed:
+            self._discard(conn)
+            return
+        self._idle.put_nowait(conn)
+
+    def _discard(self, conn):
+        """Close a broken connection and free its slot."""
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._lock:
+            self._created -= 1
+
+    @contextmanager
+    def connection(self):
+        """Check out a connection for the duration of a with-block."""
+        conn = self._acquire()
+        try:
+            yield conn
+        finally:
+            self._release(conn)
+
+    @contextmanager
+    def transaction(self):
+        """Yield a cursor inside a transaction that commits on success."""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            try:
+                yield cursor
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                cursor.close()
+
+    def fetch_all(self, sql, params=()):
+        """Run a query and return all rows."""
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def fetch_one(self, sql, params=()):
+        """Run a query and return the first row, or None."""
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchone()
+
+    def execute(self, sql, params=()):
+        """Run a single write statement in its own transaction and return the row count."""
+        with self.transaction() as cursor:
+            cursor.execute(sql, params)
+            return cursor.rowcount
+
+    def executemany(self, sql, seq_of_params):
+        """Run a write statement for many parameter sets in one transaction."""
+        with self.transaction() as cursor:
+            cursor.executemany(sql, seq_of_params)
+            return cursor.rowcount
+
+    def close(self):
+        """Close every idle connection; checked-out ones close when returned."""
+        self._closed = True
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            self._discard(conn)
+        logger.info(f"Connection pool for {self.db_path} closed")
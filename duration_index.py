@@ -0,0 +1,246 @@
+import os
+import json
+import mmap
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Bitrates in kbps indexed by [version_is_mpeg1][layer][bitrate_index]
+BITRATES = {
+    True: {
+        1: [0, 32, 64, 96, 128, 160, 192, 224, 256, 288, 320, 352, 384, 416, 448],
+        2: [0, 32, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320, 384],
+        3: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    },
+    False: {
+        1: [0, 32, 48, 56, 64, 80, 96, 112, 128, 144, 160, 176, 192, 224, 256],
+        2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+        3: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+    },
+}
+
+# Sample rates indexed by the two version bits (0 = MPEG 2.5, 2 = MPEG 2, 3 = MPEG 1)
+SAMPLE_RATES = {
+    3: [44100, 48000, 32000],
+    2: [22050, 24000, 16000],
+    0: [11025, 12000, 8000],
+}
+
+
+def parse_frame_header(header):
+    """Decode a 4-byte MPEG audio frame header, or return None if it is invalid."""
+    if len(header) < 4 or header[0] != 0xFF or (header[1] & 0xE0) != 0xE0:
+        return None
+    version_bits = (header[1] >> 3) & 0x03
+    layer_bits = (header[1] >> 1) & 0x03
+    bitrate_index = (header[2] >> 4) & 0x0F
+    sample_rate_index = (header[2] >> 2) & 0x03
+    if version_bits == 1 or layer_bits == 0 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+
+    is_mpeg1 = version_bits == 3
+    layer = 4 - layer_bits
+    padding = (header[2] >> 1) & 0x01
+    bitrate = BITRATES[is_mpeg1][layer][bitrate_index] * 1000
+    sample_rate = SAMPLE_RATES[version_bits][sample_rate_index]
+    mono = ((header[3] >> 6) & 0x03) == 3
+
+    if layer == 1:
+        samples_per_frame = 384
+        frame_length = (12 * bitrate // sample_rate + padding) * 4
+    elif layer == 2 or is_mpeg1:
+        samples_per_frame = 1152
+        frame_length = 144 * bitrate // sample_rate + padding
+    else:
+        samples_per_frame = 576
+        frame_length = 72 * bitrate // sample_rate + padding
+
+    return {
+        "is_mpeg1": is_mpeg1,
+        "layer": layer,
+        "bitrate": bitrate,
+        "sample_rate": sample_rate,
+        "mono": mono,
+        "samples_per_frame": samples_per_frame,
+        "frame_length": frame_length,
+    }
+
+
+def skip_id3v2(data):
+    """Return the offset of the first byte after any leading ID3v2 tags."""
+    offset = 0
+    while data[offset:offset + 3] == b"ID3" and len(data) >= offset + 10:
+        flags = data[offset + 5]
+        size = 0
+        for byte in data[offset + 6:offset + 10]:
+            size = (size << 7) | (byte & 0x7F)
+        offset += 10 + size + (10 if flags & 0x10 else 0)
+    return offset
+
+
+def find_first_frame(data, start):
+    """Locate the first frame header that is followed by another valid frame."""
+    position = data.find(b"\xFF", start)
+    while position != -1 and position + 4 <= len(data):
+        frame = parse_frame_header(data[position:position + 4])
+        if frame:
+            next_position = position + frame["frame_length"]
+            # Confirm the sync by checking the following frame (or EOF)
+            if next_position + 4 > len(data) or parse_frame_header(data[next_position:next_position + 4]):
+                return position, frame
+        position = data.find(b"\xFF", position + 1)
+    return None, None
+
+
+def read_vbr_header(data, position, frame):
+    """Return the total frame count from a Xing/Info or VBRI header, if present."""
+    # Xing/Info sits right after the side information
+    if frame["is_mpeg1"]:
+        side_info = 17 if frame["mono"] else 32
+    else:
+        side_info = 9 if frame["mono"] else 17
+    xing_offset = position + 4 + side_info
+    tag = data[xing_offset:xing_offset + 4]
+    if tag in (b"Xing", b"Info"):
+        flags = int.from_bytes(data[xing_offset + 4:xing_offset + 8], "big")
+        if flags & 0x01:
+            return int.from_bytes(data[xing_offset + 8:xing_offset + 12], "big")
+
+    # VBRI always sits 32 bytes after the frame header
+    vbri_offset = position + 4 + 32
+    if data[vbri_offset:vbri_offset + 4] == b"VBRI":
+        return int.from_bytes(data[vbri_offset + 14:vbri_offset + 18], "big")
+    return None
+
+
+def count_frames(data, position, end):
+    """Walk the frame chain and return (frame_count, audio_bytes)."""
+    frames = 0
+    start = position
+    while position + 4 <= end:
+        frame = parse_frame_header(data[position:position + 4])
+        if not frame or frame["frame_length"] <= 0:
+            break
+        frames += 1
+        position += frame["frame_length"]
+    return frames, min(position, end) - start
+
+
+def probe_mp3(path):
+    """Return {'duration', 'bitrate', 'sample_rate'} for an MP3 file, or None if unreadable.
+
+    Uses the Xing/Info or VBRI header when present and otherwise walks every
+    frame header, so both CBR and VBR files get an exact duration.
+    """
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                end = len(data)
+                # Ignore a trailing ID3v1 tag
+                if end >= 128 and data[end - 128:end - 125] == b"TAG":
+                    end -= 128
+
+                position, frame = find_first_frame(data, skip_id3v2(data))
+                if frame is None:
+                    return None
+
+                total_frames = read_vbr_header(data, position, frame)
+                if total_frames:
+                    audio_bytes = end - position
+                else:
+                    total_frames, audio_bytes = count_frames(data, position, end)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not probe {path}: {e}")
+        return None
+
+    duration = total_frames * frame["samples_per_frame"] / frame["sample_rate"]
+    bitrate = int(audio_bytes * 8 / duration) if duration else frame["bitrate"]
+    return {
+        "duration": round(duration, 3),
+        "bitrate": bitrate,
+        "sample_rate": frame["sample_rate"],
+    }
+
+
+class DurationIndex:
+    """Persistent cache of probed track durations keyed by path and mtime."""
+
+    def __init__(self, index_path):
+        """Load the index from disk (an empty index if the file is missing)."""
+        self.index_path = index_path
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.dirty = False
+        self.load()
+
+    def load(self):
+        """Read the JSON index file."""
+        try:
+            with open(self.index_path, "r") as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable duration index {self.index_path}: {e}")
+            self.entries = {}
+
+    def save(self):
+        """Write the index atomically if anything changed."""
+        with self.lock:
+            if not self.dirty:
+                return
+            os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.index_path)
+            self.dirty = False
+
+    def lookup(self, path):
+        """Return the cached entry for a file, probing it if new or modified."""
+        key = os.path.abspath(path)
+        try:
+            stat_result = os.stat(key)
+        except OSError:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry["mtime_ns"] == stat_result.st_mtime_ns and entry["size"] == stat_result.st_size:
+                return entry
+
+        info = probe_mp3(key)
+        if info is None:
+            return None
+        entry = dict(info, mtime_ns=stat_result.st_mtime_ns, size=stat_result.st_size)
+        with self.lock:
+            self.entries[key] = entry
+            self.dirty = True
+        return entry
+
+    def get_duration(self, path):
+        """Return the track duration in seconds, or None if it cannot be determined."""
+        entry = self.lookup(path)
+        return entry["duration"] if entry else None
+
+    def refresh(self, directory, extensions=(".mp3",)):
+        """Index every matching file below a directory and drop entries for deleted files."""
+        seen = set()
+        for folder, _, files in os.walk(directory):
+            for file_name in files:
+                if file_name.lower().endswith(extensions):
+                    path = os.path.abspath(os.path.join(folder, file_name))
+                    seen.add(path)
+                    self.lookup(path)
+
+        prefix = os.path.abspath(directory) + os.sep
+        with self.lock:
+            stale = [key for key in self.entries if key.startswith(prefix) and key not in seen]
+            for key in stale:
+                del self.entries[key]
+            if stale:
+                self.dirty = True
+        self.save()
+        return len(seen)
@@ -0,0 +1,217 @@
+import os
+import json
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+LYRICS_EXTENSION = ".txt"
+
+# Bump when the on-disk layout changes so stale indexes are rebuilt
+INDEX_VERSION = 1
+
+
+class LibraryIndex:
+    """Persistent catalog of the songs below a media directory.
+
+    Each directory's listing is cached together with its mtime, so a refresh
+    costs one stat() per directory and only directories whose mtime changed
+    are listed again.
+    """
+
+    def __init__(self, root, index_path, extensions=(".mp3",), include_subfolders=True,
+                 create_placeholder_lyrics=False, duration_index=None, loudness_index=None,
+                 refresh_interval=2.0):
+        """Load the persisted index; call refresh() to bring it up to date."""
+        self.root = os.path.abspath(root)
+        self.index_path = index_path
+        self.extensions = tuple(ext.lower() for ext in extensions)
+        self.include_subfolders = include_subfolders
+        self.create_placeholder_lyrics = create_placeholder_lyrics
+        self.duration_index = duration_index
+        self.loudness_index = loudness_index
+        self.refresh_interval = refresh_interval
+        self.directories = {}
+        self.songs = []
+        self.lock = threading.RLock()
+        self.last_refresh = None
+        self.load()
+
+    def _options(self):
+        """Settings that must match for a persisted index to be reused."""
+        return {
+            "version": INDEX_VERSION,
+            "root": self.root,
+            "extensions": list(self.extensions),
+            "include_subfolders": self.include_subfolders,
+            "durations": self.duration_index is not None,
+            "gains": self.loudness_index is not None,
+        }
+
+    def load(self):
+        """Read the persisted directory listings, ignoring an incompatible file."""
+        try:
+            with open(self.index_path, "r") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable library index {self.index_path}: {e}")
+            return
+        if data.get("options") != self._options():
+            logger.info(f"Library index {self.index_path} was built with other settings; rebuilding")
+            return
+        self.directories = data.get("directories", {})
+        self.songs = self._collect_songs()
+
+    def save(self):
+        """Write the index atomically."""
+        os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+        tmp_path = f"{self.index_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"options": self._options(), "directories": self.directories}, f)
+        os.replace(tmp_path, self.index_path)
+
+    def refresh(self, force=False):
+        """Re-stat the directories and rescan the ones that changed; returns the song list.
+
+        Calls made within refresh_interval of the previous one return the
+        cached list without touching the filesystem.
+        """
+        with self.lock:
+            now = time.monotonic()
+            if not force and self.last_refresh is not None and now - self.last_refresh < self.refresh_interval:
+                return self.songs
+            self.last_refresh = now
+
+            live = set()
+            changed = self._refresh_directory(self.root, is_root=True, live=live)
+            removed = [path for path in self.directories if path not in live]
+            for path in removed:
+                del self.directories[path]
+            if changed or removed:
+                self.songs = self._collect_songs()
+                try:
+                    self.save()
+                    if self.duration_index is not None:
+                        self.duration_index.save()
+                except OSError as e:
+                    logger.warning(f"Could not save library index {self.index_path}: {e}")
+            return self.songs
+
+    def _refresh_directory(self, path, is_root, live):
+        """Rescan a directory if its mtime changed; returns True when anything changed."""
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            return False
+        live.add(path)
+
+        changed = False
+        record = self.directories.get(path)
+        if record is None or record["mtime_ns"] != mtime_ns:
+            record = self._scan_directory(path, is_root)
+            self.directories[path] = record
+            changed = True
+
+        if is_root and self.include_subfolders:
+            for subdir in record["subdirs"]:
+                changed = self._refresh_directory(subdir, is_root=False, live=live) or changed
+        return changed
+
+    def _scan_directory(self, path, is_root):
+        """List a directory once and build its catalog entries."""
+        mtime_ns = os.stat(path).st_mtime_ns
+        with os.scandir(path) as it:
+            dir_entries = sorted(it, key=lambda entry: entry.name)
+
+        files = {}
+        subdirs = []
+        for entry in dir_entries:
+            if entry.is_dir():
+                subdirs.append(entry.path)
+            elif entry.is_file():
+                files[entry.name] = entry
+
+        media = [entry for name, entry in files.items() if name.lower().endswith(self.extensions)]
+        lyrics = [entry for name, entry in files.items() if name.lower().endswith(LYRICS_EXTENSION)]
+        images = [entry for name, entry in files.items() if name.lower().endswith(IMAGE_EXTENSIONS)]
+
+        songs = []
+        if is_root:
+            # Every media file directly in the root is a song of its own
+            created_placeholder = False
+            for entry in media:
+                name = os.path.splitext(entry.name)[0]
+                text_file = os.path.join(path, f"{name}{LYRICS_EXTENSION}")
+                if f"{name}{LYRICS_EXTENSION}" not in files and self.create_placeholder_lyrics:
+                    with open(text_file, "w") as f:
+                        f.write(f"Lyrics for {name}")
+                    created_placeholder = True
+                image = next((image for image in images if os.path.splitext(image.name)[0] == name), None)
+                songs.append(self._make_entry(name, entry, text_file, image.path if image else None))
+            if created_placeholder:
+                # Writing the placeholders bumped the directory mtime
+                mtime_ns = os.stat(path).st_mtime_ns
+        elif media and lyrics:
+            # A song folder holds the media, its lyrics and optionally artwork
+            songs.append(self._make_entry(
+                os.path.basename(path), media[0], lyrics[0].path, images[0].path if images else None
+            ))
+
+        return {"mtime_ns": mtime_ns, "subdirs": subdirs, "songs": songs}
+
+    def _make_entry(self, name, media_entry, text_file, image_file):
+        """Build the catalog record for one song."""
+        duration = None
+        if self.duration_index is not None and media_entry.name.lower().endswith(".mp3"):
+            duration = self.duration_index.get_duration(media_entry.path)
+        return {
+            "name": name,
+            "media_file": media_entry.path,
+            "text_file": text_file,
+            "image_file": image_file,
+            "size": media_entry.stat().st_size,
+            "duration": duration,
+            "gain_db": self.loudness_index.get_gain(media_entry.path) if self.loudness_index else None,
+        }
+
+    def apply_gains(self):
+        """Copy newly measured loudness gains into the cached entries; returns how many changed.
+
+        Gains are measured in the background after the songs were listed, so
+        this is called when a measurement run finishes rather than waiting for
+        the directory to change.
+        """
+        if self.loudness_index is None:
+            return 0
+        with self.lock:
+            changed = 0
+            for record in self.directories.values():
+                for song in record["songs"]:
+                    gain_db = self.loudness_index.get_gain(song["media_file"])
+                    if song.get("gain_db") != gain_db:
+                        song["gain_db"] = gain_db
+                        changed += 1
+            if changed:
+                self.songs = self._collect_songs()
+                try:
+                    self.save()
+                except OSError as e:
+                    logger.warning(f"Could not save library index {self.index_path}: {e}")
+            return changed
+
+    def _collect_songs(self):
+        """Flatten the per-directory entries: root files first, then song folders."""
+        root_record = self.directories.get(self.root)
+        if root_record is None:
+            return []
+        songs = list(root_record["songs"])
+        if self.include_subfolders:
+            for subdir in root_record["subdirs"]:
+                record = self.directories.get(subdir)
+                if record:
+                    songs.extend(record["songs"])
+        return songs
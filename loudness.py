@@ -0,0 +1,274 @@
+"""Loudness measurement and ReplayGain-style playback gains.
+
+Each track's integrated loudness is measured once (reusing the offline
+analysis cache when it already has it) and turned into a gain towards
+TARGET_LUFS. Players only look the gain up and scale their volume, so
+levelling costs nothing at playback time.
+
+Usage: python loudness.py [root ...] [--workers N]
+"""
+import os
+import sys
+import json
+import logging
+import argparse
+import functools
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+LOUDNESS_INDEX_PATH = os.path.join(BASE_DIR, "cache", "loudness_index.json")
+
+# ReplayGain 2.0 reference level
+TARGET_LUFS = -18.0
+
+
+def gain_for(lufs, peak_db):
+    """Return the gain in dB that brings a track to TARGET_LUFS without clipping its peak."""
+    if lufs is None or lufs == float("-inf"):
+        return 0.0
+    gain = TARGET_LUFS - lufs
+    if peak_db is not None and peak_db != float("-inf"):
+        gain = min(gain, -peak_db)
+    return round(gain, 2)
+
+
+def gain_to_scale(gain_db):
+    """Convert a gain in dB to a volume multiplier; players can only attenuate, so it is capped at 1.0."""
+    if gain_db is None:
+        return 1.0
+    return min(1.0, 10 ** (gain_db / 20))
+
+
+def is_decode_error(error):
+    """True when a worker error says the track itself cannot be decoded.
+
+    Missing modules, a crashed worker pool, memory pressure and file system
+    errors say nothing about the track, so they are never remembered.
+    """
+    return not isinstance(error, (ImportError, BrokenProcessPool, MemoryError, OSError))
+
+
+def measure_file(path):
+    """Decode a track and measure it; runs in a worker process."""
+    import numpy as np
+    from audio_analysis import load_audio, integrated_loudness
+
+    samples, sample_rate = load_audio(path)
+    peak = float(np.abs(samples).max()) if samples.size else 0.0
+    with np.errstate(divide="ignore"):
+        peak_db = float(20 * np.log10(peak))
+    return {"lufs": integrated_loudness(samples, sample_rate), "peak_db": peak_db}
+
+
+class LoudnessIndex:
+    """Persistent per-track loudness and gain, keyed by path and validated by mtime and size."""
+
+    def __init__(self, index_path=LOUDNESS_INDEX_PATH):
+        """Load the index from disk (an empty index if the file is missing)."""
+        self.index_path = index_path
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.worker = None
+        self.queued = []  # paths waiting for the background worker
+        self.load()
+
+    def load(self):
+        """Read the JSON index file."""
+        try:
+            with open(self.index_path, "r") as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable loudness index {self.index_path}: {e}")
+            self.entries = {}
+
+    def save(self):
+        """Write the index atomically."""
+        with self.lock:
+            os.makedirs(os.path.dirname(self.index_path) or ".", exist_ok=True)
+            tmp_path = f"{self.index_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.index_path)
+
+    def lookup(self, path):
+        """Return the entry for a file if it is measured (or failed to decode) and unchanged; never decodes."""
+        key = os.path.abspath(path)
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None:
+            return None
+        try:
+            stat_result = os.stat(key)
+        except OSError:
+            return None
+        if entry["mtime_ns"] != stat_result.st_mtime_ns or entry["size"] != stat_result.st_size:
+            return None
+        return entry
+
+    def get_gain(self, path):
+        """Return the track's gain in dB, or None until it has been measured."""
+        entry = self.lookup(path)
+        return entry["gain_db"] if entry else None
+
+    def volume_scale(self, path):
+        """Return the volume multiplier to apply when playing path (1.0 when unmeasured)."""
+        return gain_to_scale(self.get_gain(path))
+
+    def _record(self, path, lufs, peak_db):
+        stat_result = os.stat(path)
+        with self.lock:
+            self.entries[path] = {
+                "mtime_ns": stat_result.st_mtime_ns,
+                "size": stat_result.st_size,
+                "lufs": lufs,
+                "peak_db": peak_db,
+                "gain_db": gain_for(lufs, peak_db),
+            }
+
+    def _record_failure(self, path, error):
+        # Remembered until the file changes, so an undecodable track is not retried on every pass
+        stat_result = os.stat(path)
+        with self.lock:
+            self.entries[path] = {
+                "mtime_ns": stat_result.st_mtime_ns,
+                "size": stat_result.st_size,
+                "lufs": None,
+                "peak_db": None,
+                "gain_db": None,
+                "error": str(error),
+            }
+
+    def measure(self, paths, workers=1, feature_store=None):
+        """Measure every path without a current entry; returns how many were added.
+
+        Tracks that fail to decode are recorded without a gain and skipped
+        until they change. Other errors leave the track unrecorded; missing
+        dependencies and a broken worker pool end the pass.
+        """
+        todo = [os.path.abspath(path) for path in paths if self.lookup(path) is None]
+        if not todo:
+            return 0
+
+        measured = failed = 0
+        if feature_store is not None:
+            # Tracks the offline analysis already measured need no decoding
+            remaining = []
+            for path in todo:
+                features = feature_store.get(path)
+                if features is not None:
+                    self._record(path, features["lufs"], features["peak_db"])
+                    measured += 1
+                else:
+                    remaining.append(path)
+            todo = remaining
+
+        try:
+            if todo:
+                # Spawned, not forked: callers such as the Streamlit server are multithreaded.
+                # Spawned workers import the caller's entry script as __mp_main__, so that
+                # script must be import-safe (start its app under if __name__ == "__main__")
+                with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                    futures = {pool.submit(measure_file, path): path for path in todo}
+                    for future in as_completed(futures):
+                        path = futures[future]
+                        try:
+                            result = future.result()
+                        except (ImportError, BrokenProcessPool):
+                            pool.shutdown(wait=False, cancel_futures=True)
+                            raise
+                        except Exception as e:
+                            logger.warning(f"Could not measure loudness of {path}: {e}")
+                            if is_decode_error(e):
+                                try:
+                                    self._record_failure(path, e)
+                                    failed += 1
+                                except OSError:
+                                    pass
+                            continue
+                        self._record(path, result["lufs"], result["peak_db"])
+                        measured += 1
+        finally:
+            # Keep what was measured even when the pass is cut short
+            if measured or failed:
+                self.save()
+        return measured
+
+    def measure_in_background(self, paths, workers=1, on_done=None):
+        """Measure paths on a daemon thread; on_done(count) follows each pass that added entries.
+
+        Paths passed while a pass is running are queued for the same thread.
+        Returns None without starting a thread when the analysis dependencies
+        are missing.
+        """
+        paths = list(paths)
+        if not paths or not analysis_available():
+            return None
+        with self.lock:
+            self.queued.extend(paths)
+            if self.worker is not None:
+                return self.worker
+
+            def run():
+                while True:
+                    with self.lock:
+                        batch, self.queued = self.queued, []
+                        if not batch:
+                            self.worker = None
+                            return
+                    try:
+                        count = self.measure(batch, workers, _feature_store())
+                    except Exception as e:
+                        logger.warning(f"Loudness measurement failed: {e}")
+                        continue
+                    if count and on_done is not None:
+                        on_done(count)
+
+            self.worker = threading.Thread(target=run, name="loudness", daemon=True)
+            self.worker.start()
+            return self.worker
+
+
+@functools.lru_cache(maxsize=None)
+def analysis_available():
+    """True when the decoding and analysis dependencies are installed; logged once when they are not."""
+    from importlib.util import find_spec
+    available = all(find_spec(name) is not None for name in ("numpy", "scipy", "librosa"))
+    if not available:
+        logger.info("numpy/scipy/librosa are not installed; tracks play without loudness gains or waveforms")
+    return available
+
+
+def _feature_store():
+    """Return the offline analysis cache, or None when numpy is not installed."""
+    try:
+        from audio_analysis import FeatureStore
+    except ImportError:
+        return None
+    return FeatureStore()
+
+
+def main():
+    from audio_analysis import DEFAULT_ROOTS, find_audio_files
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("roots", nargs="*", default=DEFAULT_ROOTS, help="directories holding tracks or song folders")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    if not analysis_available():
+        sys.exit("numpy, scipy and librosa are required to measure loudness")
+    index = LoudnessIndex()
+    count = index.measure(find_audio_files(args.roots), args.workers, _feature_store())
+    print(f"Measured {count} tracks; gains in {LOUDNESS_INDEX_PATH}")
+
+
+if __name__ == "__main__":
+    main()
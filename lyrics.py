@@ -0,0 +1,133 @@
+import os
+import re
+import bisect
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Parsed lyrics files kept in memory
+CACHE_SIZE = 128
+
+# [mm:ss], [mm:ss.xx] or [mm:ss:xx] line timestamps
+TIMESTAMP = re.compile(r"\[(\d+):(\d{1,2}(?:[.:]\d{1,3})?)\]")
+# [ar:...], [ti:...], [offset:...] and other ID tags
+ID_TAG = re.compile(r"^\[([a-zA-Z]+):(.*)\]$")
+
+
+class Lyrics:
+    """A song's lyrics; synchronized ones carry a start time per line."""
+
+    def __init__(self, text, lines=(), times=()):
+        """text is the plain lyrics; lines and times are parallel and sorted by time for LRC files."""
+        self.text = text
+        self.lines = list(lines)
+        self.times = list(times)
+
+    @property
+    def synced(self):
+        return bool(self.times)
+
+    def line_at(self, position):
+        """Return the index of the line being sung at position seconds, or None before the first one."""
+        index = bisect.bisect_right(self.times, position) - 1
+        return index if index >= 0 else None
+
+
+def parse_lrc(content):
+    """Parse LRC content into Lyrics; a line with several timestamps is repeated at each of them."""
+    offset = 0.0
+    timed = []
+    for raw_line in content.splitlines():
+        line = raw_line.strip()
+        stamps = TIMESTAMP.findall(line)
+        if not stamps:
+            tag = ID_TAG.match(line)
+            if tag and tag.group(1).lower() == "offset":
+                try:
+                    # A positive offset shows every line earlier (milliseconds)
+                    offset = int(tag.group(2).strip()) / 1000
+                except ValueError:
+                    pass
+            continue
+        words = TIMESTAMP.sub("", line).strip()
+        for minutes, seconds in stamps:
+            timed.append((int(minutes) * 60 + float(seconds.replace(":", ".")), words))
+    timed.sort(key=lambda item: item[0])
+    times = [max(0.0, start - offset) for start, _ in timed]
+    lines = [words for _, words in timed]
+    return Lyrics("\n".join(lines), lines, times)
+
+
+def looks_like_lrc(content):
+    """True when the first line that is not blank or an ID tag starts with a timestamp."""
+    for raw_line in content.splitlines():
+        line = raw_line.strip()
+        if line and not (ID_TAG.match(line) and not TIMESTAMP.match(line)):
+            return TIMESTAMP.match(line) is not None
+    return False
+
+
+def parse_lyrics(path, content):
+    """Parse a lyrics file: LRC when it has the extension or timed lines, plain text otherwise.
+
+    Uploaded lyrics are saved as lyrics.txt, so timed content is recognised
+    whatever the extension.
+    """
+    if path.lower().endswith(".lrc") or looks_like_lrc(content):
+        lyrics = parse_lrc(content)
+        if lyrics.synced:
+            return lyrics
+    return Lyrics(content)
+
+
+class LyricsService:
+    """Loads lyrics files through an LRU cache validated by mtime and size.
+
+    A song's .lrc file (next to the media file or its .txt) is preferred over
+    the plain .txt. Repeated lookups cost one stat(); the file is read and
+    parsed again only when it changed.
+    """
+
+    def __init__(self, capacity=CACHE_SIZE):
+        """Keep up to capacity parsed files."""
+        self.capacity = capacity
+        self.entries = OrderedDict()  # path -> (mtime_ns, size, Lyrics)
+        self.lock = threading.Lock()
+
+    def load(self, path):
+        """Return the Lyrics of a file, or None when it does not exist or cannot be read."""
+        try:
+            stat_result = os.stat(path)
+        except OSError:
+            return None
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry[:2] == (stat_result.st_mtime_ns, stat_result.st_size):
+                self.entries.move_to_end(path)
+                return entry[2]
+        try:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                lyrics = parse_lyrics(path, f.read())
+        except OSError as e:
+            logger.warning(f"Could not read lyrics {path}: {e}")
+            return None
+        with self.lock:
+            self.entries[path] = (stat_result.st_mtime_ns, stat_result.st_size, lyrics)
+            self.entries.move_to_end(path)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+        return lyrics
+
+    def for_media(self, media_file, text_file=None):
+        """Return the Lyrics of a song from its media file (and catalog text file, if known), or None."""
+        candidates = [os.path.splitext(media_file)[0] + ".lrc"]
+        if text_file:
+            candidates += [os.path.splitext(text_file)[0] + ".lrc", text_file]
+        candidates.append(os.path.splitext(media_file)[0] + ".txt")
+        for path in dict.fromkeys(candidates):
+            lyrics = self.load(path)
+            if lyrics is not None:
+                return lyrics
+        return None
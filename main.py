@@ -2,12 +2,38 @@ import flet as ft
 import os
 import shutil
 import bcrypt
+import time
+import bisect
 from datetime import datetime
+from duration_index import DurationIndex
+from library_index import LibraryIndex
+from music_list import MusicList
+from thumbnails import ThumbnailCache, find_source_images
+from audio_engine import AudioEngine
+from loudness import LoudnessIndex, gain_to_scale
+from lyrics import LyricsService
+from progress_scheduler import ProgressScheduler
 
 # Define the application paths
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MP3_DIR = os.path.join(BASE_DIR, "mp3_files")
 PICTURES_DIR = os.path.join(BASE_DIR, "pictures")
+CACHE_DIR = os.path.join(BASE_DIR, "cache")
+SONGS_DATA_DIR = os.path.join(BASE_DIR, "data", "songs")
+
+# Maximum progress bar / time label pushes per second for each client
+PROGRESS_RATE_HZ = float(os.getenv("PROGRESS_RATE_HZ", "4"))
+# Seconds before the end of a track at which the next queued track starts buffering
+PRELOAD_LEAD_SECONDS = float(os.getenv("PRELOAD_LEAD_SECONDS", "15"))
+# Seconds the outgoing and incoming tracks overlap on autoplay (0 = instant switch)
+CROSSFADE_SECONDS = float(os.getenv("CROSSFADE_SECONDS", "0"))
+# Seconds between autoplay preload/crossfade checks; independent of the UI frame budget
+AUTOPLAY_CHECK_SECONDS = 0.25
+# Waveform scrubber drawn from the precomputed peaks (python waveform_peaks.py)
+WAVEFORM_BARS = 160
+WAVEFORM_BAR_WIDTH = 3
+WAVEFORM_BAR_SPACING = 1
+WAVEFORM_HEIGHT = 48
 
 # Ensure directories exist
 os.makedirs(MP3_DIR, exist_ok=True)
@@ -42,7 +68,29 @@ class GospelJukeBox:
         self.song_duration = 0  # Total duration in seconds
         self.progress_timer = None  # Timer for updating progress
         self.queue = []  # List of song indices in the queue for autoplay
-        self.active_audio_controls = []  # Global list to track all active audio controls
+        self.audio_engine = AudioEngine(
+            page, on_state_changed=self.audio_state_changed, crossfade=CROSSFADE_SECONDS
+        )  # Owns the active and preloaded audio controls
+        self.preloaded_index = None  # Song index buffered in the engine's standby slot
+        self.last_autoplay_check = 0.0  # Monotonic time of the last preload/crossfade check
+        self.duration_index = DurationIndex(os.path.join(CACHE_DIR, "duration_index.json"))
+        self.loudness_index = LoudnessIndex(os.path.join(CACHE_DIR, "loudness_index.json"))
+        self.library_indexes = {}  # (directory, extensions) -> LibraryIndex
+        self.music_list = MusicList(self.select_song, self.toggle_queue)
+        self.thumbnails = ThumbnailCache(os.path.join(CACHE_DIR, "thumbnails"))
+        self.feature_store = None  # Precomputed audio features, loaded on first use
+        self.peaks_store = None  # Precomputed waveform peaks, loaded on first use
+        self.waveform = None  # Scrubber of the song on screen
+        self.waveform_bars = []
+        self.waveform_played = 0  # Bars drawn in the played color
+        self.lyrics_service = LyricsService()  # Parsed lyrics, re-read only when the file changes
+        self.synced_lyrics = None  # Timed lyrics of the song on screen (LRC files only)
+        self.lyric_lines = []
+        self.lyrics_current = None  # Index of the highlighted lyric line
+        self.progress_scheduler = ProgressScheduler(self.render_progress, rate_hz=PROGRESS_RATE_HZ)
+        # Stop pushing progress while the app or window is hidden
+        self.page.on_app_lifecycle_state_change = self.progress_scheduler.visibility_event
+        self.page.on_window_event = self.progress_scheduler.visibility_event
         
         # Initialize UI components
         self.init_ui()
@@ -239,9 +287,21 @@ class GospelJukeBox:
         ])
     
     def load_content(self):
-        # Load songs and pictures from directories
+        # Load songs and pictures from the cached library indexes
         self.songs_list = self.get_media_list(MP3_DIR, ".mp3")
         self.pictures_list = self.get_media_list(PICTURES_DIR, ".jpg", ".png", ".jpeg")
+        # Measure loudness of new tracks in the background; they play unlevelled until then
+        music_index = self.library_indexes.get((MP3_DIR, (".mp3",)))
+        if music_index is not None:
+            self.loudness_index.measure_in_background(
+                (song["media_file"] for song in self.songs_list if song.get("gain_db") is None),
+                on_done=lambda count: music_index.apply_gains()
+            )
+        # Waveform peaks are built the same way; a song without them shows no scrubber
+        if self.get_peaks_store():
+            self.peaks_store.generate_in_background(song["media_file"] for song in self.songs_list)
+        # Build any missing thumbnails in the background before they are asked for
+        self.thumbnails.warm(find_source_images(PICTURES_DIR, SONGS_DATA_DIR))
         
         # Display the appropriate content based on current view
         if self.current_view == "music":
@@ -250,80 +310,37 @@ class GospelJukeBox:
             self.display_pictures_list()
     
     def get_media_list(self, directory, *extensions):
-        media_list = []
-        if os.path.exists(directory):
-            # First, check for media files directly in the directory
-            direct_media_files = []
-            for ext in extensions:
-                direct_media_files.extend([f for f in os.listdir(directory) if f.lower().endswith(ext)])
-            
-            # Add direct media files to the list
-            for media_file in direct_media_files:
-                file_name = os.path.splitext(media_file)[0]  # Get name without extension
-                media_path = os.path.join(directory, media_file)
-                
-                # Create a default text file path (may not exist)
-                text_file_path = os.path.join(directory, f"{file_name}.txt")
-                
-                # If text file doesn't exist, create a placeholder
-                if not os.path.exists(text_file_path):
-                    with open(text_file_path, 'w') as f:
-                        f.write(f"Lyrics for {file_name}")
-                
-                media_list.append({
-                    "name": file_name,
-                    "media_file": media_path,
-                    "text_file": text_file_path
-                })
-            
-            # Then check subdirectories as before
-            for folder_name in os.listdir(directory):
-                folder_path = os.path.join(directory, folder_name)
-                if os.path.isdir(folder_path):
-                    # Look for media files with the specified extensions
-                    media_files = []
-                    for ext in extensions:
-                        media_files.extend([f for f in os.listdir(folder_path) if f.lower().endswith(ext)])
-                    
-                    # Look for text files (lyrics or descriptions)
-                    text_files = [f for f in os.listdir(folder_path) if f.lower().endswith(".txt")]
-                    
-                    if media_files and text_files:
-                        media_list.append({
-                            "name": folder_name,
-                            "media_file": os.path.join(folder_path, media_files[0]),
-                            "text_file": os.path.join(folder_path, text_files[0])
-                        })
-        return media_list
+        if not os.path.exists(directory):
+            return []
+        key = (directory, extensions)
+        if key not in self.library_indexes:
+            index_name = os.path.basename(os.path.normpath(directory))
+            self.library_indexes[key] = LibraryIndex(
+                directory,
+                os.path.join(CACHE_DIR, f"library_{index_name}.json"),
+                extensions=extensions,
+                create_placeholder_lyrics=True,
+                duration_index=self.duration_index if ".mp3" in extensions else None,
+                loudness_index=self.loudness_index if ".mp3" in extensions else None
+            )
+        # Only directories whose mtime changed since the last call are listed again
+        return self.library_indexes[key].refresh(force=True)
     
     def display_music_list(self):
-        # Clear current content
-        content_column = ft.Column(scroll=ft.ScrollMode.AUTO)
+        # Reuse the virtualized list; rows are only rebuilt when the song list changed
+        self.music_list.set_songs(self.songs_list, self.queue)
         
-        if not self.songs_list:
-            content_column.controls.append(ft.Text("No songs available"))
-        else:
-            for i, song in enumerate(self.songs_list):
-                # Check if this song is in the queue
-                in_queue = i in self.queue
-                
-                content_column.controls.append(
-                    ft.ListTile(
-                        leading=ft.Icon(ft.icons.MUSIC_NOTE),
-                        title=ft.Text(song["name"]),
-                        subtitle=ft.Text("In Queue" if in_queue else ""),
-                        trailing=ft.Checkbox(
-                            value=in_queue,
-                            on_change=lambda e, idx=i: self.toggle_queue(e, idx)
-                        ),
-                        on_click=lambda e, idx=i: self.select_song(idx)
-                    )
-                )
-        
-        self.content_area.content = content_column
+        self.content_area.content = self.music_list.view
         self.player_controls.visible = bool(self.songs_list)
         self.page.update()
     
+    def refresh_queue_display(self):
+        # Patch only the rows whose queue state changed, or show the list if it is not on screen
+        if self.content_area.content is self.music_list.view and self.music_list.attached():
+            self.music_list.sync_queue(self.queue)
+        elif self.current_view == "music":
+            self.display_music_list()
+    
     def display_pictures_list(self):
         # Clear current content
         content_column = ft.Column(scroll=ft.ScrollMode.AUTO)
@@ -341,16 +358,20 @@ class GospelJukeBox:
             )
             
             for i, picture in enumerate(self.pictures_list):
+                image = ft.Image(
+                    width=180,
+                    height=150,
+                    fit=ft.ImageFit.COVER
+                )
+                # Until its thumbnail is ready the tile shows the original, then swaps in place
+                image.src = self.thumbnails.get(
+                    picture["media_file"], "grid", on_ready=lambda path, image=image: self._swap_image(image, path)
+                )
                 grid.controls.append(
                     ft.Card(
                         content=ft.Container(
                             content=ft.Column([
-                                ft.Image(
-                                    src=picture["media_file"],
-                                    width=180,
-                                    height=150,
-                                    fit=ft.ImageFit.COVER
-                                ),
+                                image,
                                 ft.Text(picture["name"], size=14)
                             ]),
                             padding=10,
@@ -365,79 +386,135 @@ class GospelJukeBox:
         self.player_controls.visible = False
         self.page.update()
     
+    def describe_features(self, media_file):
+        # Tempo and key from the offline analysis cache (python audio_analysis.py); never decodes audio
+        if self.feature_store is None:
+            try:
+                from audio_analysis import FeatureStore
+                self.feature_store = FeatureStore()
+            except ImportError as ex:
+                print(f"Audio features unavailable: {ex}")
+                self.feature_store = False
+        features = self.feature_store.get(media_file) if self.feature_store else None
+        if not features:
+            return ""
+        return f"{features['tempo']:.0f} BPM · {features['key']}"
+    
+    def get_peaks_store(self):
+        # Waveform peaks files; reading them needs numpy but never decodes audio
+        if self.peaks_store is None:
+            try:
+                from waveform_peaks import PeaksStore
+                self.peaks_store = PeaksStore(os.path.join(CACHE_DIR, "peaks"))
+            except ImportError as ex:
+                print(f"Waveforms unavailable: {ex}")
+                self.peaks_store = False
+        return self.peaks_store
+    
+    def build_waveform(self, media_file):
+        # Draw the song's peaks as a row of bars; tapping a bar seeks there
+        self.waveform = None
+        self.waveform_bars = []
+        self.waveform_played = 0
+        peaks = self.peaks_store.get(media_file) if self.get_peaks_store() else None
+        if peaks is None or not peaks.duration:
+            return None
+        
+        for low, high in peaks.window(0, peaks.duration, WAVEFORM_BARS).tolist():
+            amplitude = max(-low, high) / 128
+            self.waveform_bars.append(ft.Container(
+                width=WAVEFORM_BAR_WIDTH,
+                height=max(2, round(amplitude * WAVEFORM_HEIGHT)),
+                bgcolor=ft.colors.BLUE_200,
+                border_radius=1
+            ))
+        self.waveform = ft.GestureDetector(
+            content=ft.Row(
+                self.waveform_bars,
+                spacing=WAVEFORM_BAR_SPACING,
+                height=WAVEFORM_HEIGHT,
+                vertical_alignment=ft.CrossAxisAlignment.CENTER
+            ),
+            on_tap_down=self.waveform_tapped
+        )
+        return self.waveform
+    
+    def build_lyrics(self, song):
+        # One Text per line for timed (LRC) lyrics so the sung line can be highlighted in place
+        self.synced_lyrics = None
+        self.lyric_lines = []
+        self.lyrics_current = None
+        lyrics = self.lyrics_service.for_media(song["media_file"], song.get("text_file"))
+        if lyrics is None:
+            return ft.Text("No lyrics available", color=ft.colors.BLACK)
+        if not lyrics.synced:
+            return ft.Text(lyrics.text, color=ft.colors.BLACK)
+        
+        self.synced_lyrics = lyrics
+        self.lyric_lines = [ft.Text(line, color=ft.colors.BLACK54) for line in lyrics.lines]
+        return ft.Column(self.lyric_lines, spacing=4)
+    
+    def waveform_tapped(self, e):
+        # Seek to the tapped fraction of the song
+        if not self.song_duration or not self.waveform_bars:
+            return
+        width = len(self.waveform_bars) * (WAVEFORM_BAR_WIDTH + WAVEFORM_BAR_SPACING)
+        position = min(max(e.local_x / width, 0.0), 1.0) * self.song_duration
+        self.render_progress(int(position))
+        self.seek_to(position)
+    
+    def _swap_image(self, image, src):
+        # Point an image at its freshly built thumbnail if it is still on screen
+        image.src = src
+        if image.page is not None:
+            image.update()
+    
     def select_song(self, index):
-        # First, stop all audio playback on the page
-        try:
-            # Stop and release the current audio control if it exists
-            if self.current_audio_control:
-                try:
-                    if hasattr(self.current_audio_control, 'pause'):
-                        self.current_audio_control.pause()
-                    if hasattr(self.current_audio_control, 'release'):
-                        self.current_audio_control.release()
-                    print(f"Stopped current audio control: {id(self.current_audio_control)}")
-                except Exception as ex:
-                    print(f"Error stopping current audio: {ex}")
-            
-            # Master stop: check all page controls to find and stop any audio elements
-            print("Performing master audio stop...")
-            # First check the content area which contains the audio control
-            if self.content_area and hasattr(self.content_area, 'content'):
-                self._stop_audio_in_control(self.content_area.content)
-                
-            # Then check all page controls as a fallback
-            for control in self.page.controls:
-                self._stop_audio_in_control(control)
-                
-            # Force a small delay to ensure audio has stopped
-            self.page.update()
-        except Exception as e:
-            print(f"Error in master audio stop: {e}")
-        
         self.current_song_index = index
         self.current_song = self.songs_list[index]
+        self.preloaded_index = None
+        
+        # Switch the engine to the new track first; a preloaded track starts without
+        # fetching anything and the previous one is paused (or crossfaded) by the engine
+        self.current_audio_control = self.audio_engine.load(
+            self.current_song["media_file"], gain=self.track_gain(self.current_song)
+        )
+        if self.is_playing:
+            self.audio_engine.play()
         
         # Ensure the current song is in the queue if autoplay is enabled
-        if self.autoplay and index not in self.queue:
-            self.queue.append(index)
-            self.queue.sort()  # Keep queue in order
+        if self.autoplay:
+            position = bisect.bisect_left(self.queue, index)
+            if position == len(self.queue) or self.queue[position] != index:
+                self.queue.insert(position, index)  # Keep queue in order
         
         # Reset progress tracking
+        self.progress_scheduler.reset()
         self.current_position = 0
-        self.song_duration = 0
+        # The probed duration is known up front; durationchange may have fired while the track was preloading
+        self.song_duration = self.current_song.get("duration") or 0
         self.progress_slider.value = 0
-        self.progress_slider.disabled = True
+        if self.song_duration:
+            self.progress_slider.max = self.song_duration
+        self.progress_slider.disabled = not self.song_duration
         self.update_time_display()
         
         # Display song details and lyrics
-        lyrics = "No lyrics available"
-        if os.path.exists(self.current_song["text_file"]):
-            with open(self.current_song["text_file"], "r") as f:
-                lyrics = f.read()
-        
-        # Create audio control with a unique ID for tracking
-        audio_control = ft.Audio(
-            src=self.current_song["media_file"],
-            autoplay=False,  # Important: don't autoplay yet
-            volume=1.0,
-            on_state_changed=self.audio_state_changed
-        )
-        
-        # Store reference to the audio control
-        self.current_audio_control = audio_control
-        
-        # Add to the global tracking list
-        if audio_control not in self.active_audio_controls:
-            self.active_audio_controls.append(audio_control)
-            print(f"Added audio control to tracking list: {id(audio_control)}")
+        lyrics_view = self.build_lyrics(self.current_song)
         
-        content_column = ft.Column([
+        header = [
             ft.Text(f"Now Playing: {self.current_song['name']}", size=20, weight=ft.FontWeight.BOLD),
-            audio_control,
+            ft.Text(self.describe_features(self.current_song["media_file"]), size=12, italic=True),
+        ]
+        waveform = self.build_waveform(self.current_song["media_file"])
+        if waveform is not None:
+            header.append(waveform)
+        
+        content_column = ft.Column(header + [
             ft.Divider(),
             ft.Text("Lyrics:", weight=ft.FontWeight.BOLD),
             ft.Container(
-                content=ft.Text(lyrics, color=ft.colors.BLACK),
+                content=lyrics_view,
                 padding=10,
                 bgcolor=ft.colors.BLUE_50,
                 border_radius=10,
@@ -454,18 +531,6 @@ class GospelJukeBox:
         self.content_area.content = content_column
         self.player_controls.visible = True
         self.page.update()
-        
-        # Now that the audio control is added to the page and we've ensured all other
-        # audio is stopped, we can play it if needed
-        if self.is_playing and self.current_audio_control:
-            try:
-                print(f"Starting playback of new audio: {id(self.current_audio_control)}")
-                if hasattr(self.current_audio_control, 'play'):
-                    self.current_audio_control.play()
-            except Exception as e:
-                print(f"Error playing audio: {e}")
-        
-        self.page.update()
     
     def select_picture(self, index):
         self.current_picture = self.pictures_list[index]
@@ -480,7 +545,7 @@ class GospelJukeBox:
             ft.Text(self.current_picture["name"], size=20, weight=ft.FontWeight.BOLD),
             ft.Container(
                 content=ft.Image(
-                    src=self.current_picture["media_file"],
+                    src=self.thumbnails.get(self.current_picture["media_file"], "detail"),
                     fit=ft.ImageFit.CONTAIN,
                     width=600
                 ),
@@ -528,64 +593,39 @@ class GospelJukeBox:
             e.control.icon = ft.icons.PLAY_ARROW
             e.control.data = "play"
         
-        # If we're starting playback, ensure all other audio is stopped first
-        if self.is_playing:
-            try:
-                # Stop all other audio controls except the current one
-                print("Stopping all other audio controls before starting playback...")
-                
-                # Use our global tracking list to stop all audio except current one
-                for audio in list(self.active_audio_controls):
-                    if audio != self.current_audio_control:
-                        try:
-                            if hasattr(audio, 'pause'):
-                                audio.pause()
-                            if hasattr(audio, 'release'):
-                                audio.release()
-                            print(f"Stopped other audio control: {id(audio)}")
-                            
-                            # Remove from tracking list
-                            if audio in self.active_audio_controls:
-                                self.active_audio_controls.remove(audio)
-                        except Exception as ex:
-                            print(f"Error stopping other audio: {ex}")
-                
-                # Force a small delay to ensure audio has stopped
-                self.page.update()
-            except Exception as ex:
-                print(f"Error in stopping other audio during toggle_play: {ex}")
-        
         # Control the audio element directly
         if self.current_audio_control:
             try:
                 if self.is_playing:
-                    if hasattr(self.current_audio_control, 'play'):
-                        self.current_audio_control.play()
-                        # Enable the slider when playback starts
-                        self.progress_slider.disabled = False
-                        
-                        # Get the current position from the audio control to ensure slider is in sync
-                        try:
-                            current_ms = self.current_audio_control.get_current_position()
-                            self.current_position = current_ms / 1000  # Convert from ms to seconds
-                            self.progress_slider.value = self.current_position
-                            self.update_time_display()
-                            print(f"Updated slider position on play: {self.current_position} seconds")
-                        except Exception as pos_ex:
-                            print(f"Error getting current position on play: {pos_ex}")
+                    # Continue a paused track instead of restarting it
+                    if self.audio_engine.state == "paused":
+                        self.audio_engine.resume()
+                    else:
+                        self.audio_engine.play()
+                    # Enable the slider when playback starts
+                    self.progress_slider.disabled = False
+                    
+                    # Get the current position from the audio control to ensure slider is in sync
+                    try:
+                        current_ms = self.current_audio_control.get_current_position()
+                        self.current_position = current_ms / 1000  # Convert from ms to seconds
+                        self.progress_slider.value = self.current_position
+                        self.update_time_display()
+                        print(f"Updated slider position on play: {self.current_position} seconds")
+                    except Exception as pos_ex:
+                        print(f"Error getting current position on play: {pos_ex}")
                 else:
-                    if hasattr(self.current_audio_control, 'pause'):
-                        self.current_audio_control.pause()
-                        
-                        # Get the current position from the audio control to ensure slider is in sync
-                        try:
-                            current_ms = self.current_audio_control.get_current_position()
-                            self.current_position = current_ms / 1000  # Convert from ms to seconds
-                            self.progress_slider.value = self.current_position
-                            self.update_time_display()
-                            print(f"Updated slider position on pause: {self.current_position} seconds")
-                        except Exception as pos_ex:
-                            print(f"Error getting current position on pause: {pos_ex}")
+                    self.audio_engine.pause()
+                    
+                    # Get the current position from the audio control to ensure slider is in sync
+                    try:
+                        current_ms = self.current_audio_control.get_current_position()
+                        self.current_position = current_ms / 1000  # Convert from ms to seconds
+                        self.progress_slider.value = self.current_position
+                        self.update_time_display()
+                        print(f"Updated slider position on pause: {self.current_position} seconds")
+                    except Exception as pos_ex:
+                        print(f"Error getting current position on pause: {pos_ex}")
             except Exception as e:
                 print(f"Error controlling audio: {e}")
         elif self.current_song:
@@ -594,14 +634,6 @@ class GospelJukeBox:
         
         self.page.update()
     
-    def _play_audio_after_update(self, audio_control):
-        # This method is called after the page update to ensure the audio control is properly initialized
-        try:
-            if hasattr(audio_control, 'play'):
-                audio_control.play()
-        except Exception as e:
-            print(f"Error playing audio: {e}")
-    
     def audio_state_changed(self, e):
         # Handle audio state changes (for autoplay functionality and progress tracking)
         print(f"Audio state changed: {e.data}")
@@ -620,36 +652,35 @@ class GospelJukeBox:
                 print(f"Error getting duration: {ex}")
         
         elif e.data == "timeupdate" and self.current_audio_control:
-            # Update current position
+            # Preloading and crossfading must keep working while the window is hidden, so they
+            # have their own throttle; the progress push follows the UI frame budget
+            now = time.monotonic()
+            autoplay_due = (
+                self.autoplay and self.song_duration > 0
+                and now - self.last_autoplay_check >= AUTOPLAY_CHECK_SECONDS
+            )
+            ui_due = self.progress_scheduler.due()
+            # Skip the position round trip entirely when neither needs it
+            if not (autoplay_due or ui_due):
+                return
             try:
-                # Get the current position from the audio control
-                current_ms = self.current_audio_control.get_current_position()
-                self.current_position = current_ms / 1000  # Convert from ms to seconds
+                self.sync_position()
                 
-                # Ensure position is within valid range
-                if self.current_position < 0:
-                    self.current_position = 0
-                elif self.current_position > self.song_duration and self.song_duration > 0:
-                    self.current_position = self.song_duration
-                
-                # Update the slider to match the current position
-                self.progress_slider.value = self.current_position
-                # Update the time display with the current position
-                self.update_time_display()
-                
-                # Check if we're near the end of the song (within 0.5 seconds) to ensure smooth transition
-                if self.autoplay and self.current_position >= self.song_duration - 0.5 and self.song_duration > 0:
-                    print("Near end of song, preparing for next song")
-                    # This will ensure we don't trigger this multiple times
-                    self.current_position = self.song_duration
-                    self.progress_slider.value = self.song_duration
-                    self.update_time_display()
-                    # Force the "ended" event by seeking to the end
-                    if hasattr(self.current_audio_control, 'seek'):
-                        self.current_audio_control.seek(int(self.song_duration * 1000))
+                if autoplay_due:
+                    self.last_autoplay_check = now
+                    remaining = self.song_duration - self.current_position
+                    # Buffer the next track in the standby slot ahead of the end
+                    if remaining <= PRELOAD_LEAD_SECONDS and self.preloaded_index is None:
+                        self.preload_next_song()
+                    # With crossfade the switch starts before the end instead of on "ended"
+                    if CROSSFADE_SECONDS > 0 and remaining <= CROSSFADE_SECONDS and self.preloaded_index is not None:
+                        self.current_song_index = self.preloaded_index
+                        self.select_song(self.current_song_index)
+                        return
                 
-                # Force a page update to reflect changes in UI
-                self.page.update()
+                # Coalesced push of only the controls that changed
+                if ui_due:
+                    self.progress_scheduler.submit(int(self.current_position))
             except Exception as ex:
                 print(f"Error getting current time: {ex}")
         
@@ -657,12 +688,9 @@ class GospelJukeBox:
             # When playback starts or resumes, ensure the slider position is in sync
             try:
                 if self.current_audio_control:
-                    current_ms = self.current_audio_control.get_current_position()
-                    self.current_position = current_ms / 1000  # Convert from ms to seconds
-                    self.progress_slider.value = self.current_position
-                    self.update_time_display()
+                    self.sync_position()
                     print(f"Updated position on play event: {self.current_position} seconds")
-                    self.page.update()
+                    self.progress_scheduler.submit(int(self.current_position), force=True)
             except Exception as ex:
                 print(f"Error updating position on play event: {ex}")
         
@@ -670,17 +698,15 @@ class GospelJukeBox:
             # When playback is paused, ensure the slider position is in sync
             try:
                 if self.current_audio_control:
-                    current_ms = self.current_audio_control.get_current_position()
-                    self.current_position = current_ms / 1000  # Convert from ms to seconds
-                    self.progress_slider.value = self.current_position
-                    self.update_time_display()
+                    self.sync_position()
                     print(f"Updated position on pause event: {self.current_position} seconds")
-                    self.page.update()
+                    self.progress_scheduler.submit(int(self.current_position), force=True)
             except Exception as ex:
                 print(f"Error updating position on pause event: {ex}")
         
-        elif e.data == "ended":
+        elif e.data in ("ended", "completed"):
             # Reset position when song ends
+            self.progress_scheduler.reset()
             self.current_position = 0
             self.progress_slider.value = 0
             self.update_time_display()
@@ -690,77 +716,70 @@ class GospelJukeBox:
                 # Ensure playing state is set to True for autoplay
                 self.is_playing = True
                 
-                # Find the next song in the queue
-                next_song_index = None
-                
-                # If queue is empty, use all songs
-                if not self.queue:
-                    self.queue = list(range(len(self.songs_list)))
-                
-                # Find the current song's position in the queue
-                if self.current_song_index in self.queue:
-                    current_queue_position = self.queue.index(self.current_song_index)
-                    # Get the next song in the queue (wrap around if needed)
-                    if current_queue_position < len(self.queue) - 1:
-                        next_song_index = self.queue[current_queue_position + 1]
-                    else:
-                        # Loop back to the beginning of the queue if loop_queue is enabled
-                        if self.loop_queue:
-                            next_song_index = self.queue[0]
-                            print("Looping back to first song in queue")
-                        else:
-                            # Stop playback if we reached the end of the queue and loop is disabled
-                            self.is_playing = False
-                            play_button = self.player_controls.controls[0].controls[1]
-                            play_button.icon = ft.icons.PLAY_ARROW
-                            play_button.data = "play"
-                            self.page.update()
-                            return
-                else:
-                    # Current song not in queue, start from the beginning of the queue
-                    if self.queue:
-                        next_song_index = self.queue[0]
-                    else:
-                        # Fallback: move to the next song in the list
-                        next_song_index = (self.current_song_index + 1) % len(self.songs_list)
+                # A preloaded track is already buffered in the engine's standby slot
+                next_song_index = self.preloaded_index
+                if next_song_index is None:
+                    next_song_index = self.next_queue_index()
+                if next_song_index is None:
+                    # Stop playback if we reached the end of the queue and loop is disabled
+                    self.is_playing = False
+                    play_button = self.player_controls.controls[0].controls[1]
+                    play_button.icon = ft.icons.PLAY_ARROW
+                    play_button.data = "play"
+                    self.page.update()
+                    return
                 
                 # Play the next song
-                if next_song_index is not None:
-                    # First stop all audio playback to prevent multiple songs playing
-                    try:
-                        # Stop and release the current audio control if it exists
-                        if self.current_audio_control:
-                            try:
-                                if hasattr(self.current_audio_control, 'pause'):
-                                    self.current_audio_control.pause()
-                                if hasattr(self.current_audio_control, 'release'):
-                                    self.current_audio_control.release()
-                                print(f"Stopped current audio control before autoplay: {id(self.current_audio_control)}")
-                            except Exception as ex:
-                                print(f"Error stopping current audio before autoplay: {ex}")
-                        
-                        # Master stop: check all page controls to find and stop any audio elements
-                        print("Performing master audio stop before autoplay...")
-                        # First check the content area which contains the audio control
-                        if self.content_area and hasattr(self.content_area, 'content'):
-                            self._stop_audio_in_control(self.content_area.content)
-                            
-                        # Then check all page controls as a fallback
-                        for control in self.page.controls:
-                            self._stop_audio_in_control(control)
-                            
-                        # Force a small delay to ensure audio has stopped
-                        self.page.update()
-                    except Exception as e:
-                        print(f"Error in master audio stop before autoplay: {e}")
-                    
-                    # Now play the next song
-                    self.current_song_index = next_song_index
-                    self.select_song(self.current_song_index)
+                self.current_song_index = next_song_index
+                self.select_song(self.current_song_index)
             else:
                 print(f"Song ended but autoplay is {self.autoplay}")
                 self.page.update()
     
+    def next_queue_index(self):
+        # Index of the song autoplay moves to next, or None at the end of a non-looping queue
+        # If queue is empty, use all songs
+        if not self.queue:
+            self.queue = list(range(len(self.songs_list)))
+        
+        # Find the current song's position in the queue
+        position = bisect.bisect_left(self.queue, self.current_song_index)
+        if position < len(self.queue) and self.queue[position] == self.current_song_index:
+            # Get the next song in the queue (wrap around if needed)
+            if position < len(self.queue) - 1:
+                return self.queue[position + 1]
+            # Loop back to the beginning of the queue if loop_queue is enabled
+            if self.loop_queue:
+                print("Looping back to first song in queue")
+                return self.queue[0]
+            return None
+        # Current song not in queue, start from the beginning of the queue
+        if self.queue:
+            return self.queue[0]
+        # Fallback: move to the next song in the list
+        return (self.current_song_index + 1) % len(self.songs_list) if self.songs_list else None
+    
+    def track_gain(self, song):
+        # Volume multiplier that levels the song to the loudness target (1.0 until measured)
+        gain_db = song.get("gain_db")
+        if gain_db is None:
+            gain_db = self.loudness_index.get_gain(song["media_file"])
+        return gain_to_scale(gain_db)
+    
+    def preload_next_song(self):
+        # Start buffering the song autoplay will move to next
+        next_song_index = self.next_queue_index()
+        if next_song_index is None or next_song_index == self.current_song_index:
+            return
+        self.preloaded_index = next_song_index
+        try:
+            next_song = self.songs_list[next_song_index]
+            self.audio_engine.preload(next_song["media_file"], gain=self.track_gain(next_song))
+            print(f"Preloaded next song: {self.songs_list[next_song_index]['name']}")
+        except Exception as ex:
+            self.preloaded_index = None
+            print(f"Error preloading next song: {ex}")
+    
     def play_previous(self, e):
         if not self.songs_list:
             return
@@ -768,33 +787,8 @@ class GospelJukeBox:
         # Set playing state to true when previous button is pressed
         self.is_playing = True
         
-        # Perform a complete audio stop to prevent multiple songs playing
-        try:
-            # Stop and release the current audio control if it exists
-            if self.current_audio_control:
-                try:
-                    if hasattr(self.current_audio_control, 'pause'):
-                        self.current_audio_control.pause()
-                    if hasattr(self.current_audio_control, 'release'):
-                        self.current_audio_control.release()
-                    print(f"Stopped current audio control: {id(self.current_audio_control)}")
-                except Exception as ex:
-                    print(f"Error stopping current audio: {ex}")
-            
-            # Master stop: check all page controls to find and stop any audio elements
-            print("Performing master audio stop in play_previous...")
-            # First check the content area which contains the audio control
-            if self.content_area and hasattr(self.content_area, 'content'):
-                self._stop_audio_in_control(self.content_area.content)
-                
-            # Then check all page controls as a fallback
-            for control in self.page.controls:
-                self._stop_audio_in_control(control)
-                
-            # Force a small delay to ensure audio has stopped
-            self.page.update()
-        except Exception as e:
-            print(f"Error in master audio stop: {e}")
+        # Stop the current track before switching
+        self.audio_engine.stop()
         
         # Find the previous song in the queue if autoplay is enabled
         if self.autoplay and self.queue:
@@ -839,33 +833,8 @@ class GospelJukeBox:
         elif e is None and self.autoplay:
             self.is_playing = True
         
-        # Perform a complete audio stop to prevent multiple songs playing
-        try:
-            # Stop and release the current audio control if it exists
-            if self.current_audio_control:
-                try:
-                    if hasattr(self.current_audio_control, 'pause'):
-                        self.current_audio_control.pause()
-                    if hasattr(self.current_audio_control, 'release'):
-                        self.current_audio_control.release()
-                    print(f"Stopped current audio control in play_next: {id(self.current_audio_control)}")
-                except Exception as ex:
-                    print(f"Error stopping current audio in play_next: {ex}")
-            
-            # Master stop: check all page controls to find and stop any audio elements
-            print("Performing master audio stop in play_next...")
-            # First check the content area which contains the audio control
-            if self.content_area and hasattr(self.content_area, 'content'):
-                self._stop_audio_in_control(self.content_area.content)
-                
-            # Then check all page controls as a fallback
-            for control in self.page.controls:
-                self._stop_audio_in_control(control)
-                
-            # Force a small delay to ensure audio has stopped
-            self.page.update()
-        except Exception as e:
-            print(f"Error in master audio stop in play_next: {e}")
+        # Stop the current track before switching
+        self.audio_engine.stop()
         
         # Find the next song in the queue if autoplay is enabled
         if self.autoplay and self.queue:
@@ -900,32 +869,41 @@ class GospelJukeBox:
         play_button.data = "pause"
         self.page.update()
     
+    def forget_preload(self):
+        # The next track depends on the queue, loop and autoplay settings; pick it again
+        self.preloaded_index = None
+        self.last_autoplay_check = 0.0
+    
     def toggle_autoplay(self, e):
         self.autoplay = e.control.value
+        self.forget_preload()
         
         # If autoplay is enabled but queue is empty, add all songs to queue
         if self.autoplay and not self.queue:
             self.queue = list(range(len(self.songs_list)))
             # Refresh the display to show queue status
-            self.display_music_list()
+            self.refresh_queue_display()
     
     def toggle_queue(self, e, index):
-        # Add or remove the song from the queue
-        if e.control.value:
-            if index not in self.queue:
-                self.queue.append(index)
-        else:
-            if index in self.queue:
-                self.queue.remove(index)
-        
-        # Sort the queue to maintain the original song order
-        self.queue.sort()
+        # Add or remove the song from the queue, keeping it in the original song order
+        position = bisect.bisect_left(self.queue, index)
+        queued = position < len(self.queue) and self.queue[position] == index
+        if e.control.value and not queued:
+            self.queue.insert(position, index)
+        elif not e.control.value and queued:
+            del self.queue[position]
+        self.forget_preload()
+        
+        # Only this row's subtitle and checkbox change
+        self.music_list.set_queued(index, bool(e.control.value))
         
     def seek_position(self, e):
         # Update the position when user drags the slider
+        self.seek_to(e.control.value)
+    
+    def seek_to(self, position):
         if self.current_audio_control and hasattr(self.current_audio_control, 'seek'):
             try:
-                position = e.control.value
                 # Ensure position is within valid range
                 if position < 0:
                     position = 0
@@ -967,6 +945,48 @@ class GospelJukeBox:
             except Exception as ex:
                 print(f"Error seeking position: {ex}")
     
+    def sync_position(self):
+        # Read the playback position from the client and clamp it to the song
+        current_ms = self.current_audio_control.get_current_position()
+        self.current_position = current_ms / 1000  # Convert from ms to seconds
+        if self.current_position < 0:
+            self.current_position = 0
+        elif self.current_position > self.song_duration and self.song_duration > 0:
+            self.current_position = self.song_duration
+    
+    def render_progress(self, seconds):
+        # Apply a whole-second position to the slider and time label; return the controls that changed
+        changed = []
+        if self.progress_slider.value != seconds:
+            self.progress_slider.value = seconds
+            changed.append(self.progress_slider)
+        # Recolor only the waveform bars the position moved across
+        if self.waveform_bars and self.song_duration:
+            played = min(len(self.waveform_bars), int(seconds / self.song_duration * len(self.waveform_bars)))
+            if played != self.waveform_played and self.waveform.page is not None:
+                low, high = sorted((played, self.waveform_played))
+                for bar_index in range(low, high):
+                    bar = self.waveform_bars[bar_index]
+                    bar.bgcolor = ft.colors.BLUE_700 if bar_index < played else ft.colors.BLUE_200
+                    changed.append(bar)
+                self.waveform_played = played
+        # Move the lyric highlight; finding the line is a bisect over the parsed timestamps
+        if self.synced_lyrics is not None and self.lyric_lines[0].page is not None:
+            current = self.synced_lyrics.line_at(seconds)
+            if current != self.lyrics_current:
+                for line_index, bold in ((self.lyrics_current, False), (current, True)):
+                    if line_index is not None:
+                        line = self.lyric_lines[line_index]
+                        line.weight = ft.FontWeight.BOLD if bold else None
+                        line.color = ft.colors.BLACK if bold else ft.colors.BLACK54
+                        changed.append(line)
+                self.lyrics_current = current
+        previous = self.time_display.value
+        self.update_time_display()
+        if self.time_display.value != previous:
+            changed.append(self.time_display)
+        return changed
+    
     def update_time_display(self):
         # Format time as minutes:seconds for current position
         current_min = int(self.current_position // 60)
@@ -1047,13 +1067,14 @@ class GospelJukeBox:
     def toggle_loop(self, e):
         # Update loop_queue state
         self.loop_queue = e.control.value
+        self.forget_preload()
         
         # If loop is enabled and autoplay is enabled, make sure we have a queue
         if self.loop_queue and self.autoplay and not self.queue:
             # Add all songs to queue if it's empty
             self.queue = list(range(len(self.songs_list)))
             # Refresh the display to show queue status
-            self.display_music_list()
+            self.refresh_queue_display()
         
         print(f"Loop queue set to: {self.loop_queue}")
         self.page.update()
@@ -1061,10 +1082,11 @@ class GospelJukeBox:
     def stop_current_song(self, e):
         # Stop the current song and reset player
         try:
-            # Stop all tracked audio controls using our global list
-            self.stop_all_audio()
+            # Stop and rewind the engine's audio control
+            self.audio_engine.stop()
             
             # Reset UI state
+            self.progress_scheduler.reset()
             self.is_playing = False
             self.current_position = 0
             self.progress_slider.value = 0
@@ -1076,7 +1098,7 @@ class GospelJukeBox:
             play_button.icon = ft.icons.PLAY_ARROW
             play_button.data = "play"
             
-            # Set current_audio_control to None so toggle_play will create a new one
+            # Set current_audio_control to None so toggle_play reloads the song into the engine
             self.current_audio_control = None
             
             self.page.update()
@@ -1084,76 +1106,8 @@ class GospelJukeBox:
             print(f"Error in master stop: {e}")
             
     def stop_all_audio(self):
-        """Stop all tracked audio controls"""
-        print(f"Stopping all {len(self.active_audio_controls)} tracked audio controls")
-        
-        # First, stop all tracked audio controls
-        for audio in list(self.active_audio_controls):
-            try:
-                if hasattr(audio, 'pause'):
-                    audio.pause()
-                if hasattr(audio, 'release'):
-                    audio.release()
-                print(f"Stopped tracked audio control: {id(audio)}")
-            except Exception as ex:
-                print(f"Error stopping tracked audio: {ex}")
-            
-            # Remove from tracking list
-            if audio in self.active_audio_controls:
-                self.active_audio_controls.remove(audio)
-        
-        # As a fallback, also use the recursive method to find any untracked audio controls
-        if self.content_area and hasattr(self.content_area, 'content'):
-            self._stop_audio_in_control(self.content_area.content)
-            
-        for control in self.page.controls:
-            self._stop_audio_in_control(control)
-    
-    def _stop_audio_in_control(self, control, exclude_control=None):
-        # Recursively search for and stop all audio controls
-        # exclude_control parameter allows skipping a specific control (useful when toggling play/pause)
-        try:
-            # Check if this control is an Audio control by checking its type name
-            if control.__class__.__name__ == 'Audio':
-                # Skip this control if it's the one we want to exclude
-                if exclude_control is not None and id(control) == id(exclude_control):
-                    print(f"Skipping excluded audio control: {id(control)}")
-                    return
-                    
-                try:
-                    if hasattr(control, 'pause'):
-                        control.pause()
-                    if hasattr(control, 'release'):
-                        control.release()
-                    print(f"Stopped an audio control: {id(control)}")
-                    
-                    # Add to tracking list if not already there
-                    if control not in self.active_audio_controls:
-                        self.active_audio_controls.append(control)
-                        print(f"Added found audio control to tracking list: {id(control)}")
-                    # Remove from tracking list if it's being stopped
-                    elif control in self.active_audio_controls and exclude_control is None:
-                        self.active_audio_controls.remove(control)
-                        print(f"Removed audio control from tracking list: {id(control)}")
-                except Exception as inner_ex:
-                    print(f"Error stopping specific audio control: {inner_ex}")
-            
-            # Check if this control has controls property (like Container, Column, etc.)
-            if hasattr(control, 'controls') and control.controls:
-                for child in control.controls:
-                    self._stop_audio_in_control(child, exclude_control)
-                    
-            # Check if this control has content property (like Container)
-            if hasattr(control, 'content') and control.content:
-                self._stop_audio_in_control(control.content, exclude_control)
-                
-            # Check for tabs and their content
-            if hasattr(control, 'tabs') and control.tabs:
-                for tab in control.tabs:
-                    if hasattr(tab, 'content') and tab.content:
-                        self._stop_audio_in_control(tab.content, exclude_control)
-        except Exception as ex:
-            print(f"Error in recursive audio stop: {ex}")
+        """Stop the engine's audio control (the only one on the page)"""
+        self.audio_engine.stop()
     
     def upload_type_changed(self, e):
         # Update UI based on selected upload type
@@ -1244,4 +1198,7 @@ def main(page: ft.Page):
     
     app = GospelJukeBox(page)
 
-ft.app(target=main)
\ No newline at end of file
+# Guarded so the loudness and peaks worker processes, which import this
+# script when they spawn, do not start a second app
+if __name__ == "__main__":
+    ft.app(target=main)
@@ -0,0 +1,289 @@
+import os
+import logging
+import mimetypes
+import threading
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, unquote, urlencode, urlsplit
+
+from renditions import RENDITIONS, choose_rendition
+
+logger = logging.getLogger(__name__)
+
+# Size of each chunk written to the socket while streaming a file
+CHUNK_SIZE = 64 * 1024
+# Clients whose current stream (original or rendition) is remembered for follow-up Range requests
+STREAM_CHOICES_SIZE = 1024
+
+
+def make_etag(stat_result):
+    """Build a strong ETag from a file's size and modification time."""
+    return f'"{stat_result.st_mtime_ns:x}-{stat_result.st_size:x}"'
+
+
+def parse_range_header(range_header, file_size):
+    """Parse a single-range 'bytes=' header into an inclusive (start, end) tuple.
+
+    Returns None when the header should be ignored (malformed or multi-range)
+    and raises ValueError when the range cannot be satisfied.
+    """
+    if not range_header or not range_header.startswith("bytes="):
+        return None
+    spec = range_header[len("bytes="):].strip()
+    if "," in spec or "-" not in spec:
+        return None
+
+    start_text, end_text = (part.strip() for part in spec.split("-", 1))
+    if not (start_text or end_text) or not (start_text + end_text).isdigit():
+        return None
+
+    if start_text == "":
+        # Suffix range: the last N bytes of the file
+        suffix_length = int(end_text)
+        if suffix_length == 0:
+            raise ValueError("Empty suffix range")
+        start = max(0, file_size - suffix_length)
+        end = file_size - 1
+    else:
+        start = int(start_text)
+        end = int(end_text) if end_text else file_size - 1
+
+    if start >= file_size or start > end:
+        raise ValueError("Range not satisfiable")
+    return start, min(end, file_size - 1)
+
+
+class MediaRequestHandler(BaseHTTPRequestHandler):
+    """Serves files below the media root with Range, ETag and Last-Modified support.
+
+    With a rendition cache attached, audio requests may be answered with a
+    transcoded variant chosen per client (see renditions.choose_rendition).
+    The choice is made when a stream starts at byte 0 and kept for that
+    client's later Range requests, so a variant finishing mid-stream never
+    splices two encodings into one playback.
+    """
+
+    server_version = "GospelJukeBoxMedia/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        self._serve(send_body=True)
+
+    def do_HEAD(self):
+        self._serve(send_body=False)
+
+    def log_message(self, format, *args):
+        logger.debug("%s - %s", self.address_string(), format % args)
+
+    def _resolve_path(self):
+        """Map the request path onto a file inside the media root, or None."""
+        media_root = self.server.media_root
+        relative_path = unquote(urlsplit(self.path).path).lstrip("/")
+        full_path = os.path.realpath(os.path.join(media_root, relative_path))
+        # Refuse anything that escapes the media root (e.g. '../')
+        if os.path.commonpath([media_root, full_path]) != media_root:
+            return None
+        return full_path if os.path.isfile(full_path) else None
+
+    def _is_not_modified(self, etag, stat_result):
+        """Evaluate If-None-Match / If-Modified-Since against the current file."""
+        if_none_match = self.headers.get("If-None-Match")
+        if if_none_match:
+            return etag in [tag.strip() for tag in if_none_match.split(",")] or if_none_match.strip() == "*"
+        if_modified_since = self.headers.get("If-Modified-Since")
+        if if_modified_since:
+            try:
+                return int(stat_result.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+            except (TypeError, ValueError):
+                return False
+        return False
+
+    def _range_allowed(self, etag, last_modified):
+        """Only honour Range when If-Range (if present) still matches the file."""
+        if_range = self.headers.get("If-Range")
+        return not if_range or if_range.strip() in (etag, last_modified)
+
+    def _select_variant(self, source, content_type):
+        """Return the (path, content_type) to send for source: the original or a rendition."""
+        renditions = self.server.renditions
+        if renditions is None or not content_type.startswith("audio/"):
+            return source, content_type
+
+        client = (self.headers.get("X-Forwarded-For") or self.client_address[0],
+                  self.headers.get("User-Agent", ""), source)
+        range_header = self.headers.get("Range", "").replace(" ", "")
+        choices = self.server.stream_choices
+        if range_header and not range_header.startswith("bytes=0-"):
+            # Continue with whatever this stream started on
+            with self.server.choices_lock:
+                variant = choices.get(client)
+        else:
+            requested = parse_qs(urlsplit(self.path).query).get("rendition", [None])[0]
+            name = choose_rendition(self.headers, requested)
+            variant = None
+            if name is not None:
+                try:
+                    path = renditions.get(source, name)
+                except OSError as e:
+                    logger.warning(f"Could not look up {name} rendition of {source}: {e}")
+                    path = None
+                if path is not None:
+                    variant = (path, RENDITIONS[name]["content_type"])
+            with self.server.choices_lock:
+                choices[client] = variant
+                choices.move_to_end(client)
+                while len(choices) > STREAM_CHOICES_SIZE:
+                    choices.popitem(last=False)
+        if variant is None or not os.path.isfile(variant[0]):
+            return source, content_type
+        return variant
+
+    def _serve(self, send_body):
+        file_path = self._resolve_path()
+        if file_path is None:
+            self.send_error(HTTPStatus.NOT_FOUND, "File not found")
+            return
+
+        content_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+        file_path, content_type = self._select_variant(file_path, content_type)
+        stat_result = os.stat(file_path)
+        file_size = stat_result.st_size
+        etag = make_etag(stat_result)
+        last_modified = formatdate(stat_result.st_mtime, usegmt=True)
+
+        if self._is_not_modified(etag, stat_result):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self._send_common_headers(etag, last_modified)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+
+        byte_range = None
+        if self._range_allowed(etag, last_modified):
+            try:
+                byte_range = parse_range_header(self.headers.get("Range"), file_size)
+            except ValueError:
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self._send_common_headers(etag, last_modified)
+                self.send_header("Content-Range", f"bytes */{file_size}")
+                self.send_header("Content-Length", "0")
+                self.end_headers()
+                return
+
+        if byte_range:
+            start, end = byte_range
+            self.send_response(HTTPStatus.PARTIAL_CONTENT)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{file_size}")
+        else:
+            start, end = 0, file_size - 1
+            self.send_response(HTTPStatus.OK)
+
+        length = end - start + 1 if file_size else 0
+        self._send_common_headers(etag, last_modified)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(length))
+        self.end_headers()
+
+        if send_body and length:
+            self._copy_range(file_path, start, length)
+
+    def _send_common_headers(self, etag, last_modified):
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("ETag", etag)
+        self.send_header("Last-Modified", last_modified)
+        self.send_header("Cache-Control", "public, max-age=3600")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        if self.server.renditions is not None:
+            # Without an explicit ?rendition= the body depends on these request headers
+            self.send_header("Vary", "Save-Data, User-Agent")
+
+    def _copy_range(self, file_path, start, length):
+        try:
+            with open(file_path, "rb") as media_file:
+                media_file.seek(start)
+                remaining = length
+                while remaining > 0:
+                    chunk = media_file.read(min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                    remaining -= len(chunk)
+        except (BrokenPipeError, ConnectionResetError):
+            # Browsers routinely abort a request when the user seeks
+            logger.debug("Client closed connection while streaming %s", file_path)
+
+
+class MediaServer:
+    """Background HTTP server that streams files from a media directory."""
+
+    def __init__(self, media_root, host="0.0.0.0", port=8502, public_url=None, renditions=None):
+        """Create the server; nothing is bound until start() is called.
+
+        renditions is an optional RenditionCache used to send lower-bitrate
+        variants to clients that ask for them or signal a slow connection.
+        """
+        self.media_root = os.path.realpath(media_root)
+        self.host = host
+        self.port = port
+        self.public_url = public_url
+        self.renditions = renditions
+        self.httpd = None
+        self.thread = None
+
+    @property
+    def base_url(self):
+        """URL prefix for a browser on this machine."""
+        return self.base_url_for()
+
+    def base_url_for(self, request_host=None):
+        """URL prefix for a browser that reached the app at request_host (its Host header).
+
+        The URL is resolved by the browser, not by this process, so unless a
+        public_url is configured it points at the host the viewer already
+        used for the app, on this server's port.
+        """
+        if self.public_url:
+            return self.public_url.rstrip("/")
+        hostname = urlsplit(f"//{request_host}").hostname if request_host else None
+        hostname = hostname or "localhost"
+        if ":" in hostname:
+            hostname = f"[{hostname}]"  # IPv6 literal
+        return f"http://{hostname}:{self.port}"
+
+    def start(self):
+        """Bind the socket and serve requests from a daemon thread."""
+        if self.httpd is not None:
+            return self
+        self.httpd = ThreadingHTTPServer((self.host, self.port), MediaRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.media_root = self.media_root
+        self.httpd.renditions = self.renditions
+        self.httpd.stream_choices = OrderedDict()
+        self.httpd.choices_lock = threading.Lock()
+        # Pick up the real port when an ephemeral port (0) was requested
+        self.port = self.httpd.server_address[1]
+        self.thread = threading.Thread(target=self.httpd.serve_forever, name="media-server", daemon=True)
+        self.thread.start()
+        logger.info(f"Media server serving {self.media_root} on {self.host}:{self.port}")
+        return self
+
+    def stop(self):
+        """Shut the server down and release the socket."""
+        if self.httpd is None:
+            return
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.httpd = None
+        self.thread = None
+
+    def url_for(self, relative_path, rendition=None, request_host=None):
+        """Return the streaming URL for a file relative to the media root.
+
+        rendition pins a RENDITIONS name, "low" or "original" instead of
+        letting the server choose from the client's headers; request_host is passed
+        to base_url_for().
+        """
+        url = f"{self.base_url_for(request_host)}/{quote(relative_path.replace(os.sep, '/'))}"
+        return f"{url}?{urlencode({'rendition': rendition})}" if rendition else url
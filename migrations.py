@@ -0,0 +1,275 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Schema history shared by the Streamlit app (init_db) and DatabaseManager.
+# Each migration runs exactly once per database file: the number of the last
+# one applied is stored in PRAGMA user_version, so once a database is current
+# opening it costs a single PRAGMA read and no schema introspection.
+#
+# Append new migrations at the end with the next number; never edit or
+# renumber one that has shipped.
+
+
+def _columns(cursor, table):
+    """Return the column names of a table (empty when it does not exist)."""
+    cursor.execute(f"PRAGMA table_info({table})")
+    return [row[1] for row in cursor.fetchall()]
+
+
+def _baseline(cursor):
+    """Create every table the apps use, upgrading legacy column sets in place."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS votes (
+            song_name TEXT,
+            vote INTEGER
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            username TEXT PRIMARY KEY,
+            password TEXT,
+            is_admin INTEGER DEFAULT 0
+        )
+    ''')
+    # 'label' added for multi-type sheet music (2025-04-21),
+    # 'creator_username' for permission management (2025-04-22)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS instrument_sheet_music (
+            song_name TEXT,
+            instrument TEXT,
+            label TEXT,
+            file_path TEXT,
+            creator_username TEXT,
+            PRIMARY KEY (song_name, instrument, label)
+        )
+    ''')
+    # Per-user, per-label notes; DatabaseManager's per-song notes are the
+    # row with an empty username and label
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS song_notes (
+            song_name TEXT NOT NULL,
+            username TEXT NOT NULL DEFAULT '',
+            label TEXT NOT NULL DEFAULT '',
+            notes TEXT,
+            last_updated TIMESTAMP,
+            PRIMARY KEY (song_name, username, label)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS labels (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            song_title TEXT NOT NULL,
+            name TEXT NOT NULL,
+            UNIQUE (song_title, name)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS sheet_music (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            song_name TEXT NOT NULL,
+            label_id TEXT,
+            file_path TEXT NOT NULL,
+            upload_date TIMESTAMP,
+            FOREIGN KEY(label_id) REFERENCES labels(id)
+        )
+    ''')
+
+    # Legacy databases predate these columns
+    if 'is_admin' not in _columns(cursor, 'users'):
+        cursor.execute("ALTER TABLE users ADD COLUMN is_admin INTEGER DEFAULT 0")
+    sheet_music_columns = _columns(cursor, 'instrument_sheet_music')
+    if 'label' not in sheet_music_columns:
+        cursor.execute("ALTER TABLE instrument_sheet_music ADD COLUMN label TEXT DEFAULT ''")
+    if 'creator_username' not in sheet_music_columns:
+        cursor.execute("ALTER TABLE instrument_sheet_music ADD COLUMN creator_username TEXT DEFAULT ''")
+
+    # Default admin account (demo only; passwords are stored in plain text)
+    if 'role' in _columns(cursor, 'users'):
+        cursor.execute(
+            "INSERT OR IGNORE INTO users (username, password, is_admin, role) VALUES (?, ?, ?, ?)",
+            ('admin', 'admin123', 1, 'admin')
+        )
+    else:
+        cursor.execute(
+            "INSERT OR IGNORE INTO users (username, password, is_admin) VALUES (?, ?, ?)",
+            ('admin', 'admin123', 1)
+        )
+
+
+def _reconcile_song_notes(cursor):
+    """Convert a DatabaseManager-style song_notes (id, song_name UNIQUE) to the shared schema."""
+    if 'username' in _columns(cursor, 'song_notes'):
+        return
+    cursor.execute('''
+        CREATE TABLE song_notes_new (
+            song_name TEXT NOT NULL,
+            username TEXT NOT NULL DEFAULT '',
+            label TEXT NOT NULL DEFAULT '',
+            notes TEXT,
+            last_updated TIMESTAMP,
+            PRIMARY KEY (song_name, username, label)
+        )
+    ''')
+    cursor.execute('''
+        INSERT OR REPLACE INTO song_notes_new (song_name, notes, last_updated)
+        SELECT song_name, notes, last_updated FROM song_notes ORDER BY id
+    ''')
+    cursor.execute("DROP TABLE song_notes")
+    cursor.execute("ALTER TABLE song_notes_new RENAME TO song_notes")
+
+
+def _reconcile_sheet_music(cursor):
+    """Give a legacy sheet_music (song_name UNIQUE, no label_id) the labelled layout and its upsert key."""
+    if 'label_id' not in _columns(cursor, 'sheet_music'):
+        cursor.execute('''
+            CREATE TABLE sheet_music_new (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                song_name TEXT NOT NULL,
+                label_id TEXT,
+                file_path TEXT NOT NULL,
+                upload_date TIMESTAMP,
+                FOREIGN KEY(label_id) REFERENCES labels(id)
+            )
+        ''')
+        cursor.execute('''
+            INSERT INTO sheet_music_new (id, song_name, file_path, upload_date)
+            SELECT id, song_name, file_path, upload_date FROM sheet_music
+        ''')
+        cursor.execute("DROP TABLE sheet_music")
+        cursor.execute("ALTER TABLE sheet_music_new RENAME TO sheet_music")
+    # Keep the newest row of any duplicates so the unique index can be built;
+    # older ones are logged and moved to sheet_music_duplicates, not lost.
+    # NULL label_ids are distinct in a UNIQUE index, so those rows all stay.
+    cursor.execute('''
+        SELECT id, song_name, label_id, file_path FROM sheet_music
+        WHERE label_id IS NOT NULL AND id NOT IN (
+            SELECT MAX(id) FROM sheet_music WHERE label_id IS NOT NULL GROUP BY song_name, label_id
+        )
+    ''')
+    duplicates = cursor.fetchall()
+    if duplicates:
+        cursor.execute("CREATE TABLE IF NOT EXISTS sheet_music_duplicates AS SELECT * FROM sheet_music WHERE 0")
+        for row_id, song_name, label_id, file_path in duplicates:
+            logger.warning(
+                f"Moving duplicate sheet music {row_id} ({song_name}, label {label_id}, {file_path}) "
+                f"to sheet_music_duplicates"
+            )
+        ids = [(row[0],) for row in duplicates]
+        cursor.executemany("INSERT INTO sheet_music_duplicates SELECT * FROM sheet_music WHERE id = ?", ids)
+        cursor.executemany("DELETE FROM sheet_music WHERE id = ?", ids)
+    cursor.execute(
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_sheet_music_song_label ON sheet_music (song_name, label_id)"
+    )
+
+
+def _retire_instrument_sheet_music_old(cursor):
+    """Fold rows from the pre-label instrument_sheet_music_old table in, then drop it."""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'instrument_sheet_music_old'")
+    if not cursor.fetchone():
+        return
+    cursor.execute('''
+        INSERT OR IGNORE INTO instrument_sheet_music (song_name, instrument, label, file_path, creator_username)
+        SELECT song_name, instrument, '', file_path, '' FROM instrument_sheet_music_old
+    ''')
+    cursor.execute("DROP TABLE instrument_sheet_music_old")
+
+
+def _vote_tallies(cursor):
+    """Running vote totals per song and per day, maintained by a trigger on votes."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS vote_totals (
+            song_name TEXT PRIMARY KEY,
+            total INTEGER NOT NULL DEFAULT 0,
+            vote_count INTEGER NOT NULL DEFAULT 0
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS vote_daily_totals (
+            day TEXT,
+            song_name TEXT,
+            total INTEGER NOT NULL DEFAULT 0,
+            vote_count INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, song_name)
+        )
+    ''')
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'votes_tally_ai'")
+    if cursor.fetchone():
+        # Installed by init_db before migrations existed; totals are already seeded
+        return
+    cursor.execute('''
+        CREATE TRIGGER votes_tally_ai AFTER INSERT ON votes BEGIN
+            INSERT INTO vote_totals (song_name, total, vote_count) VALUES (NEW.song_name, NEW.vote, 1)
+            ON CONFLICT(song_name) DO UPDATE SET total = total + excluded.total, vote_count = vote_count + 1;
+            INSERT INTO vote_daily_totals (day, song_name, total, vote_count) VALUES (date('now'), NEW.song_name, NEW.vote, 1)
+            ON CONFLICT(day, song_name) DO UPDATE SET total = total + excluded.total, vote_count = vote_count + 1;
+        END
+    ''')
+    # Legacy votes carry no timestamp, so they only seed the all-time totals
+    cursor.execute('''
+        INSERT INTO vote_totals (song_name, total, vote_count)
+        SELECT song_name, SUM(vote), COUNT(*) FROM votes WHERE song_name IS NOT NULL GROUP BY song_name
+        ON CONFLICT(song_name) DO UPDATE SET total = excluded.total, vote_count = excluded.vote_count
+    ''')
+
+
+def _lookup_indexes(cursor):
+    """Index the per-song lookups that are not already covered by a primary key."""
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_votes_song_name ON votes (song_name)")
+    # song_notes and instrument_sheet_music lookups by song_name are served by
+    # their primary keys, whose leading column is song_name
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sheet_music_label_id ON sheet_music (label_id)")
+
+
+# (version, name, apply) in the order they must run
+MIGRATIONS = [
+    (1, "baseline", _baseline),
+    (2, "reconcile song_notes", _reconcile_song_notes),
+    (3, "reconcile sheet_music", _reconcile_sheet_music),
+    (4, "retire instrument_sheet_music_old", _retire_instrument_sheet_music_old),
+    (5, "vote tallies", _vote_tallies),
+    (6, "lookup indexes", _lookup_indexes),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    """Return the migration number recorded in the database."""
+    return conn.execute("PRAGMA user_version").fetchone()[0]
+
+
+def migrate(conn, migrations=MIGRATIONS):
+    """Apply pending migrations, each in its own transaction; return the resulting version.
+
+    A current database costs one PRAGMA read. Each migration takes the write
+    lock (BEGIN IMMEDIATE) and re-reads user_version, so two processes
+    starting at once cannot both apply the same step.
+    """
+    version = schema_version(conn)
+    if version >= migrations[-1][0]:
+        return version
+    if conn.in_transaction:
+        conn.commit()
+    cursor = conn.cursor()
+    try:
+        for number, name, apply in migrations:
+            if number <= version:
+                continue
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                version = schema_version(conn)
+                if number > version:
+                    apply(cursor)
+                    # PRAGMA arguments cannot be bound parameters
+                    cursor.execute(f"PRAGMA user_version = {int(number)}")
+                    version = number
+                    logger.info(f"Applied database migration {number}: {name}")
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                logger.error(f"Database migration {number} ({name}) failed; schema left at version {version}")
+                raise
+    finally:
+        cursor.close()
+    return version
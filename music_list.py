@@ -0,0 +1,108 @@
+import logging
+
+import flet as ft
+
+logger = logging.getLogger(__name__)
+
+
+class MusicList:
+    """Virtualized song list that is built once and then patched in place.
+
+    Rows live in an ft.ListView with a fixed item extent, so the client only
+    lays out what is on screen, and rows are built lazily a page at a time as
+    the user scrolls towards the end. Queue membership is tracked as a set;
+    a queue change re-renders only the rows whose state actually flipped.
+    """
+
+    def __init__(self, on_select, on_toggle, item_extent=56, page_size=100):
+        """on_select(index) plays a song; on_toggle(event, index) handles its queue checkbox."""
+        self.on_select = on_select
+        self.on_toggle = on_toggle
+        self.page_size = page_size
+        self.songs = []
+        self.signature = None
+        self.rows = []
+        self.queued = set()
+        self.view = ft.ListView(
+            expand=True,
+            item_extent=item_extent,
+            on_scroll=self._scrolled,
+            on_scroll_interval=100
+        )
+
+    def attached(self):
+        """True when the list is on the page, so controls can be updated directly."""
+        return self.view.page is not None
+
+    def set_songs(self, songs, queue):
+        """Show songs with the given queue; rows are only rebuilt when the song list changed."""
+        signature = tuple(song["media_file"] for song in songs)
+        if signature != self.signature:
+            self.signature = signature
+            self.songs = songs
+            self.queued = set(queue)
+            self.rows = []
+            if not songs:
+                self.view.controls = [ft.Text("No songs available")]
+            else:
+                self.view.controls = self.rows
+                self._build_more()
+            return
+        self.songs = songs
+        self.sync_queue(queue, push=False)
+
+    def sync_queue(self, queue, push=True):
+        """Bring the rows in line with queue, updating only those whose state changed."""
+        queued = set(queue)
+        flipped = self.queued.symmetric_difference(queued)
+        self.queued = queued
+        changed = [self.rows[i] for i in flipped if i < len(self.rows)]
+        for row in changed:
+            self._apply_state(row)
+        if push and self.attached():
+            for row in changed:
+                row.update()
+        return changed
+
+    def set_queued(self, index, in_queue, push=True):
+        """Mark a single row as queued or not."""
+        queue = self.queued | {index} if in_queue else self.queued - {index}
+        return self.sync_queue(queue, push=push)
+
+    def _build_row(self, index):
+        """Build the tile for one song."""
+        row = ft.ListTile(
+            leading=ft.Icon(ft.icons.MUSIC_NOTE),
+            title=ft.Text(self.songs[index]["name"]),
+            subtitle=ft.Text(""),
+            trailing=ft.Checkbox(
+                value=False,
+                on_change=lambda e, idx=index: self.on_toggle(e, idx)
+            ),
+            on_click=lambda e, idx=index: self.on_select(idx),
+            data=index
+        )
+        self._apply_state(row)
+        return row
+
+    def _apply_state(self, row):
+        """Reflect the row's queue membership in its subtitle and checkbox."""
+        in_queue = row.data in self.queued
+        row.subtitle.value = "In Queue" if in_queue else ""
+        row.trailing.value = in_queue
+
+    def _build_more(self):
+        """Append the next page of rows; returns True when any were added."""
+        start = len(self.rows)
+        end = min(start + self.page_size, len(self.songs))
+        for index in range(start, end):
+            self.rows.append(self._build_row(index))
+        return end > start
+
+    def _scrolled(self, e):
+        """Build the next page once the user scrolls near the end of the built rows."""
+        # Half a page of rows ahead keeps the next page ready before it is reached
+        if e.max_scroll_extent - e.pixels > self.view.item_extent * self.page_size / 2:
+            return
+        if self._build_more() and self.attached():
+            self.view.update()
@@ -0,0 +1,192 @@
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import deque
+
+from migrations import migrate
+
+logger = logging.getLogger(__name__)
+
+# Plays kept in memory and on disk; older ones are dropped
+HISTORY_LIMIT = 500
+# Seconds changes are collected before they are written in one transaction
+FLUSH_INTERVAL = 2.0
+
+
+def _player_tables(cursor):
+    """History, queue and settings for the desktop player."""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS history (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            path TEXT NOT NULL,
+            played_at REAL NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS queue (
+            position INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            path TEXT NOT NULL
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS settings (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        )
+    ''')
+
+
+# Same runner as the app database, with this file's own history
+PLAYER_MIGRATIONS = [
+    (1, "player state", _player_tables),
+]
+
+
+class PlayerStateStore:
+    """Bounded play history, play queue and settings persisted to SQLite off the UI thread.
+
+    history is a deque capped at history_limit and queue a plain deque; the
+    player mutates them directly and reports changes with record_play(),
+    clear_history(), queue_changed() and save_settings(). A writer thread
+    collects changes for flush_interval seconds and then writes them in a
+    single transaction: new plays are appended and the table trimmed to the
+    cap, while the (small) queue is rewritten as a snapshot.
+    """
+
+    def __init__(self, db_path, history_limit=HISTORY_LIMIT, flush_interval=FLUSH_INTERVAL):
+        """Open (and migrate) the database, load the saved state and start the writer."""
+        self.db_path = db_path
+        self.history_limit = history_limit
+        self.flush_interval = flush_interval
+        self.history = deque(maxlen=history_limit)
+        self.queue = deque()
+        self.settings = {}
+        self.lock = threading.Lock()
+        self.pending_plays = []
+        self.history_cleared = False
+        self.queue_dirty = False
+        self.pending_settings = {}
+        self.wake = threading.Event()
+        self.closing = threading.Event()
+        self.load()
+        self.writer = threading.Thread(target=self._run, name="player-state-writer", daemon=True)
+        self.writer.start()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30.0)
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")
+        return conn
+
+    def load(self):
+        """Read the saved history, queue and settings."""
+        conn = self._connect()
+        try:
+            migrate(conn, PLAYER_MIGRATIONS)
+            rows = conn.execute(
+                "SELECT name, path FROM history ORDER BY id DESC LIMIT ?", (self.history_limit,)
+            ).fetchall()
+            self.history.extend({"name": name, "path": path} for name, path in reversed(rows))
+            self.queue.extend(
+                {"name": name, "path": path}
+                for name, path in conn.execute("SELECT name, path FROM queue ORDER BY position")
+            )
+            for key, value in conn.execute("SELECT key, value FROM settings"):
+                try:
+                    self.settings[key] = json.loads(value)
+                except ValueError:
+                    logger.warning(f"Ignoring unreadable setting {key!r}")
+        finally:
+            conn.close()
+
+    def record_play(self, song):
+        """Append a play to the history."""
+        self.history.append(song)
+        with self.lock:
+            self.pending_plays.append((song["name"], song["path"], time.time()))
+            # Plays beyond the cap would be trimmed right after being written
+            del self.pending_plays[:-self.history_limit]
+        self.wake.set()
+
+    def clear_history(self):
+        """Forget every play."""
+        self.history.clear()
+        with self.lock:
+            self.pending_plays = []
+            self.history_cleared = True
+        self.wake.set()
+
+    def queue_changed(self):
+        """Note that queue was modified so its snapshot is rewritten."""
+        with self.lock:
+            self.queue_dirty = True
+        self.wake.set()
+
+    def save_settings(self, settings):
+        """Update settings in memory and persist them in the background."""
+        self.settings.update(settings)
+        with self.lock:
+            self.pending_settings.update(settings)
+        self.wake.set()
+
+    def flush(self):
+        """Write every pending change in one transaction."""
+        with self.lock:
+            plays, self.pending_plays = self.pending_plays, []
+            cleared, self.history_cleared = self.history_cleared, False
+            queue_snapshot = list(self.queue) if self.queue_dirty else None
+            self.queue_dirty = False
+            settings, self.pending_settings = self.pending_settings, {}
+        if not (plays or cleared or queue_snapshot is not None or settings):
+            return
+
+        conn = self._connect()
+        try:
+            with conn:
+                if cleared:
+                    conn.execute("DELETE FROM history")
+                if plays:
+                    conn.executemany("INSERT INTO history (name, path, played_at) VALUES (?, ?, ?)", plays)
+                    conn.execute(
+                        "DELETE FROM history WHERE id NOT IN (SELECT id FROM history ORDER BY id DESC LIMIT ?)",
+                        (self.history_limit,)
+                    )
+                if queue_snapshot is not None:
+                    conn.execute("DELETE FROM queue")
+                    conn.executemany(
+                        "INSERT INTO queue (position, name, path) VALUES (?, ?, ?)",
+                        [(position, song["name"], song["path"]) for position, song in enumerate(queue_snapshot)]
+                    )
+                if settings:
+                    conn.executemany(
+                        "INSERT INTO settings (key, value) VALUES (?, ?) "
+                        "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                        [(key, json.dumps(value)) for key, value in settings.items()]
+                    )
+        finally:
+            conn.close()
+
+    def _run(self):
+        while not self.closing.is_set():
+            self.wake.wait()
+            self.wake.clear()
+            # Let a burst of changes accumulate; close() cuts the wait short
+            self.closing.wait(self.flush_interval)
+            try:
+                self.flush()
+            except sqlite3.Error as e:
+                logger.warning(f"Could not save player state to {self.db_path}: {e}")
+
+    def close(self):
+        """Stop the writer and write whatever is still pending."""
+        self.closing.set()
+        self.wake.set()
+        self.writer.join(timeout=5.0)
+        try:
+            self.flush()
+        except sqlite3.Error as e:
+            logger.warning(f"Could not save player state to {self.db_path}: {e}")
@@ -0,0 +1,100 @@
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Lifecycle / window event values after which nothing on screen can be seen
+HIDDEN_EVENTS = {"hide", "pause", "detach", "minimize"}
+VISIBLE_EVENTS = {"show", "resume", "restore", "maximize", "unmaximize", "focus"}
+
+
+class ProgressScheduler:
+    """Coalesces playback position events into at most rate_hz UI pushes per second.
+
+    Flet delivers position events far faster than a progress bar needs to
+    move, and every page.update() ships a diff of the whole page. Positions
+    submitted here only record the latest value; it is rendered at most once
+    per frame (the last one via a trailing timer), only when its displayed
+    value changed, and only the controls the render callback reports as
+    changed are updated. Nothing is pushed while the window is hidden.
+    """
+
+    def __init__(self, render, rate_hz=4.0):
+        """render(position) applies a position to controls and returns the ones that changed."""
+        self.render = render
+        self.interval = 1.0 / rate_hz if rate_hz > 0 else 0.0
+        self.lock = threading.Lock()
+        self.pending = None
+        self.last_rendered = None
+        self.last_push = 0.0
+        self.timer = None
+        self.hidden = False
+
+    def due(self):
+        """Return True when a push now would fit within the frame budget."""
+        return not self.hidden and time.monotonic() - self.last_push >= self.interval
+
+    def submit(self, position, force=False):
+        """Record the latest position and push it now if the frame budget allows, else later."""
+        with self.lock:
+            self.pending = position
+            if self.hidden:
+                return
+            wait = 0.0 if force else self.interval - (time.monotonic() - self.last_push)
+            if wait > 0:
+                # A trailing push makes sure the final position of a burst is shown
+                if self.timer is None:
+                    self.timer = threading.Timer(wait, self.flush)
+                    self.timer.daemon = True
+                    self.timer.start()
+                return
+        self.flush()
+
+    def flush(self):
+        """Render the pending position and update only the controls that changed."""
+        with self.lock:
+            self.timer = None
+            position = self.pending
+            if self.hidden or position is None:
+                return
+            self.pending = None
+            self.last_push = time.monotonic()
+            # Whole seconds are all the time label and slider can show
+            if position == self.last_rendered:
+                return
+            self.last_rendered = position
+        try:
+            for control in self.render(position) or ():
+                control.update()
+        except Exception as ex:
+            logger.warning(f"Progress update failed: {ex}")
+
+    def reset(self):
+        """Forget the last rendered value (new track) and drop any pending push."""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            self.pending = None
+            self.last_rendered = None
+            self.last_push = 0.0
+
+    def set_hidden(self, hidden):
+        """Pause pushes while the window is hidden; catch up once it is visible again."""
+        with self.lock:
+            self.hidden = hidden
+            if hidden and self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            catch_up = not hidden and self.pending is not None
+        if catch_up:
+            self.flush()
+
+    def visibility_event(self, e):
+        """Page lifecycle / window event handler that toggles hidden state."""
+        value = str(getattr(e, "data", "") or "").lower()
+        if value in HIDDEN_EVENTS:
+            self.set_hidden(True)
+        elif value in VISIBLE_EVENTS:
+            self.set_hidden(False)
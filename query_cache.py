@@ -0,0 +1,67 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+class QueryCache:
+    """Thread-safe read-through cache with TTL expiry and an LRU size bound.
+
+    Keys are tuples that start with (table, song_title, ...) so writes can
+    invalidate every cached read of a table for one song. A song_title of None
+    marks a read that is not scoped to a song; those are dropped on any write
+    to the table.
+    """
+
+    def __init__(self, max_entries=256, ttl=60.0):
+        """Create an empty cache holding at most max_entries results for ttl seconds."""
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, key, loader):
+        """Return the cached value for key, calling loader() on a miss or after expiry."""
+        now = time.monotonic()
+        with self.lock:
+            cached = self.entries.get(key)
+            if cached is not None and cached[0] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+
+        # Load outside the lock so a slow round trip doesn't block other keys
+        value = loader()
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return value
+
+    def invalidate(self, table, song_title=None):
+        """Drop cached reads of a table for one song (and unscoped reads), or all of it."""
+        with self.lock:
+            stale = [
+                key for key in self.entries
+                if key[0] == table and (song_title is None or key[1] in (song_title, None))
+            ]
+            for key in stale:
+                del self.entries[key]
+        if stale:
+            logger.debug(f"Invalidated {len(stale)} cached {table} reads for {song_title or 'all songs'}")
+
+    def clear(self):
+        """Drop every cached result."""
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        """Return hit/miss counters and the current size."""
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self.entries)}
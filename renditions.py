@@ -0,0 +1,179 @@
+import os
+import shutil
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# Lower-bitrate variants the media server may send instead of the original;
+# name -> pydub/ffmpeg export settings and the Content-Type of the result
+RENDITIONS = {
+    "opus-48k": {"format": "ogg", "codec": "libopus", "bitrate": "48k", "ext": ".opus",
+                 "content_type": "audio/ogg"},
+    "aac-64k": {"format": "adts", "codec": "aac", "bitrate": "64k", "ext": ".aac",
+                "content_type": "audio/aac"},
+}
+
+# Rendition sent to low-bandwidth clients, by codec family
+LOW_BANDWIDTH = {"opus": "opus-48k", "aac": "aac-64k"}
+# ?rendition= value asking for the low-bandwidth rendition the client can play
+LOW = "low"
+
+# Transcodes waiting or running at once; requests beyond this serve the original
+MAX_PENDING = 32
+# Source digests remembered per (path, mtime, size)
+DIGEST_CACHE_SIZE = 4096
+
+
+def transcoding_available():
+    """True when pydub is installed and ffmpeg is on PATH."""
+    try:
+        import pydub  # noqa: F401
+    except ImportError:
+        return False
+    return shutil.which("ffmpeg") is not None
+
+
+def content_digest(path, chunk_size=1024 * 1024):
+    """Return the SHA-1 of a file's contents."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def transcode(source, target, rendition):
+    """Encode source into target with the given rendition settings, atomically."""
+    from pydub import AudioSegment
+
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    tmp_path = f"{target}.tmp"
+    try:
+        AudioSegment.from_file(source).export(
+            tmp_path, format=rendition["format"], codec=rendition["codec"], bitrate=rendition["bitrate"]
+        )
+        os.replace(tmp_path, target)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return target
+
+
+def choose_rendition(headers, requested=None):
+    """Pick the rendition for a client from its request headers, or None for the original.
+
+    An explicit ?rendition= choice (a RENDITIONS name, "low" or "original")
+    wins; the players pass "low" when the listener turns on data saver.
+    Otherwise only the Save-Data header switches: the network client hints
+    are not sent to the media server, which is on another origin. A
+    low-bandwidth client gets a codec it can play: AAC for Safari, which
+    has no Opus-in-Ogg support, Opus for the rest.
+    """
+    if requested and requested != LOW:
+        return requested if requested in RENDITIONS else None
+    if requested != LOW and headers.get("Save-Data", "").strip().lower() != "on":
+        return None
+
+    user_agent = headers.get("User-Agent", "")
+    is_safari = "Safari" in user_agent and "Chrome" not in user_agent and "Chromium" not in user_agent
+    return LOW_BANDWIDTH["aac" if is_safari else "opus"]
+
+
+class RenditionCache:
+    """Content-addressed cache of transcoded variants, filled by a bounded worker pool.
+
+    Variants are stored as <digest>-<rendition><ext> under cache_dir, keyed
+    by the SHA-1 of the source bytes, so a file is transcoded once however
+    many paths or copies refer to it, and an edited file gets new variants.
+    get() never blocks on hashing or ffmpeg: both run on the pool and the
+    caller serves the original until the variant is ready.
+    """
+
+    def __init__(self, cache_dir, workers=2, max_pending=MAX_PENDING):
+        """Use cache_dir for variants and run at most workers ffmpeg processes at once."""
+        self.cache_dir = cache_dir
+        self.max_pending = max_pending
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="transcode")
+        self.lock = threading.Lock()
+        self.pending = {}  # (path, mtime_ns, size, rendition) -> future
+        self.failed = set()  # (path, mtime_ns, size, rendition) ffmpeg could not produce
+        self.digests = OrderedDict()  # (path, mtime_ns, size) -> digest
+
+    def digest_for(self, source):
+        """Return the content digest of source, hashing it only when it changed."""
+        stat_result = os.stat(source)
+        key = (source, stat_result.st_mtime_ns, stat_result.st_size)
+        with self.lock:
+            digest = self.digests.get(key)
+            if digest is not None:
+                self.digests.move_to_end(key)
+                return digest
+        digest = content_digest(source)
+        with self.lock:
+            self.digests[key] = digest
+            while len(self.digests) > DIGEST_CACHE_SIZE:
+                self.digests.popitem(last=False)
+        return digest
+
+    def path_for(self, source, name):
+        """Return where the named variant of source is (or will be) stored; hashes source if needed."""
+        return self._target(self.digest_for(source), name)
+
+    def _target(self, digest, name):
+        return os.path.join(self.cache_dir, digest[:2], f"{digest}-{name}{RENDITIONS[name]['ext']}")
+
+    def get(self, source, name):
+        """Return the path of a ready variant, or None after queueing the work to produce it.
+
+        Costs one stat() and a dictionary lookup; a source whose digest is
+        not known yet is hashed on the pool.
+        """
+        stat_result = os.stat(source)
+        key = (source, stat_result.st_mtime_ns, stat_result.st_size)
+        with self.lock:
+            digest = self.digests.get(key)
+            if digest is not None:
+                self.digests.move_to_end(key)
+        if digest is not None:
+            target = self._target(digest, name)
+            if os.path.exists(target):
+                return target
+        self.submit(key, name)
+        return None
+
+    def submit(self, key, name):
+        """Queue a (path, mtime_ns, size) source for hashing and transcoding unless already queued or failed."""
+        job = key + (name,)
+        with self.lock:
+            if job in self.pending or job in self.failed:
+                return
+            if len(self.pending) >= self.max_pending:
+                logger.debug(f"Transcode queue full; {key[0]} stays unconverted for now")
+                return
+            future = self.pool.submit(self._build, key[0], name)
+            self.pending[job] = future
+        future.add_done_callback(lambda future, job=job: self._finished(job, future))
+
+    def _build(self, source, name):
+        target = self.path_for(source, name)
+        if not os.path.exists(target):
+            transcode(source, target, RENDITIONS[name])
+            logger.info(f"Transcoded {source} to {os.path.basename(target)}")
+        return target
+
+    def _finished(self, job, future):
+        with self.lock:
+            del self.pending[job]
+            error = future.exception()
+            if error is not None:
+                self.failed.add(job)
+        if error is not None:
+            logger.warning(f"Could not transcode {job[0]} to {job[-1]}: {error}")
+
+    def close(self):
+        """Stop accepting work and wait for running transcodes."""
+        self.pool.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,34 @@
+import io
+import json
+import hashlib
+
+
+def tally_digest(results):
+    """Return a stable hash of (song_name, total) rows, used as the chart cache key."""
+    payload = json.dumps(sorted([str(name), float(total)] for name, total in results))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def render_pie_chart(results, title="Song Voting Results", dpi=100):
+    """Render (song_name, total) rows as a pie chart and return PNG bytes.
+
+    Uses matplotlib's object-oriented Figure API with an Agg canvas rather
+    than pyplot, so no global figure state is shared between concurrent
+    sessions. matplotlib is imported here so it stays off the import path
+    of pages that only serve a cached image.
+    """
+    from matplotlib.figure import Figure
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+    song_names = [row[0] for row in results]
+    votes = [row[1] for row in results]
+
+    figure = Figure(figsize=(10, 6), dpi=dpi)
+    FigureCanvasAgg(figure)
+    axes = figure.add_subplot()
+    axes.pie(votes, labels=song_names, autopct='%1.1f%%', startangle=140)
+    axes.set_title(title)
+
+    buffer = io.BytesIO()
+    figure.savefig(buffer, format="png", bbox_inches="tight")
+    return buffer.getvalue()
@@ -0,0 +1,282 @@
+import os
+import re
+import time
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Relative weight of each document kind when ranking songs (bm25 scores are
+# negative, so a larger weight pushes a match further up the results)
+KIND_WEIGHTS = {
+    "title": 10.0,
+    "label": 4.0,
+    "note": 2.0,
+    "lyrics": 1.0,
+}
+
+SCHEMA_SQL = [
+    # One row per searchable document; ref is a stable natural key of its source
+    '''
+    CREATE TABLE IF NOT EXISTS search_documents (
+        id INTEGER PRIMARY KEY,
+        ref TEXT NOT NULL UNIQUE,
+        song_name TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        body TEXT NOT NULL,
+        source_mtime_ns INTEGER
+    )
+    ''',
+    "CREATE INDEX IF NOT EXISTS idx_search_documents_kind ON search_documents(kind)",
+    '''
+    CREATE VIRTUAL TABLE IF NOT EXISTS search_fts USING fts5(
+        body,
+        content = 'search_documents',
+        content_rowid = 'id',
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    ''',
+    # Keep the external-content FTS table in step with search_documents
+    '''
+    CREATE TRIGGER IF NOT EXISTS search_documents_ai AFTER INSERT ON search_documents BEGIN
+        INSERT INTO search_fts (rowid, body) VALUES (new.id, new.body);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS search_documents_ad AFTER DELETE ON search_documents BEGIN
+        INSERT INTO search_fts (search_fts, rowid, body) VALUES ('delete', old.id, old.body);
+    END
+    ''',
+    '''
+    CREATE TRIGGER IF NOT EXISTS search_documents_au AFTER UPDATE ON search_documents BEGIN
+        INSERT INTO search_fts (search_fts, rowid, body) VALUES ('delete', old.id, old.body);
+        INSERT INTO search_fts (rowid, body) VALUES (new.id, new.body);
+    END
+    ''',
+]
+
+UPSERT_DOCUMENT_SQL = '''
+    INSERT INTO search_documents (ref, song_name, kind, body, source_mtime_ns)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT(ref) DO UPDATE SET
+        song_name = excluded.song_name,
+        body = excluded.body,
+        source_mtime_ns = excluded.source_mtime_ns
+'''
+
+# Source tables whose rows are mirrored into the index by triggers:
+# table -> (required columns, kind, ref expression, body expression).
+# Every part of a ref is COALESCEd: one NULL would make the whole ref NULL.
+SOURCE_TABLES = {
+    "instrument_sheet_music": (
+        {"song_name", "instrument", "label"},
+        "label",
+        "'label:' || {row}.song_name || '|' || COALESCE({row}.instrument, '') || '|' || COALESCE({row}.label, '')",
+        "COALESCE({row}.label, '')",
+    ),
+    "song_notes": (
+        {"song_name", "username", "label", "notes"},
+        "note",
+        "'note:' || {row}.song_name || '|' || COALESCE({row}.username, '') || '|' || COALESCE({row}.label, '')",
+        "COALESCE({row}.label, '') || ' ' || COALESCE({row}.notes, '')",
+    ),
+}
+
+# rank is FTS5's bm25() score exposed as a column, so it can be aggregated
+SEARCH_SQL = '''
+    SELECT d.song_name,
+           SUM(search_fts.rank * CASE d.kind {weights} ELSE 1.0 END) AS score,
+           GROUP_CONCAT(DISTINCT d.kind) AS kinds
+    FROM search_fts
+    JOIN search_documents d ON d.id = search_fts.rowid
+    WHERE search_fts MATCH ?
+    GROUP BY d.song_name
+    ORDER BY score
+    LIMIT ?
+'''.format(weights=" ".join(f"WHEN '{kind}' THEN {weight}" for kind, weight in KIND_WEIGHTS.items()))
+
+
+# Rows requested per page when mirroring a remote table (PostgREST returns at most 1000 by default)
+PAGE_SIZE = 1000
+# Seconds between full re-mirrors of labels and notes stored elsewhere; the
+# apps expire() a kind themselves after their own writes
+DOCUMENT_REFRESH_INTERVAL = 300.0
+
+
+def fetch_in_pages(fetch_page, page_size=PAGE_SIZE):
+    """Collect every row of a remote table from fetch_page(first, last), an inclusive offset range.
+
+    Pages are requested until one comes back empty, so a server-side row
+    cap smaller than page_size cannot silently truncate the result.
+    """
+    rows = []
+    while True:
+        page = fetch_page(len(rows), len(rows) + page_size - 1) or []
+        if not page:
+            return rows
+        rows.extend(page)
+
+
+def build_match_query(text):
+    """Turn free text into an FTS5 query where every word is a prefix match."""
+    terms = re.findall(r"\w+", text, flags=re.UNICODE)
+    return " ".join(f'"{term}"*' for term in terms)
+
+
+class SearchIndex:
+    """SQLite FTS5 index over song titles, lyrics, sheet music labels and notes."""
+
+    def __init__(self, pool, refresh_interval=30.0, document_refresh_interval=DOCUMENT_REFRESH_INTERVAL):
+        """Create the index tables in the pool's database and wire up source triggers."""
+        self.pool = pool
+        self.refresh_interval = refresh_interval
+        self.document_refresh_interval = document_refresh_interval
+        self.lock = threading.Lock()
+        self.last_sync = None
+        self.last_document_sync = {}  # kind -> monotonic time of the last sync_documents()
+        self.initialize()
+
+    def initialize(self):
+        """Create the schema, plus triggers for any local label/note tables."""
+        with self.pool.transaction() as cursor:
+            # sqlite3 autocommits DDL outside an explicit transaction; the triggers
+            # must only persist together with a successful backfill
+            cursor.execute("BEGIN")
+            for statement in SCHEMA_SQL:
+                cursor.execute(statement)
+            for table in SOURCE_TABLES:
+                self._install_source_triggers(cursor, table)
+
+    def _install_source_triggers(self, cursor, table):
+        """Mirror a source table into the index and backfill the rows it already has.
+
+        The triggers are recreated on every start so a changed definition
+        replaces an older one, and the backfill only rewrites documents whose
+        text differs, which makes it cheap to repeat.
+        """
+        columns, kind, ref_sql, body_sql = SOURCE_TABLES[table]
+        cursor.execute(f"PRAGMA table_info({table})")
+        existing_columns = {row[1] for row in cursor.fetchall()}
+        if not columns <= existing_columns:
+            logger.info(f"Not indexing {table}: table or columns missing")
+            return
+
+        trigger_prefix = f"search_{table}"
+        # Rows without a song are not indexed (search_documents.song_name is
+        # NOT NULL), matching the backfill below; an update to such a row
+        # still deletes the document of its old version
+        upsert_new = f'''
+            INSERT INTO search_documents (ref, song_name, kind, body)
+            SELECT {ref_sql.format(row="new")}, new.song_name, '{kind}', {body_sql.format(row="new")}
+            WHERE new.song_name IS NOT NULL
+            ON CONFLICT(ref) DO UPDATE SET song_name = excluded.song_name, body = excluded.body;
+        '''
+        delete_old = f"DELETE FROM search_documents WHERE ref = {ref_sql.format(row='old')};"
+        for suffix in ("ai", "ad", "au"):
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger_prefix}_{suffix}")
+        cursor.execute(f"CREATE TRIGGER {trigger_prefix}_ai AFTER INSERT ON {table} BEGIN {upsert_new} END")
+        cursor.execute(f"CREATE TRIGGER {trigger_prefix}_ad AFTER DELETE ON {table} BEGIN {delete_old} END")
+        cursor.execute(f"CREATE TRIGGER {trigger_prefix}_au AFTER UPDATE ON {table} BEGIN {delete_old} {upsert_new} END")
+
+        # Index rows written before the triggers existed (or while they were missing)
+        cursor.execute(f'''
+            INSERT INTO search_documents (ref, song_name, kind, body)
+            SELECT {ref_sql.format(row=table)}, song_name, '{kind}', {body_sql.format(row=table)}
+            FROM {table} WHERE song_name IS NOT NULL
+            ON CONFLICT(ref) DO UPDATE SET song_name = excluded.song_name, body = excluded.body
+            WHERE search_documents.song_name IS NOT excluded.song_name OR search_documents.body IS NOT excluded.body
+        ''')
+
+    def sync_songs(self, songs, force=False):
+        """Index titles and lyrics for (song_name, lyrics_path) pairs.
+
+        Lyrics are re-read only when their file's mtime changed, and songs that
+        disappeared are dropped. Calls within refresh_interval of the last sync
+        are skipped unless force is set.
+        """
+        with self.lock:
+            now = time.monotonic()
+            if not force and self.last_sync is not None and now - self.last_sync < self.refresh_interval:
+                return
+            self.last_sync = now
+
+            with self.pool.transaction() as cursor:
+                cursor.execute("SELECT ref, source_mtime_ns FROM search_documents WHERE kind IN ('title', 'lyrics')")
+                indexed = dict(cursor.fetchall())
+                seen = set()
+                for song_name, lyrics_path in songs:
+                    title_ref = f"title:{song_name}"
+                    seen.add(title_ref)
+                    if title_ref not in indexed:
+                        title = os.path.splitext(song_name)[0]
+                        cursor.execute(UPSERT_DOCUMENT_SQL, (title_ref, song_name, "title", title, None))
+
+                    if not lyrics_path:
+                        continue
+                    lyrics_ref = f"lyrics:{song_name}"
+                    try:
+                        mtime_ns = os.stat(lyrics_path).st_mtime_ns
+                    except OSError:
+                        continue
+                    seen.add(lyrics_ref)
+                    if indexed.get(lyrics_ref) != mtime_ns:
+                        with open(lyrics_path, "r", encoding="utf-8", errors="replace") as f:
+                            lyrics = f.read()
+                        cursor.execute(UPSERT_DOCUMENT_SQL, (lyrics_ref, song_name, "lyrics", lyrics, mtime_ns))
+
+                stale = [(ref,) for ref in indexed if ref not in seen]
+                if stale:
+                    cursor.executemany("DELETE FROM search_documents WHERE ref = ?", stale)
+
+    def replace_documents(self, kind, documents):
+        """Replace every document of one kind with (key, song_name, body) triples.
+
+        Used to mirror labels and notes that live outside the local database.
+        """
+        with self.pool.transaction() as cursor:
+            cursor.execute("SELECT ref, song_name, body FROM search_documents WHERE kind = ?", (kind,))
+            current = {ref: (song_name, body) for ref, song_name, body in cursor.fetchall()}
+            wanted = {f"{kind}:{key}": (song_name, body or "") for key, song_name, body in documents}
+            stale = [(ref,) for ref in current if ref not in wanted]
+            if stale:
+                cursor.executemany("DELETE FROM search_documents WHERE ref = ?", stale)
+            changed = [
+                (ref, song_name, kind, body, None)
+                for ref, (song_name, body) in wanted.items()
+                if current.get(ref) != (song_name, body)
+            ]
+            if changed:
+                cursor.executemany(UPSERT_DOCUMENT_SQL, changed)
+
+    def sync_documents(self, kind, load_documents, force=False):
+        """Refresh one kind of externally stored documents at most every document_refresh_interval.
+
+        load_documents is only called when a refresh is due and must return
+        every (key, song_name, body) triple; documents it leaves out are
+        deleted, so it must not return a truncated result.
+        """
+        with self.lock:
+            now = time.monotonic()
+            last_sync = self.last_document_sync.get(kind)
+            if not force and last_sync is not None and now - last_sync < self.document_refresh_interval:
+                return
+            self.last_document_sync[kind] = now
+        self.replace_documents(kind, load_documents())
+
+    def expire(self, kind=None):
+        """Force the next sync of one kind (or of everything) to run."""
+        with self.lock:
+            if kind is None:
+                self.last_sync = None
+                self.last_document_sync.clear()
+            else:
+                self.last_document_sync.pop(kind, None)
+
+    def search(self, text, limit=200):
+        """Return [(song_name, kinds)] best match first; kinds is the set of matching document kinds."""
+        match_query = build_match_query(text)
+        if not match_query:
+            return []
+        rows = self.pool.fetch_all(SEARCH_SQL, (match_query, limit))
+        return [(song_name, set(kinds.split(","))) for song_name, _, kinds in rows]
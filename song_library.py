@@ -0,0 +1,175 @@
+import random
+import logging
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# Searches shorter than this scan the names instead of the trigram index
+TRIGRAM = 3
+
+
+def trigrams(text):
+    """Return the set of 3-character substrings of text."""
+    return {text[i:i + TRIGRAM] for i in range(len(text) - TRIGRAM + 1)}
+
+
+def diff_sorted(old, new):
+    """Compare two ascending id lists and return (removed_positions, inserted_runs).
+
+    removed_positions are positions in old, highest first, so deleting them in
+    order keeps the remaining positions valid. inserted_runs are
+    (position_in_new, [ids]) for contiguous runs, lowest first; inserting them
+    in order after the removals turns old into new.
+    """
+    removed = []
+    inserted = []
+    i = j = 0
+    while i < len(old) or j < len(new):
+        if j == len(new) or (i < len(old) and old[i] < new[j]):
+            removed.append(i)
+            i += 1
+        elif i == len(old) or new[j] < old[i]:
+            if inserted and inserted[-1][0] + len(inserted[-1][1]) == j:
+                inserted[-1][1].append(new[j])
+            else:
+                inserted.append((j, [new[j]]))
+            j += 1
+        else:
+            i += 1
+            j += 1
+    removed.reverse()
+    return removed, inserted
+
+
+class SongLibrary:
+    """In-memory song catalog with O(1) path lookup and a trigram name index.
+
+    Each song keeps the id it was added with for as long as it is in the
+    library; removing a song leaves a tombstone instead of shifting every
+    later id, so ids stay valid as listbox keys and for current_song_index.
+    The trigram index is built on the first search that can use it.
+    """
+
+    def __init__(self, songs=()):
+        """Create a library holding songs (dicts with at least "name" and "path")."""
+        self.reset(songs)
+
+    def reset(self, songs=()):
+        """Replace the whole catalog."""
+        self.songs = []  # id -> song, or None once removed
+        self.by_path = {}
+        self.names = []  # id -> lowercased name
+        self.index = None  # trigram -> set of ids
+        self.live = 0
+        self.last_term = None
+        self.last_results = None
+        for song in songs:
+            self.add(song)
+
+    def __len__(self):
+        return self.live
+
+    def add(self, song):
+        """Add a song and return its id; a path already in the library keeps its id."""
+        existing = self.by_path.get(song["path"])
+        if existing is not None:
+            return existing
+        song_id = len(self.songs)
+        self.songs.append(song)
+        self.by_path[song["path"]] = song_id
+        name = song["name"].lower()
+        self.names.append(name)
+        if self.index is not None:
+            for gram in trigrams(name):
+                self.index[gram].add(song_id)
+        self.live += 1
+        self.last_term = None
+        return song_id
+
+    def remove(self, song_id):
+        """Remove a song by id and return it."""
+        song = self.songs[song_id]
+        if song is None:
+            return None
+        self.songs[song_id] = None
+        del self.by_path[song["path"]]
+        if self.index is not None:
+            for gram in trigrams(self.names[song_id]):
+                self.index[gram].discard(song_id)
+        self.live -= 1
+        self.last_term = None
+        return song
+
+    def get(self, song_id):
+        """Return the song with an id, or None if it was removed."""
+        if 0 <= song_id < len(self.songs):
+            return self.songs[song_id]
+        return None
+
+    def index_of(self, path):
+        """Return the id of the song at path, or None."""
+        return self.by_path.get(path)
+
+    def ids(self):
+        """Return every live id in library order."""
+        return [song_id for song_id, song in enumerate(self.songs) if song is not None]
+
+    def first(self):
+        """Return the first live song, or None."""
+        return next((song for song in self.songs if song is not None), None)
+
+    def step(self, song_id, offset):
+        """Return the id offset (+1/-1) places from song_id, wrapping and skipping removed songs."""
+        if not self.live:
+            return None
+        total = len(self.songs)
+        candidate = song_id
+        for _ in range(total):
+            candidate = (candidate + offset) % total
+            if self.songs[candidate] is not None:
+                return candidate
+        return None
+
+    def random_id(self):
+        """Return the id of a random live song, or None."""
+        if not self.live:
+            return None
+        while True:
+            song_id = random.randrange(len(self.songs))
+            if self.songs[song_id] is not None:
+                return song_id
+
+    def search(self, term):
+        """Return the ids whose name contains term (case-insensitive), in library order.
+
+        Narrowing a previous search only filters its results; other terms of
+        three or more characters intersect trigram posting lists before the
+        substring check.
+        """
+        term = term.lower()
+        if not term:
+            results = self.ids()
+        elif self.last_term is not None and self.last_term in term:
+            results = [song_id for song_id in self.last_results if term in self.names[song_id]]
+        elif len(term) < TRIGRAM:
+            results = [
+                song_id for song_id, name in enumerate(self.names)
+                if self.songs[song_id] is not None and term in name
+            ]
+        else:
+            postings = sorted((self._trigram_index().get(gram, ()) for gram in trigrams(term)), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:])
+            results = sorted(song_id for song_id in candidates if term in self.names[song_id])
+        self.last_term = term
+        self.last_results = results
+        return results
+
+    def _trigram_index(self):
+        if self.index is None:
+            self.index = defaultdict(set)
+            for song_id, name in enumerate(self.names):
+                if self.songs[song_id] is not None:
+                    for gram in trigrams(name):
+                        self.index[gram].add(song_id)
+            logger.debug(f"Built trigram index over {self.live} songs")
+        return self.index
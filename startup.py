@@ -0,0 +1,40 @@
+import os
+import time
+import logging
+from functools import lru_cache
+
+logger = logging.getLogger(__name__)
+
+# Streamlit re-executes the app script on every rerun, but imported modules
+# stay in sys.modules, so lru_cache here means "once per process".
+
+
+@lru_cache(maxsize=None)
+def load_environment(env_file=None):
+    """Load variables from a .env file into os.environ (only the first call does any work)."""
+    from dotenv import load_dotenv
+    if env_file:
+        load_dotenv(env_file)
+    else:
+        load_dotenv()
+
+
+@lru_cache(maxsize=None)
+def ensure_directories(*paths):
+    """Create the given directories if they are missing (only the first call does any work)."""
+    for path in paths:
+        os.makedirs(path, exist_ok=True)
+
+
+def create_supabase_client(env_file=None):
+    """Build a Supabase client from SUPABASE_URL / SUPABASE_KEY.
+
+    The supabase package (and its HTTP stack) is imported here instead of at
+    module level so pages that never touch Supabase don't pay for it.
+    """
+    load_environment(env_file)
+    from supabase import create_client
+    started = time.perf_counter()
+    client = create_client(os.getenv("SUPABASE_URL"), os.getenv("SUPABASE_KEY"))
+    logger.info(f"Supabase client created in {(time.perf_counter() - started) * 1000:.0f} ms")
+    return client
@@ -0,0 +1,62 @@
+-- Migration: single-round-trip reads and writes for a song's labels, notes and sheet music
+
+-- Lookups are always by song, so index the filter columns
+create index if not exists idx_labels_song_title on labels(song_title);
+create index if not exists idx_notes_song_title on notes(song_title);
+create index if not exists idx_sheet_music_song_name on sheet_music(song_name);
+
+-- Everything the song page shows, as one JSON document:
+-- { labels: [...], notes: [... with label name], sheet_music: [... with label name] }
+create or replace function public.get_song_detail(p_song_title text)
+returns json
+language sql
+stable
+as $$
+  select json_build_object(
+    'labels', coalesce((
+      select json_agg(json_build_object(
+               'id', l.id, 'name', l.name, 'instrument', l.instrument, 'owner_id', l.owner_id
+             ) order by l.name)
+      from labels l
+      where l.song_title = p_song_title
+    ), '[]'::json),
+    'notes', coalesce((
+      select json_agg(json_build_object(
+               'owner_id', n.owner_id, 'content', n.content, 'label_id', n.label_id,
+               'label', l.name, 'created_at', n.created_at
+             ) order by n.owner_id)
+      from notes n
+      left join labels l on l.id = n.label_id
+      where n.song_title = p_song_title
+    ), '[]'::json),
+    'sheet_music', coalesce((
+      select json_agg(json_build_object(
+               'id', s.id, 'file_path', s.file_path, 'label_id', s.label_id,
+               'upload_date', s.upload_date, 'label', json_build_object('name', l.name)
+             ) order by s.upload_date desc)
+      from sheet_music s
+      left join labels l on l.id = s.label_id
+      where s.song_name = p_song_title
+    ), '[]'::json)
+  );
+$$;
+
+-- Insert a note, resolving the label name to its id on the server
+create or replace function public.add_song_note(
+  p_song_title text,
+  p_owner_id uuid,
+  p_label text,
+  p_content text
+)
+returns notes
+language sql
+as $$
+  insert into notes (song_title, owner_id, label_id, content)
+  values (
+    p_song_title,
+    p_owner_id,
+    (select id from labels where song_title = p_song_title and name = p_label limit 1),
+    p_content
+  )
+  returning *;
+$$;
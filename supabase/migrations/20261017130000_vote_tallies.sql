@@ -0,0 +1,73 @@
+-- Migration: incrementally maintained vote tallies so Results never scans votes
+
+create index if not exists idx_votes_song_title on public.votes(song_title);
+
+-- All-time totals per song
+create table if not exists public.vote_totals (
+    song_title text primary key,
+    total bigint not null default 0,
+    vote_count bigint not null default 0,
+    updated_at timestamp with time zone default timezone('utc'::text, now())
+);
+
+-- Per-day, per-song rollup (days are UTC)
+create table if not exists public.vote_daily_totals (
+    day date not null,
+    song_title text not null,
+    total bigint not null default 0,
+    vote_count bigint not null default 0,
+    primary key (day, song_title)
+);
+
+-- Runs in the same transaction as the vote insert/delete
+create or replace function public.apply_vote_to_tallies()
+returns trigger
+language plpgsql
+as $$
+begin
+  if tg_op = 'INSERT' then
+    insert into public.vote_totals (song_title, total, vote_count)
+    values (new.song_title, new.vote, 1)
+    on conflict (song_title) do update
+      set total = vote_totals.total + excluded.total,
+          vote_count = vote_totals.vote_count + 1,
+          updated_at = timezone('utc'::text, now());
+
+    insert into public.vote_daily_totals (day, song_title, total, vote_count)
+    values ((new.created_at at time zone 'utc')::date, new.song_title, new.vote, 1)
+    on conflict (day, song_title) do update
+      set total = vote_daily_totals.total + excluded.total,
+          vote_count = vote_daily_totals.vote_count + 1;
+    return new;
+  end if;
+
+  update public.vote_totals
+    set total = total - old.vote,
+        vote_count = vote_count - 1,
+        updated_at = timezone('utc'::text, now())
+    where song_title = old.song_title;
+  update public.vote_daily_totals
+    set total = total - old.vote,
+        vote_count = vote_count - 1
+    where day = (old.created_at at time zone 'utc')::date and song_title = old.song_title;
+  return old;
+end;
+$$;
+
+drop trigger if exists votes_tally on public.votes;
+create trigger votes_tally
+  after insert or delete on public.votes
+  for each row execute function public.apply_vote_to_tallies();
+
+-- Seed the tallies from votes cast before this migration
+insert into public.vote_totals (song_title, total, vote_count)
+select song_title, sum(vote), count(*) from public.votes group by song_title
+on conflict (song_title) do update
+  set total = excluded.total, vote_count = excluded.vote_count;
+
+insert into public.vote_daily_totals (day, song_title, total, vote_count)
+select (created_at at time zone 'utc')::date, song_title, sum(vote), count(*)
+from public.votes
+group by 1, 2
+on conflict (day, song_title) do update
+  set total = excluded.total, vote_count = excluded.vote_count;
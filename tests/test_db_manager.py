@@ -0,0 +1,29 @@
+import os
+import sqlite3
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_manager import DatabaseManager  # noqa: E402
+
+
+def test_failed_write_rolls_back_the_whole_batch(tmp_path):
+    db = DatabaseManager(str(tmp_path / "jukebox.db"))
+
+    with pytest.raises(sqlite3.Error):
+        with db.batch():
+            assert db.save_song_notes("Amazing Grace", "Slow intro")
+            # sheet_music.file_path is NOT NULL
+            db.save_sheet_music_reference("Amazing Grace", "Piano", None)
+
+    assert db.get_song_notes("Amazing Grace") == ""
+
+
+def test_failed_write_outside_a_batch_returns_false(tmp_path):
+    db = DatabaseManager(str(tmp_path / "jukebox.db"))
+
+    assert db.save_sheet_music_reference("Amazing Grace", "Piano", None) is False
+    assert db.save_song_notes("Amazing Grace", "Slow intro")
+    assert db.get_song_notes("Amazing Grace") == "Slow intro"
@@ -0,0 +1,52 @@
+import os
+import sys
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from loudness import LoudnessIndex, analysis_available, is_decode_error  # noqa: E402
+
+
+def test_environment_errors_are_not_decode_errors():
+    assert not is_decode_error(ModuleNotFoundError("No module named 'librosa'"))
+    assert not is_decode_error(BrokenProcessPool("A child process terminated abruptly"))
+    assert not is_decode_error(FileNotFoundError("gone.mp3"))
+    assert is_decode_error(RuntimeError("Error opening 'broken.mp3': Format not recognised."))
+
+
+def test_undecodable_track_is_recorded_and_not_retried(tmp_path):
+    pytest.importorskip("numpy")
+    if not analysis_available():
+        pytest.skip("scipy/librosa are not installed")
+    track = tmp_path / "broken.mp3"
+    track.write_bytes(b"not audio")
+    index_path = str(tmp_path / "loudness_index.json")
+    index = LoudnessIndex(index_path)
+
+    assert index.measure([str(track)]) == 0
+    entry = index.lookup(str(track))
+    assert entry is not None and entry["gain_db"] is None and entry["error"]
+    assert index.volume_scale(str(track)) == 1.0
+
+    # The failure is persisted, so a restart skips the track too
+    restarted = LoudnessIndex(index_path)
+    assert restarted.lookup(str(track)) == entry
+    assert restarted.measure([str(track)]) == 0
+
+    # A changed file is measured again
+    track.write_bytes(b"still not audio")
+    assert restarted.lookup(str(track)) is None
+
+
+def test_missing_dependencies_are_not_recorded(tmp_path):
+    if analysis_available():
+        pytest.skip("the analysis dependencies are installed")
+    track = tmp_path / "song.mp3"
+    track.write_bytes(b"not audio")
+    index = LoudnessIndex(str(tmp_path / "loudness_index.json"))
+
+    with pytest.raises(ImportError):
+        index.measure([str(track)])
+    assert index.lookup(str(track)) is None
@@ -0,0 +1,29 @@
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from migrations import migrate  # noqa: E402
+
+
+def test_sheet_music_duplicates_are_moved_aside_and_null_labels_kept(tmp_path):
+    conn = sqlite3.connect(str(tmp_path / "jukebox.db"))
+    conn.executescript('''
+        CREATE TABLE sheet_music (
+            id INTEGER PRIMARY KEY AUTOINCREMENT, song_name TEXT NOT NULL, label_id TEXT,
+            file_path TEXT NOT NULL, upload_date TIMESTAMP
+        );
+        INSERT INTO sheet_music (song_name, label_id, file_path) VALUES ('Amazing Grace', NULL, 'a.pdf');
+        INSERT INTO sheet_music (song_name, label_id, file_path) VALUES ('Amazing Grace', NULL, 'b.pdf');
+        INSERT INTO sheet_music (song_name, label_id, file_path) VALUES ('Amazing Grace', '1', 'old.pdf');
+        INSERT INTO sheet_music (song_name, label_id, file_path) VALUES ('Amazing Grace', '1', 'new.pdf');
+    ''')
+    conn.commit()
+
+    migrate(conn)
+
+    assert sorted(row[0] for row in conn.execute("SELECT file_path FROM sheet_music")) == [
+        "a.pdf", "b.pdf", "new.pdf"
+    ]
+    assert conn.execute("SELECT id, file_path FROM sheet_music_duplicates").fetchall() == [(3, "old.pdf")]
@@ -0,0 +1,100 @@
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_pool import ConnectionPool  # noqa: E402
+from search_index import SearchIndex, fetch_in_pages  # noqa: E402
+
+
+def make_source_db(path):
+    conn = sqlite3.connect(path)
+    conn.executescript('''
+        CREATE TABLE instrument_sheet_music (
+            song_name TEXT, instrument TEXT, label TEXT, file_path TEXT,
+            PRIMARY KEY (song_name, instrument, label)
+        );
+        CREATE TABLE song_notes (song_name TEXT, username TEXT, label TEXT, notes TEXT);
+        INSERT INTO instrument_sheet_music VALUES ('Amazing Grace.mp3', 'Piano', NULL, 'a.pdf');
+        INSERT INTO instrument_sheet_music VALUES ('Amazing Grace.mp3', 'Bass', 'Walking line', 'b.pdf');
+        INSERT INTO song_notes VALUES ('Amazing Grace.mp3', NULL, NULL, 'Slow intro');
+    ''')
+    conn.commit()
+    conn.close()
+
+
+def documents(pool, kind):
+    return sorted(pool.fetch_all("SELECT ref, body FROM search_documents WHERE kind = ?", (kind,)))
+
+
+def test_backfill_indexes_rows_with_null_labels(tmp_path):
+    db_path = str(tmp_path / "jukebox.db")
+    make_source_db(db_path)
+    pool = ConnectionPool(db_path)
+
+    index = SearchIndex(pool)
+
+    assert documents(pool, "label") == [
+        ("label:Amazing Grace.mp3|Bass|Walking line", "Walking line"),
+        ("label:Amazing Grace.mp3|Piano|", ""),
+    ]
+    assert documents(pool, "note") == [("note:Amazing Grace.mp3||", " Slow intro")]
+    assert index.search("intro") == [("Amazing Grace.mp3", {"note"})]
+
+
+def test_triggers_accept_null_parts(tmp_path):
+    db_path = str(tmp_path / "jukebox.db")
+    make_source_db(db_path)
+    pool = ConnectionPool(db_path)
+    SearchIndex(pool)
+
+    with pool.transaction() as cursor:
+        cursor.execute("UPDATE instrument_sheet_music SET file_path = 'c.pdf' WHERE label IS NULL")
+        cursor.execute("INSERT INTO song_notes VALUES ('How Great.mp3', NULL, 'Bridge', NULL)")
+        cursor.execute("INSERT INTO instrument_sheet_music VALUES ('How Great.mp3', NULL, NULL, 'd.pdf')")
+
+    assert ("note:How Great.mp3||Bridge", "Bridge ") in documents(pool, "note")
+    assert ("label:How Great.mp3||", "") in documents(pool, "label")
+
+
+def test_triggers_skip_rows_without_a_song(tmp_path):
+    db_path = str(tmp_path / "jukebox.db")
+    make_source_db(db_path)
+    pool = ConnectionPool(db_path)
+    SearchIndex(pool)
+
+    with pool.transaction() as cursor:
+        cursor.execute("INSERT INTO song_notes VALUES (NULL, 'alice', 'Intro', 'Orphaned note')")
+        cursor.execute("UPDATE song_notes SET notes = 'Still orphaned' WHERE song_name IS NULL")
+        # Moving a note off its song removes its document
+        cursor.execute("UPDATE song_notes SET song_name = NULL WHERE notes = 'Slow intro'")
+
+    assert documents(pool, "note") == []
+
+
+def test_restart_backfills_rows_missed_by_an_earlier_start(tmp_path):
+    db_path = str(tmp_path / "jukebox.db")
+    make_source_db(db_path)
+    pool = ConnectionPool(db_path)
+    SearchIndex(pool)
+
+    # Rows that reached the table while the index lost them are picked up again
+    with pool.transaction() as cursor:
+        cursor.execute("DELETE FROM search_documents WHERE kind = 'label'")
+    SearchIndex(pool)
+
+    assert len(documents(pool, "label")) == 2
+
+
+def test_fetch_in_pages_reads_past_a_server_row_cap():
+    rows = list(range(2500))
+    requested = []
+
+    def fetch_page(first, last):
+        requested.append((first, last))
+        # The server returns at most 1000 rows whatever range is asked for
+        return rows[first:min(last + 1, first + 1000)]
+
+    assert fetch_in_pages(fetch_page, page_size=2000) == rows
+    assert requested[0] == (0, 1999) and requested[-1][0] == 2500
@@ -0,0 +1,57 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+pytest.importorskip("numpy")
+
+from loudness import analysis_available  # noqa: E402
+from waveform_peaks import PeaksStore  # noqa: E402
+
+
+def test_undecodable_track_is_remembered_until_it_changes(tmp_path):
+    if not analysis_available():
+        pytest.skip("scipy/librosa are not installed")
+    track = tmp_path / "broken.mp3"
+    track.write_bytes(b"not audio")
+    cache_dir = str(tmp_path / "peaks")
+
+    assert PeaksStore(cache_dir).generate([str(track)], workers=1) == (0, 1)
+
+    # The failure survives a restart, so the track is not decoded again
+    restarted = PeaksStore(cache_dir)
+    assert restarted.known_failure(str(track))
+    assert restarted.generate([str(track)], workers=1) == (0, 0)
+
+    track.write_bytes(b"still not audio")
+    assert not restarted.known_failure(str(track))
+
+
+def test_store_keeps_a_bounded_number_of_files_mapped(tmp_path, monkeypatch):
+    import numpy as np
+    import waveform_peaks
+
+    monkeypatch.setattr(waveform_peaks, "MAPPED_PEAKS", 2)
+    store = PeaksStore(str(tmp_path / "peaks"))
+    tracks = []
+    for i in range(3):
+        track = tmp_path / f"track{i}.mp3"
+        track.write_bytes(b"x" * (i + 1))
+        stat_result = os.stat(track)
+        mono = np.sin(np.linspace(0, 100, 44100)).astype(np.float32)
+        waveform_peaks.write_peaks(
+            store.path_for(str(track)), waveform_peaks.compute_peaks(mono), 44100, 1.0,
+            stat_result.st_mtime_ns, stat_result.st_size
+        )
+        tracks.append(str(track))
+
+    first = store.get(tracks[0])
+    assert first.window(0, 1.0, 50).shape == (50, 2)
+    store.get(tracks[1])
+    store.get(tracks[0])
+    store.get(tracks[2])
+
+    # The least recently used track is dropped, not the one just read again
+    assert list(store.mapped) == [os.path.abspath(tracks[0]), os.path.abspath(tracks[2])]
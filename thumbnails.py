@@ -0,0 +1,215 @@
+import os
+import glob
+import json
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+# name -> bounding box; grid tiles are 180x150 and the detail view is 600 wide (2x for HiDPI)
+SIZES = {
+    "grid": (360, 300),
+    "detail": (1200, 1200),
+}
+
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg")
+JPEG_QUALITY = 82
+
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """Return the SHA-1 of a file's contents."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def find_source_images(pictures_dir, songs_dir):
+    """List every picture below pictures_dir plus the Song*.png|jpg artwork in each song folder."""
+    paths = []
+    if os.path.isdir(pictures_dir):
+        for folder, _, files in os.walk(pictures_dir):
+            paths.extend(os.path.join(folder, name) for name in files if name.lower().endswith(IMAGE_EXTENSIONS))
+    for pattern in ("Song*.png", "Song*.jpg", "Song*.jpeg"):
+        paths.extend(glob.glob(os.path.join(songs_dir, "*", pattern)))
+    return sorted(os.path.abspath(path) for path in paths)
+
+
+def render_thumbnail(source, destination, box):
+    """Downscale source to fit box and write it as a JPEG."""
+    from PIL import Image, ImageOps
+
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail(box, Image.LANCZOS)
+        if image.mode in ("RGBA", "LA", "P"):
+            # JPEG has no alpha; flatten onto white like the page background
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, (255, 255, 255))
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        tmp_path = f"{destination}.tmp"
+        image.save(tmp_path, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+    os.replace(tmp_path, destination)
+
+
+class ThumbnailCache:
+    """Downscaled, content-addressed image variants generated by a background pool.
+
+    Variants are stored as <sha1>_<size>.jpg, so identical images share files
+    and a replaced image gets new names. The manifest maps each source path to
+    its mtime, size and digest; a source is only re-hashed when those change.
+    get() never blocks on image work: until a variant exists it returns the
+    original path and queues the job.
+    """
+
+    def __init__(self, cache_dir, sizes=None, max_workers=2):
+        """Load the manifest; rendering starts on the first get() or warm()."""
+        self.cache_dir = cache_dir
+        self.sizes = dict(sizes or SIZES)
+        self.manifest_path = os.path.join(cache_dir, "manifest.json")
+        self.max_workers = max_workers
+        self.entries = {}
+        self.pending = {}  # (path, size_name) -> Future
+        self.lock = threading.Lock()
+        self.executor = None
+        self.available = None
+        self.load()
+
+    def load(self):
+        """Read the manifest file."""
+        try:
+            with open(self.manifest_path, "r") as f:
+                self.entries = json.load(f)
+        except FileNotFoundError:
+            self.entries = {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable thumbnail manifest {self.manifest_path}: {e}")
+            self.entries = {}
+
+    def save(self):
+        """Write the manifest atomically."""
+        with self.lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{self.manifest_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.manifest_path)
+
+    def _pillow_available(self):
+        """Check once whether Pillow can be imported."""
+        if self.available is None:
+            try:
+                import PIL  # noqa: F401
+                self.available = True
+            except ImportError:
+                logger.warning("Pillow is not installed; serving original images instead of thumbnails")
+                self.available = False
+        return self.available
+
+    def variant_path(self, digest, size_name):
+        """Return where the variant of a digest is stored."""
+        return os.path.join(self.cache_dir, f"{digest}_{size_name}.jpg")
+
+    def cached_path(self, path, size_name):
+        """Return the variant for path if it is current and on disk, else None."""
+        key = os.path.abspath(path)
+        try:
+            stat_result = os.stat(key)
+        except OSError:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+        if not entry or entry["mtime_ns"] != stat_result.st_mtime_ns or entry["size"] != stat_result.st_size:
+            return None
+        variant = self.variant_path(entry["digest"], size_name)
+        return variant if os.path.exists(variant) else None
+
+    def get(self, path, size_name, on_ready=None):
+        """Return the best path to show now; on_ready(variant_path) fires once a missing variant is built."""
+        variant = self.cached_path(path, size_name)
+        if variant is not None:
+            return variant
+        future = self.submit(path, size_name)
+        if future is not None and on_ready is not None:
+            def done(f):
+                result = f.result() if not f.cancelled() and f.exception() is None else None
+                if result:
+                    try:
+                        on_ready(result)
+                    except Exception as e:
+                        logger.warning(f"Thumbnail callback failed for {path}: {e}")
+            future.add_done_callback(done)
+        return path
+
+    def submit(self, path, size_name):
+        """Queue a variant build unless one is already running; returns its Future."""
+        if size_name not in self.sizes or not self._pillow_available():
+            return None
+        key = (os.path.abspath(path), size_name)
+        with self.lock:
+            future = self.pending.get(key)
+            if future is not None:
+                return future
+            if self.executor is None:
+                self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="thumbnails")
+            future = self.executor.submit(self._build, *key)
+            self.pending[key] = future
+        future.add_done_callback(lambda f: self._finished(key))
+        return future
+
+    def _finished(self, key):
+        with self.lock:
+            self.pending.pop(key, None)
+            idle = not self.pending
+        if idle:
+            try:
+                self.save()
+            except OSError as e:
+                logger.warning(f"Could not save thumbnail manifest: {e}")
+
+    def _build(self, path, size_name):
+        """Hash the source if it changed and render the variant if it is missing."""
+        try:
+            stat_result = os.stat(path)
+            with self.lock:
+                entry = self.entries.get(path)
+            if not entry or entry["mtime_ns"] != stat_result.st_mtime_ns or entry["size"] != stat_result.st_size:
+                entry = {"mtime_ns": stat_result.st_mtime_ns, "size": stat_result.st_size, "digest": file_digest(path)}
+                with self.lock:
+                    self.entries[path] = entry
+            variant = self.variant_path(entry["digest"], size_name)
+            if not os.path.exists(variant):
+                os.makedirs(self.cache_dir, exist_ok=True)
+                render_thumbnail(path, variant, self.sizes[size_name])
+            return variant
+        except Exception as e:
+            logger.warning(f"Could not build {size_name} thumbnail for {path}: {e}")
+            return None
+
+    def warm(self, paths, size_names=None):
+        """Queue every missing variant of paths in the background."""
+        for path in paths:
+            for size_name in size_names or self.sizes:
+                if self.cached_path(path, size_name) is None:
+                    self.submit(path, size_name)
+
+    def prune(self):
+        """Drop manifest entries for deleted sources and variant files no entry refers to."""
+        with self.lock:
+            for path in [path for path in self.entries if not os.path.exists(path)]:
+                del self.entries[path]
+            live = {entry["digest"] for entry in self.entries.values()}
+        removed = 0
+        if os.path.isdir(self.cache_dir):
+            for name in os.listdir(self.cache_dir):
+                if name.endswith(".jpg") and name.split("_", 1)[0] not in live:
+                    os.remove(os.path.join(self.cache_dir, name))
+                    removed += 1
+        self.save()
+        return removed
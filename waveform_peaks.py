@@ -0,0 +1,376 @@
+"""Precomputed waveform peaks for drawing seek-bar waveforms without decoding.
+
+Each track gets one small binary file under cache/peaks/ holding int8
+(min, max) pairs of the mono mix at a few zoom levels. The file is memory
+mapped when read, and Peaks.window() picks the coarsest level that still
+resolves the requested time span, so drawing a scrubber touches a few
+hundred bytes no matter how long the track is.
+
+Usage: python waveform_peaks.py [root ...] [--workers N] [--force]
+"""
+import os
+import sys
+import math
+import mmap
+import struct
+import json
+import hashlib
+import logging
+import argparse
+import threading
+import multiprocessing
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PEAKS_DIR = os.path.join(BASE_DIR, "cache", "peaks")
+
+# Samples summarized by one (min, max) pair at each zoom level, finest first;
+# every level is a 4x reduction of the one before it
+SAMPLES_PER_PEAK = (512, 2048, 8192, 32768)
+
+MAGIC = b"GJPK"
+# Bump when the file layout changes so stale files are regenerated
+PEAKS_VERSION = 1
+# magic, version, level count, sample rate, duration, source mtime_ns, source size
+HEADER = struct.Struct("<4sHHIdqq")
+# samples per peak, peak count, byte offset of the level's pairs
+LEVEL = struct.Struct("<IIQ")
+# Peaks files kept mapped at once; each holds one file descriptor
+MAPPED_PEAKS = 64
+
+# Canvas scrubber for an <audio> element on the same page; %-formatted by scrubber_html()
+SCRUBBER_HTML = """
+<canvas id="waveform" width="%(width)d" height="%(height)d" style="width:100%%;height:%(height)dpx;cursor:pointer"></canvas>
+<script>
+    (function() {
+        const peaks = %(peaks)s;
+        const canvas = document.getElementById('waveform');
+        const audio = document.getElementById('%(audio_id)s');
+        const context = canvas.getContext('2d');
+        const duration = function() { return (audio && isFinite(audio.duration) && audio.duration) || %(duration)f; };
+        function draw() {
+            const played = audio ? audio.currentTime / duration() : 0;
+            const barWidth = canvas.width / peaks.length;
+            const middle = canvas.height / 2;
+            context.clearRect(0, 0, canvas.width, canvas.height);
+            peaks.forEach(function(pair, i) {
+                const top = middle - pair[1] / 128 * middle;
+                const bottom = middle - pair[0] / 128 * middle;
+                context.fillStyle = (i + 0.5) / peaks.length <= played ? '#1565c0' : '#90caf9';
+                context.fillRect(i * barWidth, top, Math.max(1, barWidth - 1), Math.max(1, bottom - top));
+            });
+        }
+        canvas.addEventListener('click', function(e) {
+            const rect = canvas.getBoundingClientRect();
+            if (audio) {
+                audio.currentTime = (e.clientX - rect.left) / rect.width * duration();
+                draw();
+            }
+        });
+        if (audio) {
+            audio.addEventListener('timeupdate', draw);
+        }
+        draw();
+    })();
+</script>
+"""
+
+
+def quantize(values):
+    """Map samples in [-1.0, 1.0] to int8."""
+    return np.clip(np.round(values * 127), -128, 127).astype(np.int8)
+
+
+def compute_peaks(mono, samples_per_peak=SAMPLES_PER_PEAK):
+    """Return one (count, 2) int8 min/max array per zoom level for a mono signal."""
+    base = samples_per_peak[0]
+    starts = np.arange(0, len(mono), base)
+    if not len(starts):
+        empty = np.zeros((0, 2), dtype=np.int8)
+        return [empty for _ in samples_per_peak]
+    pairs = np.stack([np.minimum.reduceat(mono, starts), np.maximum.reduceat(mono, starts)], axis=1)
+    levels = [quantize(pairs)]
+    for previous, current in zip(samples_per_peak, samples_per_peak[1:]):
+        # Coarser levels are reduced from the level below instead of the samples
+        finer = levels[-1]
+        starts = np.arange(0, len(finer), current // previous)
+        levels.append(np.stack(
+            [np.minimum.reduceat(finer[:, 0], starts), np.maximum.reduceat(finer[:, 1], starts)], axis=1
+        ))
+    return levels
+
+
+def write_peaks(path, levels, sample_rate, duration, mtime_ns, size, samples_per_peak=SAMPLES_PER_PEAK):
+    """Write a peaks file atomically."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    offset = HEADER.size + LEVEL.size * len(levels)
+    table = []
+    for spp, pairs in zip(samples_per_peak, levels):
+        table.append(LEVEL.pack(spp, len(pairs), offset))
+        offset += pairs.nbytes
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, PEAKS_VERSION, len(levels), sample_rate, duration, mtime_ns, size))
+        f.write(b"".join(table))
+        for pairs in levels:
+            f.write(np.ascontiguousarray(pairs).tobytes())
+    os.replace(tmp_path, path)
+
+
+def build_peaks(media_file, out_path):
+    """Decode a track and write its peaks file; runs in a worker process."""
+    from audio_analysis import load_audio
+
+    stat_result = os.stat(media_file)
+    samples, sample_rate = load_audio(media_file)
+    mono = samples.mean(axis=0) if samples.ndim > 1 else samples
+    duration = len(mono) / sample_rate if sample_rate else 0.0
+    write_peaks(out_path, compute_peaks(mono), sample_rate, duration, stat_result.st_mtime_ns, stat_result.st_size)
+    return out_path
+
+
+class Peaks:
+    """A memory-mapped peaks file."""
+
+    def __init__(self, path):
+        """Read the header and map the file once; raises ValueError for a file in another format.
+
+        Every level is a view into the one map, which is unmapped (and its
+        file descriptor closed) once the Peaks and any views of it are gone.
+        """
+        with open(path, "rb") as f:
+            header = f.read(HEADER.size)
+            if len(header) < HEADER.size:
+                raise ValueError(f"{path} is truncated")
+            magic, version, level_count, sample_rate, duration, mtime_ns, size = HEADER.unpack(header)
+            if magic != MAGIC or version != PEAKS_VERSION:
+                raise ValueError(f"{path} is not a version {PEAKS_VERSION} peaks file")
+            table = [LEVEL.unpack(f.read(LEVEL.size)) for _ in range(level_count)]
+            data = np.frombuffer(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ), dtype=np.int8)
+        if any(offset + count * 2 > len(data) for _, count, offset in table):
+            raise ValueError(f"{path} is truncated")
+        self.path = path
+        self.sample_rate = sample_rate
+        self.duration = duration
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.levels = [(spp, data[offset:offset + count * 2].reshape(count, 2)) for spp, count, offset in table]
+
+    def window(self, start=0.0, end=None, width=400):
+        """Return at most width (min, max) int8 pairs covering start..end seconds.
+
+        The coarsest level whose peaks are no wider than one output column is
+        sliced and, if it still has more peaks than columns, reduced to width.
+        """
+        end = self.duration if end is None else min(end, self.duration)
+        start = max(0.0, start)
+        if end <= start or width <= 0 or not self.levels:
+            return np.zeros((0, 2), dtype=np.int8)
+
+        seconds_per_column = (end - start) / width
+        spp, pairs = self.levels[0]
+        for level_spp, level_pairs in self.levels[1:]:
+            if level_spp / self.sample_rate > seconds_per_column:
+                break
+            spp, pairs = level_spp, level_pairs
+
+        first = int(start * self.sample_rate / spp)
+        last = min(len(pairs), math.ceil(end * self.sample_rate / spp))
+        chunk = pairs[first:last]
+        if len(chunk) <= width:
+            # A copy, so callers holding the result do not keep the file mapped
+            return chunk.copy()
+        starts = np.linspace(0, len(chunk), width, endpoint=False).astype(int)
+        return np.stack([np.minimum.reduceat(chunk[:, 0], starts), np.maximum.reduceat(chunk[:, 1], starts)], axis=1)
+
+
+def scrubber_html(peaks, audio_id="audio-player", width=300, height=48):
+    """Return a canvas that draws peaks.window() across width pixels and seeks audio_id on click."""
+    pairs = peaks.window(0, peaks.duration, width).tolist()
+    return SCRUBBER_HTML % {
+        "width": width,
+        "height": height,
+        "peaks": json.dumps(pairs),
+        "audio_id": audio_id,
+        "duration": peaks.duration,
+    }
+
+
+class PeaksStore:
+    """Peaks files of the library, one per track, validated against the track's mtime and size."""
+
+    def __init__(self, cache_dir=PEAKS_DIR):
+        """Use cache_dir for the peaks files (created on first write)."""
+        self.cache_dir = cache_dir
+        self.failures_path = os.path.join(cache_dir, "failures.json")
+        self.lock = threading.Lock()
+        self.mapped = OrderedDict()  # media file -> Peaks, least recently used first
+        self.failed = self._load_failures()  # media file -> [mtime_ns, size] that could not be decoded
+        self.worker = None
+        self.queued = []  # paths waiting for the background worker
+
+    def _load_failures(self):
+        try:
+            with open(self.failures_path, "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable peaks failures {self.failures_path}: {e}")
+            return {}
+
+    def _save_failures(self):
+        with self.lock:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = f"{self.failures_path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.failed, f)
+            os.replace(tmp_path, self.failures_path)
+
+    def known_failure(self, media_file):
+        """True when the track failed to decode and has not changed since."""
+        key = os.path.abspath(media_file)
+        with self.lock:
+            failure = self.failed.get(key)
+        if failure is None:
+            return False
+        try:
+            stat_result = os.stat(key)
+        except OSError:
+            return False
+        return failure == [stat_result.st_mtime_ns, stat_result.st_size]
+
+    def path_for(self, media_file):
+        """Return the peaks file path of a track."""
+        digest = hashlib.sha1(os.path.abspath(media_file).encode("utf-8")).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.peaks")
+
+    def get(self, media_file):
+        """Return the Peaks of a track, or None when it has none or changed since; never decodes."""
+        key = os.path.abspath(media_file)
+        try:
+            stat_result = os.stat(key)
+        except OSError:
+            return None
+        with self.lock:
+            peaks = self.mapped.get(key)
+            if peaks is not None:
+                self.mapped.move_to_end(key)
+        if peaks is None or peaks.mtime_ns != stat_result.st_mtime_ns or peaks.size != stat_result.st_size:
+            try:
+                peaks = Peaks(self.path_for(key))
+            except FileNotFoundError:
+                return None
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable peaks for {key}: {e}")
+                return None
+            if peaks.mtime_ns != stat_result.st_mtime_ns or peaks.size != stat_result.st_size:
+                return None
+            with self.lock:
+                # Replaced and evicted maps are released with their last reference
+                self.mapped[key] = peaks
+                self.mapped.move_to_end(key)
+                while len(self.mapped) > MAPPED_PEAKS:
+                    self.mapped.popitem(last=False)
+        return peaks
+
+    def generate(self, paths, workers=None, force=False):
+        """Build peaks for every path without a current file; returns (built, failed) counts.
+
+        Tracks that fail to decode are remembered and skipped until they
+        change, unless force is set. Missing dependencies and a broken
+        worker pool end the pass without remembering anything.
+        """
+        from loudness import is_decode_error
+
+        todo = [
+            os.path.abspath(path) for path in paths
+            if force or (self.get(path) is None and not self.known_failure(path))
+        ]
+        built = failed = 0
+        if todo:
+            # Spawned, not forked: callers such as the Streamlit server are multithreaded.
+            # Spawned workers import the caller's entry script as __mp_main__, so that
+            # script must be import-safe (main.py starts Flet under a __main__ guard)
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+                futures = {pool.submit(build_peaks, path, self.path_for(path)): path for path in todo}
+                for future in as_completed(futures):
+                    path = futures[future]
+                    try:
+                        future.result()
+                        built += 1
+                        with self.lock:
+                            self.failed.pop(path, None)
+                    except (ImportError, BrokenProcessPool):
+                        pool.shutdown(wait=False, cancel_futures=True)
+                        raise
+                    except Exception as e:
+                        failed += 1
+                        logger.warning(f"Could not build peaks for {path}: {e}")
+                        if not is_decode_error(e):
+                            continue
+                        try:
+                            stat_result = os.stat(path)
+                        except OSError:
+                            continue
+                        with self.lock:
+                            self.failed[path] = [stat_result.st_mtime_ns, stat_result.st_size]
+            self._save_failures()
+        return built, failed
+
+    def generate_in_background(self, paths, workers=1):
+        """Run generate() on a daemon thread; paths passed while it runs are queued for it.
+
+        Returns None without starting a thread when the analysis dependencies
+        are missing.
+        """
+        from loudness import analysis_available
+
+        paths = list(paths)
+        if not paths or not analysis_available():
+            return None
+        with self.lock:
+            self.queued.extend(paths)
+            if self.worker is not None:
+                return self.worker
+
+            def run():
+                while True:
+                    with self.lock:
+                        batch, self.queued = self.queued, []
+                        if not batch:
+                            self.worker = None
+                            return
+                    try:
+                        self.generate(batch, workers)
+                    except Exception as e:
+                        logger.warning(f"Peaks generation failed: {e}")
+
+            self.worker = threading.Thread(target=run, name="waveform-peaks", daemon=True)
+            self.worker.start()
+            return self.worker
+
+
+def main():
+    from audio_analysis import DEFAULT_ROOTS, find_audio_files
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("roots", nargs="*", default=DEFAULT_ROOTS, help="directories holding tracks or song folders")
+    parser.add_argument("--workers", type=int, help="worker processes (default: one per CPU)")
+    parser.add_argument("--force", action="store_true", help="rebuild peaks that are already current")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+    built, failed = PeaksStore().generate(find_audio_files(args.roots), args.workers, args.force)
+    print(f"Built peaks for {built} tracks, {failed} failed; files in {PEAKS_DIR}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()